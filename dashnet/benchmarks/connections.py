@@ -0,0 +1,60 @@
+"""
+compares the procfs connection collector with psutil.net_connections on a synthetic procfs
+
+    python dashnet/benchmarks/connections.py [--sockets 100000] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import psutil  # noqa: E402
+
+from operating_system.linux import ConnectionLoader  # noqa: E402
+from operating_system.linux import InodeLoader  # noqa: E402
+from operating_system.procnet import ProcNetCollector  # noqa: E402
+from operating_system.procnet import PsutilCollector  # noqa: E402
+from procfs_fixture import SyntheticProcfs  # noqa: E402
+
+
+def best_of(repeat: int, collect) -> (float, dict):
+    best = None
+    collected = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        collected = collect()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, collected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sockets', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with SyntheticProcfs(args.sockets) as procfs:
+        excluded = ConnectionLoader.CLOSING_CONNECTION_STATES
+        procfs_collector = ProcNetCollector(excluded, InodeLoader(procfs.root), proc_path=procfs.root)
+        # the first collection builds the inode index, later ones only maintain it
+        procfs_first_time, _ = best_of(1, procfs_collector.collect)
+        procfs_time, procfs_conns = best_of(args.repeat, procfs_collector.collect)
+        procfs_collector.close()
+
+        psutil.PROCFS_PATH = procfs.root
+        psutil_time, psutil_conns = best_of(args.repeat, PsutilCollector(excluded).collect)
+
+    same = sorted(procfs_conns['tcp']) == sorted(tuple(c) for c in psutil_conns['tcp'])
+    print(f'sockets:   {args.sockets}')
+    print(f'collected: {len(procfs_conns["tcp"])} (same records as psutil: {same})')
+    print(f'psutil:    {psutil_time * 1000:9.1f} ms')
+    print(f'procfs:    {procfs_first_time * 1000:9.1f} ms  first load ({psutil_time / procfs_first_time:.1f}x)')
+    print(f'procfs:    {procfs_time * 1000:9.1f} ms  steady state ({psutil_time / procfs_time:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
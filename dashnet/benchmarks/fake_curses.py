@@ -0,0 +1,55 @@
+
+import curses
+
+
+class FakeScreen:
+    """
+    stands in for a curses window so that the layouts draw without a terminal,
+    it only counts what would have been written
+    """
+    def __init__(self, lines: int, cols: int, counters: dict = None):
+        self._lines = lines
+        self._cols = cols
+        self._counters = counters if counters is not None else {'writes': 0, 'chars': 0}
+
+    @property
+    def writes(self) -> int:
+        return self._counters['writes']
+
+    @property
+    def chars(self) -> int:
+        return self._counters['chars']
+
+    def subwin(self, lines: int, cols: int, *_) -> 'FakeScreen':
+        return FakeScreen(lines, cols, self._counters)
+
+    def getmaxyx(self) -> (int, int):
+        return self._lines, self._cols
+
+    def addstr(self, _y, _x, text, _attr=0) -> None:
+        self._counters['writes'] += 1
+        self._counters['chars'] += len(text)
+
+    def border(self, *_) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def noutrefresh(self) -> None:
+        pass
+
+    def refresh(self) -> None:
+        pass
+
+
+def install(lines: int, cols: int) -> FakeScreen:
+    """
+    sets up the parts of the curses module the layouts and skins use as if initscr() had run
+    """
+    curses.LINES = lines
+    curses.COLS = cols
+    curses.doupdate = lambda: None
+    curses.has_colors = lambda: False
+    curses.use_default_colors = lambda: None
+    return FakeScreen(lines, cols)
@@ -0,0 +1,120 @@
+
+import os
+import random
+import shutil
+import socket
+import struct
+import tempfile
+
+TCP_HEADER = (
+    '  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n'
+)
+TCP_STATES = ['01'] * 8 + ['06', '0A']
+DEV_HEADER = (
+    'Inter-|   Receive                                                |  Transmit\n'
+    ' face |bytes    packets errs drop fifo frame compressed multicast|'
+    'bytes    packets errs drop fifo colls carrier compressed\n'
+)
+ROUTE_HEADER = 'Iface\tDestination\tGateway \tFlags\tRefCnt\tUse\tMetric\tMask\t\tMTU\tWindow\tIRTT\n'
+# one socket in CHURN_PERIOD gets another remote port on each churn
+CHURN_PERIOD = 100
+
+
+class SyntheticProcfs:
+    """
+    a directory shaped like the parts of /proc read by the collectors,
+    with sockets spread over processes that hold them through fd links.
+    the connections are generated from the seed, so that rewriting them at generation 0 restores the original ones
+    """
+    def __init__(self, sockets: int, sockets_per_process: int = 100, seed: int = 0):
+        self._sockets = sockets
+        self._sockets_per_process = sockets_per_process
+        self._seed = seed
+        self._random = random.Random(seed)
+        self._root = None
+        self._generation = 0
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    def __enter__(self) -> 'SyntheticProcfs':
+        self._root = tempfile.mkdtemp(prefix='dashnet-procfs-')
+        self.create()
+        return self
+
+    def __exit__(self, *_):
+        shutil.rmtree(self._root, ignore_errors=True)
+
+    def create(self) -> None:
+        os.makedirs(f'{self._root}/net')
+        self.write_connections()
+        for name in ('tcp6', 'udp', 'udp6'):
+            with open(f'{self._root}/net/{name}', 'w') as f:
+                f.write(TCP_HEADER)
+        self._write_routes()
+        self._write_devices()
+        first_inode = 100000
+        for i in range(self._sockets):
+            pid = 1000 + i // self._sockets_per_process
+            fd_dir = f'{self._root}/{pid}/fd'
+            if i % self._sockets_per_process == 0:
+                os.makedirs(fd_dir)
+                self._write_process(pid)
+            os.symlink(f'socket:[{first_inode + i}]', f'{fd_dir}/{3 + i % self._sockets_per_process}')
+
+    def churn(self) -> None:
+        """
+        replaces one connection in CHURN_PERIOD by one to another remote port of the same peer
+        """
+        self.write_connections(self._generation + 1)
+
+    def write_connections(self, generation: int = 0) -> None:
+        self._generation = generation
+        self._random = random.Random(self._seed)
+        tcp_lines = [TCP_HEADER]
+        first_inode = 100000
+        for i in range(self._sockets):
+            tcp_lines.append(self._tcp_line(i, first_inode + i))
+        with open(f'{self._root}/net/tcp', 'w') as f:
+            f.writelines(tcp_lines)
+
+    def _tcp_line(self, i: int, inode: int) -> str:
+        local = self._hex_ipv4('10.0.0.1'), 443 if i % 2 else 1024 + i % 60000
+        remote_port = self._random.randrange(60000)
+        if i % CHURN_PERIOD == 0:
+            remote_port = (remote_port + self._generation) % 60000
+        remote = self._hex_ipv4(f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'), 1024 + remote_port
+        state = self._random.choice(TCP_STATES)
+        return (
+            f'{i:6d}: {local[0]}:{local[1]:04X} {remote[0]}:{remote[1]:04X} {state} '
+            f'00000000:00000000 00:00000000 00000000  1000        0 {inode} 1 0000000000000000 20 4 30 10 -1\n'
+        )
+
+    def _write_process(self, pid: int) -> None:
+        comm = f'worker{pid % 7}'
+        with open(f'{self._root}/{pid}/stat', 'w') as f:
+            f.write(f'{pid} ({comm}) S 1 {pid} {pid} 0 -1 4194560 0 0 0 0 0 0 0 0 20 0 1 0 {pid * 10} 0 0\n')
+        with open(f'{self._root}/{pid}/comm', 'w') as f:
+            f.write(f'{comm}\n')
+        with open(f'{self._root}/{pid}/cmdline', 'wb') as f:
+            f.write(f'/usr/bin/{comm}\0--id\0{pid}\0'.encode())
+
+    def _write_routes(self) -> None:
+        # 10.0.0.0/8 on eth1, everything else through the gateway on eth0
+        with open(f'{self._root}/net/route', 'w') as f:
+            f.write(ROUTE_HEADER)
+            f.write(f'eth0\t00000000\t{self._hex_ipv4("192.168.1.1")}\t0003\t0\t0\t100\t00000000\t0\t0\t0\n')
+            f.write(f'eth1\t{self._hex_ipv4("10.0.0.0")}\t00000000\t0001\t0\t0\t0\t{self._hex_ipv4("255.0.0.0")}\t0\t0\t0\n')
+
+    def _write_devices(self) -> None:
+        counters = random.Random(self._seed)
+        with open(f'{self._root}/net/dev', 'w') as f:
+            f.write(DEV_HEADER)
+            for iface in ('lo', 'eth0', 'eth1'):
+                f.write(f'{iface:>6}: {" ".join(str(counters.randrange(1 << 32)) for _ in range(16))}\n')
+
+    @staticmethod
+    def _hex_ipv4(ip: str) -> str:
+        # /proc/net/tcp prints addresses in host byte order
+        return f'{struct.unpack("=I", socket.inet_aton(ip))[0]:08X}'
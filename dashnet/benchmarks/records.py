@@ -0,0 +1,159 @@
+"""
+compares the memory and build time of the connection records with those of the former plain objects
+
+    python dashnet/benchmarks/records.py [--sockets 100000 1000000]
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from network.connection import ProcessIface  # noqa: E402
+from network.connection import Socket  # noqa: E402
+from operating_system.procnet import Address  # noqa: E402
+from operating_system.snapshot import MapDelta  # noqa: E402
+
+
+class PlainProcessIface:
+    """
+    ProcessIface as it was: a __dict__ per instance, one instance per connection
+    """
+    def __init__(self, process_name, iface_name=None):
+        self._process = process_name
+        self._iface = iface_name
+
+    @property
+    def process(self):
+        return self._process
+
+    @property
+    def iface(self):
+        return self._iface
+
+    @iface.setter
+    def iface(self, iface_name):
+        self._iface = iface_name
+
+    def __eq__(self, other):
+        return self.process == other.process and self.iface == other.iface
+
+    def __hash__(self):
+        return hash((self._process, self._iface))
+
+
+class PlainSocket:
+    """
+    Socket as it was: a __dict__ per instance, ip and port strings, hashed through its properties
+    """
+    def __init__(self, ip='<UNKNOWN>', port='<UNKNOWN>', protocol='<UNKNOWN>', hostname=None, service=None):
+        self._ip = ip
+        self._port = port
+        self._protocol = protocol
+        self._hostname = hostname
+        self._service = service
+
+    @property
+    def ip(self):
+        return self._ip
+
+    @property
+    def port(self):
+        return self._port
+
+    @property
+    def protocol(self):
+        return self._protocol
+
+    def __eq__(self, other):
+        return self.ip == other.ip and self.port == other.port and self.protocol == other.protocol
+
+    def __hash__(self):
+        return hash((self.ip, self.port, self.protocol))
+
+
+def collected(count: int, seed: int = 0) -> [tuple]:
+    """
+    (pid, laddr, raddr) records shaped like the collectors' output, ips shared within a load as they decode them
+    """
+    rand = random.Random(seed)
+    local_ips = [f'10.0.{i}.{j}' for i in range(4) for j in range(1, 5)]
+    remote_ips = ['.'.join(map(str, rand.choices(range(1, 255), k=4))) for _ in range(count // 4 + 1)]
+    return [
+        (
+            1000 + i // 100,
+            Address(rand.choice(local_ips), 1024 + i % 60000),
+            Address(rand.choice(remote_ips), rand.choice((443, 80, 22, 5432, 6379)))
+        )
+        for i in range(count)
+    ]
+
+
+def build_plain(records: [tuple]) -> (dict, dict, dict):
+    locals_, remotes, connections = {}, {}, {}
+    for pid, laddr, raddr in records:
+        pi = PlainProcessIface(f'proc{pid % 50}')
+        lsock = PlainSocket(laddr.ip, str(laddr.port), 'tcp')
+        locals_[lsock] = pi
+        rsock = PlainSocket(raddr.ip, str(raddr.port), 'tcp')
+        pi.iface = 'eth0'
+        remotes[rsock] = pi
+        connections[(lsock, rsock)] = pi
+    return locals_, remotes, connections
+
+
+def build_compact(records: [tuple]) -> (dict, dict, dict):
+    locals_, remotes, connections = {}, {}, {}
+    for pid, laddr, raddr in records:
+        pi = ProcessIface.of(sys.intern(f'proc{pid % 50}'), 'eth0')
+        lsock = Socket(laddr.ip, laddr.port, 'tcp')
+        locals_[lsock] = pi
+        rsock = Socket(raddr.ip, raddr.port, 'tcp')
+        remotes[rsock] = pi
+        connections[(lsock, rsock)] = pi
+    return locals_, remotes, connections
+
+
+def measure(build, records: [tuple]) -> (int, float, float):
+    """
+    bytes held by a snapshot, time to build it and time to diff it against a rebuilt one
+    """
+    gc.collect()
+    tracemalloc.start()
+    snapshot = build(records)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # timed apart, tracing slows allocations down
+    start = time.perf_counter()
+    again = build(records)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for old, new in zip(snapshot, again):
+        MapDelta.between(old, new)
+    diff_time = time.perf_counter() - start
+    return held, build_time, diff_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sockets', type=int, nargs='+', default=[100000, 1000000])
+    args = parser.parse_args()
+
+    print(f'{"sockets":>9} {"records":>8} {"bytes/conn":>10} {"held MB":>8} {"build ms":>9} {"diff ms":>8}')
+    for count in args.sockets:
+        records = collected(count)
+        for name, build in (('plain', build_plain), ('compact', build_compact)):
+            held, build_time, diff_time = measure(build, records)
+            print(
+                f'{count:>9} {name:>8} {held / count:>10.0f} {held / 2 ** 20:>8.1f} '
+                f'{build_time * 1000:>9.1f} {diff_time * 1000:>8.1f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
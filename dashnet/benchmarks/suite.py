@@ -0,0 +1,218 @@
+"""
+times each stage from /proc to the screen on synthetic procfs trees of several sizes:
+a first cycle ('cold') and one after 1% of the connections changed ('steady'),
+then runs both again under tracemalloc for the peak memory each stage allocates.
+the screen is a fake curses window, nothing is drawn to the terminal.
+load includes the process and connection loaders, timed on their own just before it.
+
+    python dashnet/benchmarks/suite.py [--sockets 1000 10000 100000 1000000] [--repeat 3]
+                                       [--json results.json] [--baseline earlier-results.json]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import fake_curses  # noqa: E402
+from display.components.render_opts import RenderOpts  # noqa: E402
+from display.components.skin import CyanSkin, RedSkin  # noqa: E402
+from display.frames import FrameBuilder  # noqa: E402
+from display.pipeline import Pipeline  # noqa: E402
+from display.ui import Ui  # noqa: E402
+from network.resolver import NameResolver  # noqa: E402
+from operating_system.linux import ConnectionLoader  # noqa: E402
+from operating_system.linux import IfaceResolver  # noqa: E402
+from operating_system.linux import LocalRemoteSockets  # noqa: E402
+from operating_system.linux import ProcessLoader  # noqa: E402
+from operating_system.history import SnapshotHistory  # noqa: E402
+from operating_system.netdev import DeviceStats  # noqa: E402
+from procfs_fixture import SyntheticProcfs  # noqa: E402
+from recording.recorder import SnapshotRecorder  # noqa: E402
+
+PHASES = ('cold', 'steady')
+SCREEN_SIZE = (50, 200)
+
+
+class Cycle:
+    """
+    the objects of one dashnet run against a procfs tree, driven one stage at a time
+    """
+    def __init__(self, proc_path: str, screen: fake_curses.FakeScreen):
+        self._screen = screen
+        self._process_loader = ProcessLoader(proc_path=proc_path)
+        self._connection_loader = ConnectionLoader(proc_path=proc_path)
+        self._iface_resolver = IfaceResolver(proc_path)
+        self._device_stats = DeviceStats(proc_path)
+        # the synthetic addresses are never looked up
+        self._name_resolver = NameResolver(max_in_flight=0)
+        self._history = SnapshotHistory()
+        # written next to the procfs tree: the cold phase writes a keyframe, the steady one a delta
+        self._recorder = SnapshotRecorder(os.path.join(proc_path, 'recording'))
+        self._builder = FrameBuilder(self._history)
+        # the uis only draw the frames handed to them, their pipelines are never started
+        pipeline = Pipeline(None, self._name_resolver, self._builder)
+        self._list_opts = self._opts(show_list=True)
+        self._list_ui = Ui(screen, self._list_opts, pipeline)
+        self._utilization_opts = self._opts(show_list=False)
+        self._utilization_ui = Ui(screen, self._utilization_opts, pipeline)
+        self._snapshot = None
+        self._list_frame = None
+        self._utilization_frame = None
+
+    def _opts(self, show_list: bool) -> RenderOpts:
+        opts = RenderOpts(self._screen, [CyanSkin(), RedSkin()])
+        if show_list:
+            opts.views.toggle()
+        return opts
+
+    @property
+    def stages(self) -> [(str, 'callable')]:
+        return [
+            ('processes', self._process_loader.load),
+            ('connections', self._connection_loader.load),
+            ('load', self._load),
+            ('history', lambda: self._history.add(self._snapshot)),
+            ('record', lambda: self._recorder.add(self._snapshot)),
+            ('enrich', lambda: self._builder.update(self._snapshot)),
+            ('format_list', self._format_list),
+            ('render_list', lambda: self._list_ui.show_view(self._list_frame)),
+            ('format_utilization', self._format_utilization),
+            ('render_utilization', lambda: self._utilization_ui.show_view(self._utilization_frame)),
+        ]
+
+    def close(self) -> None:
+        self._recorder.close()
+
+    def _load(self):
+        self._snapshot = LocalRemoteSockets(
+            self._iface_resolver, self._name_resolver, self._process_loader, self._connection_loader,
+            self._device_stats
+        ).load()
+
+    def _format_list(self):
+        self._list_frame = self._builder.build(self._list_opts.state())
+
+    def _format_utilization(self):
+        self._utilization_frame = self._builder.build(self._utilization_opts.state())
+
+
+def run_phases(procfs: SyntheticProcfs, screen: fake_curses.FakeScreen, measure) -> {(str, str): dict}:
+    """
+    runs the stages of a fresh cycle once per phase, churning the connections in between,
+    measure(stage) returns the measurements of one stage
+    """
+    procfs.write_connections()
+    cycle = Cycle(procfs.root, screen)
+    results = {}
+    for phase in PHASES:
+        if phase != PHASES[0]:
+            procfs.churn()
+        for stage, run in cycle.stages:
+            results[(phase, stage)] = measure(run)
+    cycle.close()
+    return results
+
+
+def timed(screen: fake_curses.FakeScreen):
+    def measure(run) -> dict:
+        writes = screen.writes
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        return {'seconds': seconds, 'writes': screen.writes - writes}
+    return measure
+
+
+def traced(run) -> dict:
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    # what the stage allocated above what was already live, released memory does not count against it
+    return {'peak_bytes': max(0, peak - current)}
+
+
+def benchmark(sockets: int, repeat: int, screen: fake_curses.FakeScreen) -> [dict]:
+    with SyntheticProcfs(sockets) as procfs:
+        best = {}
+        for _ in range(repeat):
+            for key, measured in run_phases(procfs, screen, timed(screen)).items():
+                if key not in best or measured['seconds'] < best[key]['seconds']:
+                    best[key] = measured
+            gc.collect()
+        tracemalloc.start()
+        try:
+            memory = run_phases(procfs, screen, traced)
+        finally:
+            tracemalloc.stop()
+    return [
+        {'sockets': sockets, 'phase': phase, 'stage': stage, **best[(phase, stage)], **memory[(phase, stage)]}
+        for phase, stage in best
+    ]
+
+
+def commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_baseline(path: str) -> {(int, str, str): float}:
+    if not path:
+        return {}
+    with open(path) as f:
+        return {(r['sockets'], r['phase'], r['stage']): r['seconds'] for r in json.load(f)['results']}
+
+
+def print_results(results: [dict], baseline: {(int, str, str): float}) -> None:
+    print(f'{"sockets":>8} {"phase":<7} {"stage":<19} {"ms":>10} {"peak KiB":>10} {"writes":>7}'
+          + (f' {"vs base":>8}' if baseline else ''))
+    for r in results:
+        line = (
+            f'{r["sockets"]:>8} {r["phase"]:<7} {r["stage"]:<19} {r["seconds"] * 1000:>10.1f}'
+            f' {r["peak_bytes"] / 1024:>10.0f} {r["writes"]:>7}'
+        )
+        base = baseline.get((r['sockets'], r['phase'], r['stage']))
+        if base:
+            line += f' {r["seconds"] / base:>7.2f}x'
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sockets', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per size, the fastest is kept')
+    parser.add_argument('--json', metavar='FILE', help='write the results to FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='compare the times with the results in FILE')
+    args = parser.parse_args()
+
+    screen = fake_curses.install(*SCREEN_SIZE)
+    results = []
+    for sockets in args.sockets:
+        results += benchmark(sockets, args.repeat, screen)
+    print_results(results, load_baseline(args.baseline))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'commit': commit(),
+                'python': platform.python_version(),
+                'screen': SCREEN_SIZE,
+                'results': results,
+            }, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
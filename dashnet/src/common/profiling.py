@@ -0,0 +1,169 @@
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+
+class ProfileCapture:
+    """
+    profiles the next refresh cycles on every thread of the refresh loop, while the ui keeps running.
+    each thread calls checkpoint() once per iteration of its loop: while a capture runs it profiles itself
+    with cProfile, and hands the profile back at its first checkpoint after the last cycle.
+    meanwhile a sampler thread collects the stacks of all threads and tracemalloc traces the allocations.
+    the capture is written as <name>.pstats, <name>.collapsed (one 'frame;frame;... count' line per stack,
+    as read by flamegraph tools) and <name>.alloc.txt (the lines allocating the most memory)
+    """
+    CYCLES = 10
+    SAMPLE_INTERVAL = 0.005
+    # how long threads that have not reached a checkpoint since the last cycle are waited for
+    HAND_BACK_TIMEOUT = 3
+    TOP_ALLOCATIONS = 30
+    STATUS_SECONDS = 10
+
+    def __init__(self, directory: str = '.', cycles: int = CYCLES):
+        self._directory = directory
+        self._cycles = cycles
+        self._lock = threading.Lock()
+        self._capture = 0
+        self._cycles_left = 0
+        self._running = {}
+        self._handed_back = []
+        self._samples = Counter()
+        self._started_tracemalloc = False
+        self._writing = False
+        self._status = ''
+        self._status_until = 0
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @directory.setter
+    def directory(self, directory: str):
+        self._directory = directory
+
+    @property
+    def cycles(self) -> int:
+        return self._cycles
+
+    @cycles.setter
+    def cycles(self, cycles: int):
+        self._cycles = cycles
+
+    @property
+    def active(self) -> bool:
+        return self._cycles_left > 0 or self._writing
+
+    @property
+    def status(self) -> str:
+        """
+        what a capture is doing, or where the last one was written to for a few seconds after
+        """
+        if self._cycles_left:
+            return f'profiling {self._cycles - self._cycles_left + 1}/{self._cycles}'
+        if self._writing:
+            return 'writing profile'
+        return self._status if time.monotonic() < self._status_until else ''
+
+    def start(self) -> bool:
+        """
+        starts a capture of the next cycles, unless one is already running
+        """
+        with self._lock:
+            if self.active:
+                return False
+            self._capture += 1
+            self._cycles_left = self._cycles
+            self._running = {}
+            self._handed_back = []
+            self._samples = Counter()
+            self._writing = True
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+        threading.Thread(daemon=True, target=self._sample, args=(self._capture,), name='profiler').start()
+        return True
+
+    def checkpoint(self, cycle_done: bool = False) -> None:
+        """
+        called by each thread of the refresh loop once per iteration, cycle_done by the one pacing the refreshes
+        """
+        if not self._cycles_left and not self._running:
+            return
+        name = threading.current_thread().name
+        with self._lock:
+            running = self._running.get(name)
+            if cycle_done and self._cycles_left and running:
+                # a whole cycle ran under the profiler
+                self._cycles_left -= 1
+            if running is None:
+                if self._cycles_left:
+                    profile = cProfile.Profile()
+                    try:
+                        profile.enable()
+                    except ValueError:
+                        # since python 3.12 a single profiler is active per process, and it sees every thread
+                        return
+                    self._running[name] = (self._capture, profile)
+            elif not self._cycles_left:
+                capture, profile = self._running.pop(name)
+                profile.disable()
+                if capture == self._capture and self._writing:
+                    self._handed_back.append(profile)
+
+    def _sample(self, capture: int) -> None:
+        own = threading.get_ident()
+        while self._cycles_left and capture == self._capture:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self._samples[self._stack(names.get(ident, str(ident)), frame)] += 1
+            time.sleep(self.SAMPLE_INTERVAL)
+        deadline = time.monotonic() + self.HAND_BACK_TIMEOUT
+        while self._running and time.monotonic() < deadline:
+            time.sleep(self.SAMPLE_INTERVAL)
+        self._write()
+
+    @staticmethod
+    def _stack(thread_name: str, frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        stack.append(thread_name)
+        return ';'.join(reversed(stack))
+
+    def _write(self) -> None:
+        # leaving out the capture's own sampled stacks
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)
+        ])
+        allocations = snapshot.statistics('lineno')[:self.TOP_ALLOCATIONS]
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        with self._lock:
+            profiles = self._handed_back
+            self._handed_back = []
+        path = os.path.join(self._directory, time.strftime('dashnet-%Y%m%d-%H%M%S'))
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            if profiles:
+                pstats.Stats(*profiles).dump_stats(f'{path}.pstats')
+            with open(f'{path}.collapsed', 'w') as f:
+                f.writelines(f'{stack} {count}\n' for stack, count in self._samples.items())
+            with open(f'{path}.alloc.txt', 'w') as f:
+                f.writelines(f'{statistic}\n' for statistic in allocations)
+            self._status = f'profile written to {path}.*'
+        except OSError as e:
+            self._status = f'profile not written: {e.strerror}'
+        self._status_until = time.monotonic() + self.STATUS_SECONDS
+        self._writing = False
+
+
+PROFILER = ProfileCapture()
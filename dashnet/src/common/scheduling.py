@@ -0,0 +1,118 @@
+import os
+import time
+
+from common.timing import TIMINGS
+
+
+class RefreshScheduler:
+    """
+    the interval from the start of a refresh to the start of the next one. dashnet's own cpu time, of all its
+    threads, is measured from one refresh to the next: the interval never gets so short that it would take more
+    than its budget's share of a core. within that, the interval shrinks while many connections come and go
+    between refreshes, stretches while few do and drifts back to INTERVAL otherwise.
+    the change between two refreshes is told from the hashes of their connection keys
+    """
+    INTERVAL = 1.0
+    MIN_INTERVAL = 0.5
+    MAX_INTERVAL = 10.0
+    # share of one core
+    BUDGET = 0.2
+    # connections opened or closed since the previous refresh, as a share of those of both refreshes,
+    # above which the host is busy and below which it is stable
+    BUSY_CHURN = 0.05
+    STABLE_CHURN = 0.005
+    SHRINK = 0.7
+    STRETCH = 1.25
+    # weight of the latest refresh in the moving averages
+    SMOOTHING = 0.3
+    STATM_PATH = '/proc/self/statm'
+
+    def __init__(
+            self, budget: float = BUDGET, min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL,
+            interval: float = INTERVAL
+    ):
+        self._budget = budget
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._default_interval = min(max(interval, min_interval), max_interval)
+        self._interval = self._default_interval
+        self._measured_at = None
+        self._cost = None
+        self._usage = None
+        self._rss = 0
+        self._keys = None
+        self._churn = None
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    @property
+    def budget(self) -> float:
+        return self._budget
+
+    @property
+    def usage(self) -> float:
+        """
+        the share of a core used since the latest refreshes, a moving average
+        """
+        return self._usage or 0.0
+
+    @property
+    def rss(self) -> int:
+        """
+        the resident memory in bytes at the latest refresh
+        """
+        return self._rss
+
+    @property
+    def churn(self) -> float:
+        """
+        the connections opened or closed between the latest two refreshes, as a share of those of both,
+        None after the first
+        """
+        return self._churn
+
+    def refreshed(self, connections: dict) -> float:
+        """
+        takes the measures of the refresh just done and returns the interval to its next one
+        """
+        cpu, now = time.process_time(), time.monotonic()
+        if self._measured_at is not None:
+            cpu_seconds = cpu - self._measured_at[0]
+            wall_seconds = now - self._measured_at[1]
+            self._cost = self._smooth(self._cost, cpu_seconds)
+            self._usage = self._smooth(self._usage, cpu_seconds / wall_seconds if wall_seconds > 0 else 0.0)
+        self._measured_at = (cpu, now)
+        self._rss = self._read_rss()
+        self._churn = self._measure_churn(connections)
+        if self._churn is not None:
+            if self._churn >= self.BUSY_CHURN:
+                self._interval *= self.SHRINK
+            elif self._churn <= self.STABLE_CHURN:
+                self._interval *= self.STRETCH
+            else:
+                self._interval = (self._interval * self._default_interval) ** 0.5
+        floor = self._cost / self._budget if self._cost else 0.0
+        self._interval = min(max(self._interval, self._min_interval, floor), self._max_interval)
+        TIMINGS.gauge('refresh interval ms', round(self._interval * 1000))
+        TIMINGS.gauge('cpu % of a core', round(self.usage * 100, 1))
+        TIMINGS.gauge('rss MiB', round(self._rss / (1 << 20), 1))
+        return self._interval
+
+    def _measure_churn(self, connections: dict) -> float:
+        keys = set(map(hash, connections))
+        previous, self._keys = self._keys, keys
+        if previous is None:
+            return None
+        return len(keys ^ previous) / max(len(keys) + len(previous), 1)
+
+    def _smooth(self, average: float, latest: float) -> float:
+        return latest if average is None else average + self.SMOOTHING * (latest - average)
+
+    def _read_rss(self) -> int:
+        try:
+            with open(self.STATM_PATH) as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            return 0
@@ -0,0 +1,164 @@
+
+import json
+import threading
+import time
+from collections import deque
+
+
+class _StageRun:
+    """
+    times one run of a stage, entered with 'with'
+    """
+    __slots__ = ('_timings', '_name', '_start')
+
+    def __init__(self, timings: 'Timings', name: str):
+        self._timings = timings
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self._timings.record(self._name, time.perf_counter() - self._start)
+
+
+class _Untimed:
+    """
+    stands in for _StageRun while timing is disabled
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        pass
+
+
+_UNTIMED = _Untimed()
+
+
+class StageStats:
+    """
+    durations of one stage in milliseconds, over its last Timings.WINDOW runs
+    """
+    def __init__(self, name: str, durations: [float], runs: int):
+        ordered = sorted(durations)
+        self._name = name
+        self._last = durations[-1] * 1000
+        self._p50 = ordered[len(ordered) // 2] * 1000
+        self._p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+        self._runs = runs
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def last(self) -> float:
+        return self._last
+
+    @property
+    def p50(self) -> float:
+        return self._p50
+
+    @property
+    def p99(self) -> float:
+        return self._p99
+
+    @property
+    def runs(self) -> int:
+        return self._runs
+
+    def as_dict(self) -> dict:
+        return {
+            'last_ms': round(self._last, 3),
+            'p50_ms': round(self._p50, 3),
+            'p99_ms': round(self._p99, 3),
+            'runs': self._runs,
+        }
+
+
+class Timings:
+    """
+    process wide durations of named stages and named counters, from any thread.
+    nothing is kept while disabled: stage() then hands out a shared no-op context manager
+    and count() returns at once, so the instrumentation can stay in the hot paths
+    """
+    WINDOW = 256
+
+    def __init__(self):
+        self._enabled = False
+        self._durations = {}
+        self._runs = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._log = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, enabled: bool):
+        self._enabled = enabled or self._log is not None
+
+    def stage(self, name: str):
+        return _StageRun(self, name) if self._enabled else _UNTIMED
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            try:
+                self._durations[name].append(seconds)
+            except KeyError:
+                self._durations[name] = deque([seconds], maxlen=self.WINDOW)
+            self._runs[name] = self._runs.get(name, 0) + 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        """
+        adds to a counter that only grows, such as the number of subprocesses spawned
+        """
+        if self._enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def gauge(self, name: str, value) -> None:
+        """
+        sets a counter to its latest value, such as the number of sockets
+        """
+        if self._enabled:
+            self._counters[name] = value
+
+    @property
+    def stages(self) -> [StageStats]:
+        with self._lock:
+            copies = [(name, list(durations), self._runs[name]) for name, durations in self._durations.items()]
+        return [StageStats(name, durations, runs) for name, durations, runs in copies]
+
+    @property
+    def counters(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def log_to(self, path: str) -> None:
+        """
+        appends write_log() records to the file at path, timing stays enabled from now on
+        """
+        self._log = open(path, 'a', buffering=1)
+        self._enabled = True
+
+    def write_log(self) -> None:
+        """
+        writes the current numbers as one json line, if a log file was given
+        """
+        if self._log is None:
+            return
+        self._log.write(json.dumps({
+            'ts': round(time.time(), 3),
+            'stages': {stats.name: stats.as_dict() for stats in self.stages},
+            'counters': self.counters,
+        }) + '\n')
+
+
+TIMINGS = Timings()
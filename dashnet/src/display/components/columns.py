@@ -0,0 +1,165 @@
+from collections import Counter
+
+
+class ColumnWidth:
+    """
+    width of a column maintained as rows come and go,
+    keeps the value length of every row and a histogram of those lengths
+    """
+    def __init__(self, min_len: int):
+        self._min_len = min_len
+        self._lengths = {}
+        self._histogram = {}
+        self._longest = min_len
+
+    @property
+    def longest(self) -> int:
+        return self._longest
+
+    def set_all(self, lengths: dict) -> None:
+        """
+        measures a whole column at once from key -> value length
+        """
+        self._lengths = lengths
+        self._histogram = Counter(lengths.values())
+        self._longest = max(max(self._histogram, default=0), self._min_len)
+
+    def set(self, key, value: str) -> None:
+        length = len(value) if value else 0
+        previous = self._lengths.get(key)
+        if previous == length:
+            return
+        if previous is not None:
+            self._drop(previous)
+        self._lengths[key] = length
+        self._histogram[length] = self._histogram.get(length, 0) + 1
+        if length > self._longest:
+            self._longest = length
+
+    def discard(self, key) -> None:
+        previous = self._lengths.pop(key, None)
+        if previous is not None:
+            self._drop(previous)
+
+    def _drop(self, length: int) -> None:
+        count = self._histogram[length] - 1
+        if count:
+            self._histogram[length] = count
+            return
+        del self._histogram[length]
+        if length == self._longest:
+            self._longest = max(max(self._histogram, default=0), self._min_len)
+
+
+class SocketColumns:
+    """
+    widths of the columns of a sockets dict (socket -> ProcessIface),
+    a column is only measured once it is displayed and from then on maintained from the snapshot deltas
+    """
+    def __init__(self, columns: {str: ('function', str)}, header: 'TableHeaderFormatter'):
+        self._columns = {name: (value_of, header.col_len(col_name)) for name, (value_of, col_name) in columns.items()}
+        self._widths = {}
+
+    def value_of(self, name: str):
+        """
+        returns the function giving the column value of a (socket, ProcessIface)
+        """
+        return self._columns[name][0]
+
+    def longest(self, name: str, sockets: dict) -> int:
+        width = self._widths.get(name)
+        if width is None:
+            value_of, min_len = self._columns[name]
+            width = ColumnWidth(min_len)
+            width.set_all({sock: len(value_of(sock, pi) or '') for sock, pi in sockets.items()})
+            self._widths[name] = width
+        return width.longest
+
+    def apply(self, sockets_delta: 'MapDelta') -> None:
+        for name, width in self._widths.items():
+            value_of = self._columns[name][0]
+            for sock in sockets_delta.removed:
+                width.discard(sock)
+            for sock, (_, pi) in sockets_delta.changed.items():
+                width.set(sock, value_of(sock, pi))
+            for sock, pi in sockets_delta.added.items():
+                width.set(sock, value_of(sock, pi))
+
+    def invalidate(self, name: str) -> None:
+        self._widths.pop(name, None)
+
+
+class RowTemplate:
+    """
+    fixed width row format, compiled once per set of column widths,
+    every column but the last is left aligned to its width and followed by pad spaces
+    """
+    _compiled = {}
+    MAX_COMPILED = 64
+
+    @classmethod
+    def compile(cls, widths: (int,), pad: int):
+        key = (tuple(widths), pad)
+        try:
+            return cls._compiled[key]
+        except KeyError:
+            pass
+        if len(cls._compiled) >= cls.MAX_COMPILED:
+            cls._compiled.clear()
+        separator = ' ' * pad
+        fields = [f'{{:<{width}}}' if width else '{}' for width in widths[:-1]]
+        row_format = separator.join(fields + ['{}']).format
+        cls._compiled[key] = row_format
+        return row_format
+
+
+class FormattedRows:
+    """
+    a header and rows formatted when read: items holds what each row shows, in display order,
+    and format_row turns one into its line. it reads as the list of the header and the lines,
+    a slice past the header shares the items, so drawing a screenful costs the same whatever the number of rows.
+    total counts the rows the items were selected from, all of them unless told otherwise
+    """
+    __slots__ = ('_header', '_rows', '_total')
+
+    def __init__(self, header: str, items: list, format_row, total: int = None):
+        self._header = header
+        self._rows = RowsView(items, range(len(items)), format_row)
+        self._total = len(items) if total is None else total
+
+    @property
+    def total(self) -> int:
+        return self._total
+
+    def __len__(self):
+        return len(self._rows) + 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if start < 1:
+                raise IndexError('only the rows after the header are sliced')
+            return self._rows[start - 1:stop - 1:step]
+        if index < 0:
+            index += len(self)
+        return self._header if index == 0 else self._rows[index - 1]
+
+
+class RowsView:
+    """
+    the lines of a range of items, each formatted as it is read
+    """
+    __slots__ = ('_items', '_indices', '_format_row')
+
+    def __init__(self, items: list, indices: range, format_row):
+        self._items = items
+        self._indices = indices
+        self._format_row = format_row
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RowsView(self._items, self._indices[index], self._format_row)
+        return self._format_row(self._items[self._indices[index]])
@@ -1,166 +1,280 @@
 
+import bisect
+import heapq
 from typing import Dict
 
+from common.timing import Timings
+from display.components.columns import ColumnWidth
+from display.components.columns import FormattedRows
+from display.components.columns import RowTemplate
+from display.components.columns import SocketColumns
+from display.components.render_opts import Ranking
 from network.connection import Socket
+from network.connection import pack_ip
+from operating_system.history import SnapshotHistory
 from operating_system.linux import AllConnections
 from operating_system.linux import LocalRemoteSockets
+from operating_system.linux import Rate
 from operating_system.linux import TrafficByAddress
 from operating_system.linux import TrafficByProcess
 
 
 class TrafficByLocalAddressFormatter:
-    def __init__(self, sockets: 'Dict[Socket]', resolve_dns=False, resolve_service=False):
-        self._traffic = TrafficByAddress(sockets)
+    def __init__(
+            self, sockets: 'Dict[Socket]', resolve_dns=False, resolve_service=False, traffic: TrafficByAddress = None,
+            columns: 'LocalAddressColumns' = None, rates: 'Dict[Socket, Rate]' = None,
+            rank: str = Ranking.THROUGHPUT, rows: int = None
+    ):
+        self._sockets = sockets
+        self._traffic = traffic if traffic else TrafficByAddress(sockets)
+        self._rates = rates if rates is not None else {}
+        self._rank = rank
+        self._rows = rows
         self._header = TrafficByLocalAddressHeader()
-        self._resolve_dns = resolve_dns
-        self._resolve_service = resolve_service
-        self._formatter = LocalAddressFormatter(sockets, self._header)
+        self._columns = columns if columns else LocalAddressColumns()
+        self._shown = (ip_column(resolve_dns), port_column(resolve_service), 'protocol')
 
     @property
-    def formatted_list(self) -> [str]:
+    def formatted_list(self) -> FormattedRows:
         pad = 3
-        formatted_list: [str] = [(self._create_header(pad))]
-        for sock, count in self._traffic.as_list:
-            ip = (
-                self._formatter.get('hostname').padded(sock.hostname)
-                if self._resolve_dns else
-                self._formatter.get('ip').padded(sock.ip)
-            )
-            port = (
-                self._formatter.get('service').padded(sock.service)
-                if self._resolve_service else
-                self._formatter.get('port').padded(sock.port)
-            )
-            protocol = self._formatter.get('protocol').padded(sock.protocol)
-            formatted_list.append(
-                f'{ip}{" " * pad}'
-                f'{port}{" " * pad}'
-                f'{protocol}{" " * pad}'
-                f'{count}'
-            )
-        return formatted_list
-
-    def _create_header(self, pad):
-        header_line = self._header.create_header([
-            self._formatter.get('hostname').longest if self._resolve_dns else self._formatter.get('ip').longest,
-            self._formatter.get('service').longest if self._resolve_service else self._formatter.get('port').longest,
-            self._formatter.get('protocol').longest,
-            0
-        ], pad)
-        return header_line
+        widths = [self._columns.longest(name, self._sockets) for name in self._shown] + RATE_WIDTHS
+        row = RowTemplate.compile(widths, pad)
+        ip_of, port_of, protocol_of = (self._columns.value_of(name) for name in self._shown)
+        rates = self._rates
+        counts = self._traffic.as_list
+        return FormattedRows(
+            self._header.create_header(widths, pad),
+            top_rows(counts, socket_rank_key(self._rank, rates, lambda sock: ip_of(sock, None)), self._rows),
+            lambda sock_count: row(
+                ip_of(sock_count[0], None), port_of(sock_count[0], None), protocol_of(sock_count[0], None),
+                sock_count[1], *rate_columns(rates.get(sock_count[0]))
+            ),
+            len(counts)
+        )
 
 
 class TrafficByRemoteAddressFormatter:
-    def __init__(self, remotes: 'Dict[Socket]', resolve_dns=False, resolve_service=False):
+    def __init__(
+            self, remotes: 'Dict[Socket]', resolve_dns=False, resolve_service=False, traffic: TrafficByAddress = None,
+            columns: 'RemoteAddressColumns' = None, rates: 'Dict[Socket, Rate]' = None, trends: 'Dict[int, str]' = None,
+            rank: str = Ranking.THROUGHPUT, rows: int = None
+    ):
         self._remotes = remotes
-        self._resolve_dns = resolve_dns
-        self._resolve_service = resolve_service
-        self._traffic = TrafficByAddress(remotes)
+        self._traffic = traffic if traffic else TrafficByAddress(remotes)
+        self._rates = rates if rates is not None else {}
+        self._trends = trends if trends is not None else {}
+        self._rank = rank
+        self._rows = rows
         self._header = TrafficByRemoteAddressHeader()
-        self._formatter = RemoteAddressFormatter(remotes, self._header)
+        self._columns = columns if columns else RemoteAddressColumns()
+        self._shown = ('iface', ip_column(resolve_dns), port_column(resolve_service), 'protocol')
 
     @property
-    def formatted_list(self) -> [str]:
+    def formatted_list(self) -> FormattedRows:
         pad = 3
-        formatted_list: [str] = [self._create_header(pad)]
-        for sock, count in self._traffic.as_list:
-            pi = self._remotes[sock]
-            ip = (
-                self._formatter.get('hostname').padded(sock.hostname)
-                if self._resolve_dns else
-                self._formatter.get('ip').padded(sock.ip)
-            )
-            port = (
-                self._formatter.get('service').padded(sock.service)
-                if self._resolve_service else
-                self._formatter.get('port').padded(sock.port)
-            )
-            protocol = self._formatter.get('protocol').padded(sock.protocol)
-            formatted_list.append(
-                f'{self._formatter.get("iface").padded(pi.iface)}{" " * pad}'
-                f'{ip}{" " * pad}'
-                f'{port}{" " * pad}'
-                f'{protocol}{" " * pad}'
-                f'{count}'
+        widths = [self._columns.longest(name, self._remotes) for name in self._shown] + TREND_RATE_WIDTHS
+        row = RowTemplate.compile(widths, pad)
+        iface_of, ip_of, port_of, protocol_of = (self._columns.value_of(name) for name in self._shown)
+        remotes = self._remotes
+        rates = self._rates
+        trends = self._trends
+
+        def format_row(sock_count) -> str:
+            sock, count = sock_count
+            pi = remotes[sock]
+            return row(
+                iface_of(sock, pi), ip_of(sock, pi), port_of(sock, pi), protocol_of(sock, pi), count,
+                trends.get(sock.packed_ip, ''), *rate_columns(rates.get(sock))
             )
-        return formatted_list
 
-    def _create_header(self, pad):
-        return self._header.create_header([
-            self._formatter.get('iface').longest,
-            self._formatter.get('hostname').longest if self._resolve_dns else self._formatter.get('ip').longest,
-            self._formatter.get('service').longest if self._resolve_service else self._formatter.get('port').longest,
-            self._formatter.get('protocol').longest,
-            0
-        ], pad)
+        counts = self._traffic.as_list
+        return FormattedRows(
+            self._header.create_header(widths, pad),
+            top_rows(counts, socket_rank_key(self._rank, rates, lambda sock: ip_of(sock, remotes[sock])), self._rows),
+            format_row,
+            len(counts)
+        )
 
 
 class AllConnectionsFormatter:
-    def __init__(self, sockets: 'LocalRemoteSockets', resolve_dns=False, resolve_service=False):
+    def __init__(
+            self, sockets: 'LocalRemoteSockets', resolve_dns=False, resolve_service=False,
+            by_process: TrafficByProcess = None, local_columns: 'LocalAddressColumns' = None,
+            remote_columns: 'RemoteAddressColumns' = None, order: 'ConnectionOrder' = None
+    ):
+        self._sockets = sockets
         self._connections = AllConnections(sockets)
+        self._header = AllConnectionsHeader()
+        self._pformatter = TrafficByProcessFormatter(sockets, self._header, by_process)
+        self._lcolumns = local_columns if local_columns else LocalAddressColumns()
+        self._rcolumns = remote_columns if remote_columns else RemoteAddressColumns()
         self._resolve_dns = resolve_dns
         self._resolve_service = resolve_service
-        self._header = AllConnectionsHeader()
-        self._pformatter = TrafficByProcessFormatter(sockets, self._header)
-        self._rformatter = RemoteAddressFormatter(sockets.remotes, TrafficByRemoteAddressHeader())
-        self._lformatter = LocalAddressFormatter(sockets.locals, TrafficByLocalAddressHeader())
+        self._order = order
 
     @property
-    def formatted_list(self):
+    def rows(self) -> FormattedRows:
+        """
+        the connections sorted on the values of their columns, in the order the lines formatted from them would sort,
+        each line formatted when it is drawn. the order is taken from the index kept across snapshots when given
+        """
         pad = 3
-        header_line = self._create_header(pad)
-        formatted_list: [str] = [header_line]
-        for lsock, rsock, pi in self._connections.as_list:
-            iface = pi.iface if pi.iface else ''
-            formatted_list.append(
-                f'{self._pformatter.get("process").padded(pi.process)}{" " * pad}'
-                f'{self._get_ip(lsock, self._lformatter)}{" " * pad}'
-                f'{self._get_port(lsock, self._lformatter)}{" " * pad}'
-                f'{self._get_ip(rsock, self._rformatter)}{" " * pad}'
-                f'{self._get_port(rsock, self._rformatter)}{" " * pad}'
-                f'{self._get_protocol(lsock, self._lformatter)}{" " * pad}'
-                f'{self._rformatter.get("iface").padded(iface)}'
-            )
-        return formatted_list
-
-    def _create_header(self, pad):
-        header_line = self._header.create_header([
-            self._pformatter.get('process').longest,
-            self._get_longest_ip(self._lformatter),
-            self._get_longest_service(self._lformatter),
-            self._get_longest_ip(self._rformatter),
-            self._get_longest_service(self._rformatter),
-            self._rformatter.get('protocol').longest,
+        locals_ = self._sockets.locals
+        remotes = self._sockets.remotes
+        ip_name = ip_column(self._resolve_dns)
+        port_name = port_column(self._resolve_service)
+        widths = [
+            self._pformatter.process_width,
+            self._lcolumns.longest(ip_name, locals_),
+            self._lcolumns.longest(port_name, locals_),
+            self._rcolumns.longest(ip_name, remotes),
+            self._rcolumns.longest(port_name, remotes),
+            self._rcolumns.longest('protocol', remotes),
             0
-        ], pad)
-        return header_line
-
-    def _get_longest_service(self, formatter):
-        return formatter.get('port').longest if not self._resolve_service else formatter.get('service').longest
-
-    def _get_longest_ip(self, formatter):
-        return formatter.get('ip').longest if not self._resolve_dns else formatter.get('hostname').longest
-
-    @classmethod
-    def _get_protocol(cls, sock, formatter):
-        pf = formatter.get('protocol')
-        return pf.padded(sock.protocol) if sock else pf.padded('')
-
-    def _get_ip(self, sock, formatter):
-        hf = formatter.get('hostname')
-        ipf = formatter.get('ip')
-        if self._resolve_dns:
-            return hf.padded('') if not sock else hf.padded(sock.hostname)
-        else:
-            return ipf.padded('') if not sock else ipf.padded(sock.ip)
-
-    def _get_port(self, sock, formatter):
-        sf = formatter.get('service')
-        pf = formatter.get('port')
-        if self._resolve_service:
-            return sf.padded('') if not sock else sf.padded(sock.service)
+        ]
+        row = RowTemplate.compile(widths, pad)
+        values_of = connection_values(self._lcolumns, self._rcolumns, self._resolve_dns, self._resolve_service)
+        if self._order:
+            connections = self._order.connections(self._sockets, self._resolve_dns, self._resolve_service)
         else:
-            return pf.padded('') if not sock else pf.padded(sock.port)
+            connections = sorted(self._connections.as_list, key=values_of)
+        return FormattedRows(
+            self._header.create_header(widths, pad),
+            connections,
+            lambda connection: row(*values_of(connection))
+        )
+
+
+def connection_values(
+        local_columns: 'LocalAddressColumns', remote_columns: 'RemoteAddressColumns', resolve_dns: bool,
+        resolve_service: bool
+):
+    """
+    the function giving the column values of a [local socket, remote socket, ProcessIface] connection
+    """
+    lip_of = local_columns.value_of(ip_column(resolve_dns))
+    lport_of = local_columns.value_of(port_column(resolve_service))
+    rip_of = remote_columns.value_of(ip_column(resolve_dns))
+    rport_of = remote_columns.value_of(port_column(resolve_service))
+
+    def values_of(connection) -> (str,):
+        lsock, rsock, pi = connection
+        return (
+            pi.process,
+            lip_of(lsock, pi) if lsock else '',
+            lport_of(lsock, pi) if lsock else '',
+            rip_of(rsock, pi) if rsock else '',
+            rport_of(rsock, pi) if rsock else '',
+            lsock.protocol if lsock else '',
+            pi.iface if pi.iface else ''
+        )
+
+    return values_of
+
+
+class ConnectionOrder:
+    """
+    the connections of the snapshots in the order of their lines, kept across snapshots: those added, removed or
+    moved to another process or interface are placed with bisect from the snapshot deltas, and while hostnames are
+    shown those of the ips answered since are placed again. the whole is only sorted for other columns or when
+    more than RESORT_SHARE of the connections move at once.
+    each connection is ranked on its values and a serial number, so that every rank is unique and found by bisect
+    """
+    RESORT_SHARE = 0.25
+
+    def __init__(self, local_columns: 'LocalAddressColumns', remote_columns: 'RemoteAddressColumns'):
+        self._lcolumns = local_columns
+        self._rcolumns = remote_columns
+        self._columns = None
+        self._values_of = None
+        self._names_generation = None
+        self._ranks = []
+        self._connections = []
+        self._rank_of = {}
+        self._serial = 0
+
+    def apply(self, connections_delta: 'MapDelta') -> None:
+        """
+        follows a snapshot delta, keyed as SnapshotStore.connection_key, once the order is in use.
+        connections are kept by their (local socket, remote socket) key, as in the snapshot
+        """
+        if self._columns is None:
+            return
+        if len(connections_delta.added) + len(connections_delta.removed) + len(connections_delta.changed) > (
+                self.RESORT_SHARE * len(self._ranks)
+        ):
+            self._columns = None
+            return
+        for lsock, rsock, _ in connections_delta.removed:
+            self._remove((lsock, rsock))
+        for (lsock, rsock, _), (_, pi) in connections_delta.changed.items():
+            self._remove((lsock, rsock))
+            self._insert((lsock, rsock), pi)
+        for (lsock, rsock, _), pi in connections_delta.added.items():
+            self._insert((lsock, rsock), pi)
+
+    def connections(self, open_sockets: 'LocalRemoteSockets', resolve_dns: bool, resolve_service: bool) -> list:
+        """
+        the connections of the snapshot the deltas led to, in order, as a list of their own
+        """
+        columns = (resolve_dns, resolve_service)
+        if columns != self._columns:
+            self._sort(open_sockets, columns)
+        elif resolve_dns and open_sockets.names_generation != self._names_generation:
+            self._rename(open_sockets)
+        self._names_generation = open_sockets.names_generation
+        return list(self._connections)
+
+    def _sort(self, open_sockets: 'LocalRemoteSockets', columns: (bool, bool)) -> None:
+        self._columns = columns
+        self._values_of = connection_values(self._lcolumns, self._rcolumns, *columns)
+        connections = [(lsock, rsock, pi) for (lsock, rsock), pi in open_sockets.connections.items()]
+        ranks = [self._rank(connection) for connection in connections]
+        self._rank_of = dict(zip(open_sockets.connections, ranks))
+        order = sorted(range(len(ranks)), key=ranks.__getitem__)
+        self._ranks = [ranks[i] for i in order]
+        self._connections = [connections[i] for i in order]
+
+    def _rename(self, open_sockets: 'LocalRemoteSockets') -> None:
+        """
+        places again the connections of the ips answered since the order was last read
+        """
+        answered = open_sockets.answered_since(self._names_generation)
+        if answered is None:
+            self._sort(open_sockets, self._columns)
+            return
+        if not answered:
+            return
+        answered = {pack_ip(ip) for ip in answered}
+        renamed = [
+            (key, pi) for key, pi in open_sockets.connections.items()
+            if (key[0] and key[0].packed_ip in answered) or (key[1] and key[1].packed_ip in answered)
+        ]
+        if len(renamed) > self.RESORT_SHARE * len(self._ranks):
+            self._sort(open_sockets, self._columns)
+            return
+        for key, pi in renamed:
+            self._remove(key)
+            self._insert(key, pi)
+
+    def _rank(self, connection) -> tuple:
+        self._serial += 1
+        return *self._values_of(connection), self._serial
+
+    def _insert(self, key: tuple, pi: 'ProcessIface') -> None:
+        connection = (key[0], key[1], pi)
+        rank = self._rank_of[key] = self._rank(connection)
+        at = bisect.bisect_right(self._ranks, rank)
+        self._ranks.insert(at, rank)
+        self._connections.insert(at, connection)
+
+    def _remove(self, key: tuple) -> None:
+        rank = self._rank_of.pop(key, None)
+        if rank is None:
+            return
+        at = bisect.bisect_left(self._ranks, rank)
+        del self._ranks[at]
+        del self._connections[at]
 
 
 class TableHeaderFormatter:
@@ -185,114 +299,257 @@ class AllConnectionsHeader(TableHeaderFormatter):
 
 class TrafficByLocalAddressHeader(TableHeaderFormatter):
     def __init__(self):
-        super().__init__(['LOCAL ADDRESS', 'PORT', 'PROTOCOL', 'CONNECTIONS'])
+        super().__init__(['LOCAL ADDRESS', 'PORT', 'PROTOCOL', 'CONNECTIONS', 'SENT/S', 'RECV/S'])
 
 
 class TrafficByRemoteAddressHeader(TableHeaderFormatter):
     def __init__(self):
-        super().__init__(['INTERFACE', 'REMOTE ADDRESS', 'PORT', 'PROTOCOL', 'CONNECTIONS'])
+        super().__init__(
+            ['INTERFACE', 'REMOTE ADDRESS', 'PORT', 'PROTOCOL', 'CONNECTIONS', 'TREND', 'SENT/S', 'RECV/S']
+        )
 
 
 class TrafficByProcessHeader(TableHeaderFormatter):
     def __init__(self):
-        super().__init__(['PROCESS', 'CONNECTIONS'])
+        super().__init__(['PROCESS', 'CONNECTIONS', 'TREND', 'SENT/S', 'RECV/S'])
+
+
+class TrafficByInterfaceHeader(TableHeaderFormatter):
+    def __init__(self):
+        super().__init__(['INTERFACE', 'RECV/S', 'SENT/S', 'PKTS IN/S', 'PKTS OUT/S', 'ERRS/S', 'DROPS/S'])
+
+
+class TrafficByInterfaceFormatter:
+    """
+    the rates of every interface, the busiest first, blank for an interface that just appeared.
+    the columns that do not fit in width are left out, the last ones first
+    """
+    PAD = 2
+    # the widths of the columns after INTERFACE
+    RATE_WIDTHS = [
+        len('1023.9K/s'), len('1023.9K/s'), len('PKTS OUT/S'), len('PKTS OUT/S'), len('DROPS/S'), len('DROPS/S')
+    ]
+
+    def __init__(
+            self, devices: 'Dict[str, DeviceCounters]', header: TableHeaderFormatter = None, width: int = None
+    ):
+        self._devices = devices
+        self._header = header if header else TrafficByInterfaceHeader()
+        self._width = width
+
+    @classmethod
+    def full_width(cls, iface_width: int = len('INTERFACE')) -> int:
+        """
+        the width of a row showing every column
+        """
+        return iface_width + sum(width + cls.PAD for width in cls.RATE_WIDTHS)
+
+    @property
+    def formatted_list(self) -> [str]:
+        pad = self.PAD
+        iface_width = max([len(iface) for iface in self._devices] + [self._header.col_len('INTERFACE')])
+        shown = len(self.RATE_WIDTHS)
+        if self._width is not None:
+            while shown and self._width < iface_width + sum(width + pad for width in self.RATE_WIDTHS[:shown]):
+                shown -= 1
+        widths = [iface_width] + self.RATE_WIDTHS[:shown]
+        widths[-1] = 0
+        row = RowTemplate.compile(widths, pad)
+        rows = []
+        for iface, rate in self._devices.items():
+            if rate is None:
+                rows.append((0, row(iface, *[''] * shown)))
+                continue
+            columns = (
+                human_rate(rate.rx_bytes), human_rate(rate.tx_bytes),
+                f'{rate.rx_packets:.0f}', f'{rate.tx_packets:.0f}',
+                f'{rate.rx_errors + rate.tx_errors:.0f}', f'{rate.rx_dropped + rate.tx_dropped:.0f}'
+            )
+            rows.append((rate.rx_bytes + rate.tx_bytes, row(iface, *columns[:shown])))
+        rows.sort(key=lambda total_row: (-total_row[0], total_row[1]))
+        return [self._header.create_header(widths, pad)] + [line for _, line in rows]
+
+
+class TimingsHeader(TableHeaderFormatter):
+    def __init__(self):
+        super().__init__(['STAGE', 'LAST MS', 'P50 MS', 'P99 MS', 'RUNS'])
+
+
+class TimingsFormatter:
+    """
+    the stage durations of Timings followed by its counters, each under the stage column
+    """
+    def __init__(self, timings: Timings, header: TableHeaderFormatter = None):
+        self._timings = timings
+        self._header = header if header else TimingsHeader()
+
+    @property
+    def formatted_list(self) -> [str]:
+        pad = 1
+        stages = sorted(self._timings.stages, key=lambda stats: stats.name)
+        counters = sorted(self._timings.counters.items())
+        name_width = max([len(stats.name) for stats in stages] + [len(name) for name, _ in counters] + [0])
+        widths = [max(name_width, self._header.col_len('STAGE')), 7, 7, 7, 0]
+        row = RowTemplate.compile(widths, pad)
+        formatted_list: [str] = [self._header.create_header(widths, pad)]
+        for stats in stages:
+            formatted_list.append(
+                row(stats.name, f'{stats.last:.1f}', f'{stats.p50:.1f}', f'{stats.p99:.1f}', stats.runs)
+            )
+        for name, value in counters:
+            formatted_list.append(row(name, value, '', '', ''))
+        return formatted_list
 
 
 class TrafficByProcessFormatter:
     """
     holds a dict of number of connections per process
     """
-    def __init__(self, open_sockets: 'LocalRemoteSockets', header: TableHeaderFormatter):
-        self._traffic = TrafficByProcess(open_sockets)
+    def __init__(
+            self, open_sockets: 'LocalRemoteSockets', header: TableHeaderFormatter, traffic: TrafficByProcess = None,
+            rates: 'Dict[str, Rate]' = None, trends: 'Dict[str, str]' = None, rank: str = Ranking.THROUGHPUT,
+            rows: int = None
+    ):
+        self._traffic = traffic if traffic else TrafficByProcess(open_sockets)
+        self._rates = rates if rates is not None else {}
+        self._trends = trends if trends is not None else {}
+        self._rank = rank
+        self._rows = rows
         self._header = header
-        self._formatters = {}
-        self.format()
+        self._process_width = None
 
-    def get(self, formatter_name: str) -> 'AttrFormatter':
-        return self._formatters[formatter_name]
-
-    def format(self):
-        if self._traffic.as_list and not self._formatters:
-            self._formatters = {
-                'process': AttrFormatter(
-                    [line[0] for line in self._traffic.as_list], self._header.col_len('PROCESS')
-                ).format(),
-            }
+    @property
+    def process_width(self) -> int:
+        if self._process_width is None:
+            # one entry per process, few enough to measure on every render
+            width = ColumnWidth(self._header.col_len('PROCESS'))
+            for process_name, _ in self._traffic.as_list:
+                width.set(process_name, process_name)
+            self._process_width = width.longest
+        return self._process_width
 
     @property
-    def formatted_list(self) -> [str]:
+    def formatted_list(self) -> FormattedRows:
         pad = 9
-        self.format()
-        if self._traffic.as_list:
-            header_line = TrafficByProcessHeader().create_header([self._formatters.get('process').longest, 0], pad)
-            str_list: [str] = [header_line]
-            for process_name, count in self._traffic.as_list:
-                str_list.append(
-                    f'{self._formatters.get("process").padded(process_name)}{" " * pad}'
-                    f'{count}'
-                )
-            return str_list
+        counts = self._traffic.as_list
+        if counts:
+            widths = [self.process_width] + TREND_RATE_WIDTHS
+            row = RowTemplate.compile(widths, pad)
+            rates = self._rates
+            trends = self._trends
+            return FormattedRows(
+                TrafficByProcessHeader().create_header(widths, pad),
+                top_rows(counts, process_rank_key(self._rank, rates), self._rows),
+                lambda name_count: row(
+                    name_count[0], name_count[1], trends.get(name_count[0], ''), *rate_columns(rates.get(name_count[0]))
+                ),
+                len(counts)
+            )
         return []
 
 
-class AttrFormatter:
-    def __init__(self, attr_values: [str], min_len):
-        self._attr_values = attr_values
-        self._min_len = min_len
-        self._longest = 0
+# the connections, sent and received columns ending the utilization lists
+RATE_WIDTHS = [len('CONNECTIONS'), len('1023.9K/s'), 0]
+# the same with the connections trend in between
+TREND_RATE_WIDTHS = [len('CONNECTIONS'), SnapshotHistory.SPARK_WIDTH, len('1023.9K/s'), 0]
+# ranks after any packed address or port
+ADDRESS_LAST = 1 << 130
 
-    @property
-    def longest(self):
-        return self._longest
 
-    def format(self):
-        self._reset()
-        longest_value = len(max(self._attr_values, key=len)) if self._attr_values else 0
-        self._longest = max(longest_value, self._min_len)
-        return self
+def rate_columns(rate: Rate) -> (str, str):
+    """
+    the bytes sent and received per second, blank without a rate
+    """
+    if rate is None:
+        return '', ''
+    return human_rate(rate.sent), human_rate(rate.received)
+
 
-    def padded(self, attr):
-        return self._padded(self._longest, attr)
+def human_rate(bytes_per_second: float) -> str:
+    for unit in ('', 'K', 'M', 'G'):
+        if bytes_per_second < 1024:
+            return f'{bytes_per_second:.0f}B/s' if not unit else f'{bytes_per_second:.1f}{unit}/s'
+        bytes_per_second /= 1024
+    return f'{bytes_per_second:.1f}T/s'
 
-    @classmethod
-    def _padded(cls, longest, s):
-        if s and len(s) < longest:
-            padding = ' ' * (longest - len(s))
-            return s + padding
-        return s
-
-    def _reset(self):
-        self._longest = 0
-
-
-class LocalAddressFormatter:
-    def __init__(self, sockets: 'Dict[Socket]', header: TableHeaderFormatter):
-        self._formatters = {
-            'ip': AttrFormatter([s.ip for s in sockets], header.col_len('LOCAL ADDRESS')).format(),
-            'hostname': AttrFormatter([s.hostname for s in sockets], header.col_len('LOCAL ADDRESS')).format(),
-            'port': AttrFormatter([s.port for s in sockets], header.col_len('PORT')).format(),
-            'service': AttrFormatter([s.service for s in sockets], header.col_len('PORT')).format(),
-            'protocol': AttrFormatter([s.protocol for s in sockets], header.col_len('PROTOCOL')).format(),
-        }
-
-    def get(self, formatter_name: str) -> AttrFormatter:
-        return self._formatters[formatter_name]
-
-
-class RemoteAddressFormatter:
-    def __init__(self, sockets: 'Dict[Socket]', header: TableHeaderFormatter):
-        self._formatters = {
-            'iface': AttrFormatter(
-                [pi.iface for pi in sockets.values() if pi.iface], header.col_len('INTERFACE')
-            ).format(),
-            'ip': AttrFormatter([s.ip for s in sockets], header.col_len('REMOTE ADDRESS')).format(),
-            'hostname': AttrFormatter(
-                [s.hostname for s in sockets], header.col_len('REMOTE ADDRESS')
-            ).format(),
-            'port': AttrFormatter([s.port for s in sockets], header.col_len('PORT')).format(),
-            'service': AttrFormatter([s.service for s in sockets], header.col_len('PORT')).format(),
-            'protocol': AttrFormatter([s.protocol for s in sockets], header.col_len('PROTOCOL')).format(),
-        }
-
-    def get(self, formatter_name: str) -> AttrFormatter:
-        return self._formatters[formatter_name]
+
+def top_rows(items: list, key, rows: int = None) -> list:
+    """
+    the first rows items once ranked on key, selected through a heap of that many, or all of them ranked
+    """
+    if rows is None:
+        return sorted(items, key=key)
+    return heapq.nsmallest(rows, items, key=key)
+
+
+def moved(rate: Rate) -> float:
+    return rate.sent + rate.received if rate else 0
+
+
+def address_key(sock: Socket) -> (int, int, str):
+    """
+    ranks sockets on their numeric address and port, ipv4 before ipv6 and both before what is not an address
+    """
+    packed = sock.packed_ip
+    port = sock.port
+    return (
+        packed if packed.__class__ is int else ADDRESS_LAST,
+        int(port) if port.isdigit() else ADDRESS_LAST,
+        sock.protocol
+    )
+
+
+def socket_rank_key(rank: str, rates: 'Dict[Socket, Rate]', name_of):
+    """
+    the key ranking [socket, connection count] rows, ties are broken by address.
+    the name is the shown one, the hostname while names are resolved
+    """
+    if rank == Ranking.THROUGHPUT:
+        return lambda sock_count: (-moved(rates.get(sock_count[0])), address_key(sock_count[0]))
+    if rank == Ranking.CONNECTIONS:
+        return lambda sock_count: (-sock_count[1], address_key(sock_count[0]))
+    if rank == Ranking.NAME:
+        return lambda sock_count: (name_of(sock_count[0]) or '', address_key(sock_count[0]))
+    return lambda sock_count: address_key(sock_count[0])
+
+
+def process_rank_key(rank: str, rates: 'Dict[str, Rate]'):
+    """
+    the key ranking [process, connection count] rows, ties are broken by name. processes have no address
+    """
+    if rank == Ranking.THROUGHPUT:
+        return lambda name_count: (-moved(rates.get(name_count[0])), name_count[0])
+    if rank == Ranking.CONNECTIONS:
+        return lambda name_count: (-name_count[1], name_count[0])
+    return lambda name_count: name_count[0]
+
+
+def ip_column(resolve_dns: bool) -> str:
+    return 'hostname' if resolve_dns else 'ip'
+
+
+def port_column(resolve_service: bool) -> str:
+    return 'service' if resolve_service else 'port'
+
+
+class LocalAddressColumns(SocketColumns):
+    def __init__(self):
+        super().__init__({
+            'ip': (lambda sock, pi: sock.ip, 'LOCAL ADDRESS'),
+            'hostname': (lambda sock, pi: sock.hostname, 'LOCAL ADDRESS'),
+            'port': (lambda sock, pi: sock.port, 'PORT'),
+            'service': (lambda sock, pi: sock.service, 'PORT'),
+            'protocol': (lambda sock, pi: sock.protocol, 'PROTOCOL'),
+        }, TrafficByLocalAddressHeader())
+
+
+class RemoteAddressColumns(SocketColumns):
+    def __init__(self):
+        super().__init__({
+            'iface': (lambda sock, pi: pi.iface if pi.iface else '', 'INTERFACE'),
+            'ip': (lambda sock, pi: sock.ip, 'REMOTE ADDRESS'),
+            'hostname': (lambda sock, pi: sock.hostname, 'REMOTE ADDRESS'),
+            'port': (lambda sock, pi: sock.port, 'PORT'),
+            'service': (lambda sock, pi: sock.service, 'PORT'),
+            'protocol': (lambda sock, pi: sock.protocol, 'PROTOCOL'),
+        }, TrafficByRemoteAddressHeader())
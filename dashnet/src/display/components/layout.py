@@ -2,6 +2,9 @@
 import curses
 import logging
 
+from common.timing import TIMINGS
+from display.components.columns import FormattedRows
+from display.components.formatters import TrafficByInterfaceFormatter
 from display.components.render_opts import RenderOpts
 
 logger = logging.getLogger(__name__)
@@ -13,7 +16,6 @@ class WindowSize:
         self._w = width
         self._y = begin_y
         self._x = begin_x
-        print(self)
 
     @property
     def h(self):
@@ -50,39 +52,87 @@ class ScreenSize(WindowSize):
 
 
 class Window:
+    """
+    a curses sub window remembering what it drew on each row,
+    only rows whose content changed are rewritten and the refresh is batched with noutrefresh
+    """
     def __init__(self, curses_parent, win_size, skin, title=None, border=True):
         self._curses_window = curses_parent.subwin(win_size.h, win_size.w, win_size.y, win_size.x)
         self._skin = skin
+        self._border = border
+        self._title = None
+        self._drawn_rows = {}
         if border:
             self._curses_window.border(0, 0, 0, 0, 0, 0, 0, 0)
         if title:
             self.add_title(title)
-        self._curses_window.refresh()
+        self._curses_window.noutrefresh()
+
+    def redraw(self):
+        """
+        forgets what the window drew, after something else was drawn over it: the border and title are drawn again
+        now and every row on its next update
+        """
+        self._drawn_rows = {}
+        if self._border:
+            self._curses_window.border(0, 0, 0, 0, 0, 0, 0, 0)
+        title, self._title = self._title, None
+        if title:
+            self.add_title(title)
+
+    def recolor(self, skin):
+        """
+        the title and header are drawn again with the skin now and the rows on their next update
+        """
+        self._skin = skin
+        self.redraw()
 
     def add_title(self, title):
-        self._try_addstr(0, 1, title, self._skin.default_title_attr)
+        if title == self._title:
+            return
+        if self._border and self._title:
+            # restore the border under a longer previous title
+            self._curses_window.border(0, 0, 0, 0, 0, 0, 0, 0)
+        self._title = title
+        self._try_addstr(0, 1, f' {title} ', self._skin.default_title_attr)
 
     def add_header(self, header):
-        self._try_addstr(1, 1, header, self._skin.default_title_attr)
+        self._draw_row(1, header, self._skin.default_title_attr)
+
+    @property
+    def capacity(self) -> int:
+        """
+        how many rows fit under the title and the header
+        """
+        y, _ = self.curses_win.getmaxyx()
+        return max(0, y - 3)
 
     def update(self, content_lines: [], attr=0):
         y, x = self.curses_win.getmaxyx()
-        if content_lines:
-            if y == 1 and len(content_lines) == 1:
-                self._try_addstr(0, 1, f'{content_lines[0]}', attr)
-            else:
-                i = 2
-                j = 0
-                while i <= y - 2 and j < len(content_lines):
-                    self._try_addstr(i, 1, str(content_lines[j]), attr)
-                    i += 1
-                    j += 1
-            self.curses_win.refresh()
-
-    def _try_addstr(self, y, x, content_line, attr):
+        if y == 1:
+            self._draw_row(0, content_lines[0] if content_lines else '', attr)
+        else:
+            for i in range(2, y - 1):
+                j = i - 2
+                self._draw_row(i, str(content_lines[j]) if j < len(content_lines) else '', attr)
+        self.curses_win.noutrefresh()
+
+    def _draw_row(self, y, content_line, attr):
+        """
+        writes the row padded to the window's inner width, so that no earlier content remains,
+        unless it is already showing exactly this content
+        """
+        if self._drawn_rows.get(y) == (content_line, attr):
+            return
+        self._drawn_rows[y] = (content_line, attr)
+        _, x = self.curses_win.getmaxyx()
+        width = x - 2
+        text = f' {content_line} ' if content_line else ''
+        self._try_addstr(y, 1, text[:width].ljust(width), attr)
+
+    def _try_addstr(self, y, x, text, attr):
         try:
-            if content_line:
-                self.curses_win.addstr(y, x, f' {content_line} ', attr)
+            self.curses_win.addstr(y, x, text, attr)
         except curses.error as e:
             if 'addwstr() returned ERR' in str(e):
                 curses.endwin()
@@ -95,37 +145,145 @@ class Window:
 
 
 class BaseLayout:
+    """
+    layouts are built once and kept while the screen size and the view stay the same,
+    their windows only redraw what changed and the whole frame goes out in one doupdate
+    """
+    TIMINGS = 'Timings'
+
     def __init__(self, stdscr, render_opts: RenderOpts):
         self._stdscr = stdscr
         self._opts = render_opts
+        self._skin = render_opts.skin
         self._header = None
         self._footer = None
+        self._windows = []
+        self._overlay = None
+        self._overlay_size = None
 
     def show_loading(self):
         self._header.update(('loading...',), attr=self._opts.skin.default_title_attr)
+        self._flush()
 
     def update_header(self, header_content: str):
+        self._follow_skin()
         if header_content:
             self._header.update((header_content,), attr=self._opts.skin.default_title_attr)
 
-    def update_list_window(self, title: str, list_with_headers: [], window):
-        window.add_title(f'{title} ({self._list_len(list_with_headers)})')
-        if list_with_headers:
-            window.add_header(list_with_headers[0])
-            window.update(sorted(list_with_headers[1:]))
+    def update_list_window(self, title: str, list_with_headers: [], window, top: int = None):
+        """
+        a list scrolled to its top row shows which rows are in view, slicing the list only takes those
+        """
+        if list_with_headers is None:
+            # not part of this update
+            return
+        with TIMINGS.stage('draw.rows'):
+            rows = self._list_len(list_with_headers)
+            if top is None:
+                window.add_title(f'{title} ({rows})')
+                top = 0
+            else:
+                top = min(top, max(0, rows - window.capacity))
+                window.add_title(f'{title} ({top + 1 if rows else 0}-{min(top + window.capacity, rows)} of {rows})')
+            window.add_header(list_with_headers[0] if list_with_headers else '')
+            window.update(list_with_headers[1 + top:] if list_with_headers else [])
+
+    def fit_overlay(self, overlay_with_headers: [] = None):
+        """
+        the overlay sits over the bottom right corner of the lists and shares their cells,
+        when it is removed or resized the lists are drawn entirely again, so this comes before drawing them
+        """
+        if self._overlay and self._overlay_size != self._overlay_size_of(overlay_with_headers):
+            self._remove_overlay()
+
+    def update_overlay(self, overlay_with_headers: [] = None):
+        """
+        drawn after the lists and entirely, since they may have written over it
+        """
+        if not overlay_with_headers:
+            return
+        if self._overlay:
+            self._overlay.redraw()
+        else:
+            scr_size = ScreenSize()
+            self._overlay_size = self._overlay_size_of(overlay_with_headers)
+            height, width = self._overlay_size
+            self._overlay = Window(
+                self._stdscr,
+                WindowSize(height, width, scr_size.h - 1 - height, scr_size.w - width),
+                self._opts.skin,
+                title=self.TIMINGS
+            )
+        self._overlay.add_header(overlay_with_headers[0])
+        self._overlay.update(overlay_with_headers[1:])
+
+    @staticmethod
+    def _overlay_size_of(overlay_with_headers: []) -> (int, int):
+        if not overlay_with_headers:
+            return None
+        scr_size = ScreenSize()
+        # widened in steps, so that growing numbers seldom resize it
+        width = (max(len(line) for line in overlay_with_headers) + 4 + 7) // 8 * 8
+        return min(len(overlay_with_headers) + 2, scr_size.h - 2), min(width, scr_size.w)
+
+    def _remove_overlay(self):
+        self._overlay = None
+        self._overlay_size = None
+        for window in self._windows:
+            window.redraw()
+
+    def _follow_skin(self):
+        """
+        the windows are kept across frames, they take a toggled skin once it is drawn
+        """
+        if self._opts.skin is self._skin:
+            return
+        self._skin = self._opts.skin
+        for window in [self._header, self._footer, self._overlay] + self._windows:
+            if window:
+                window.recolor(self._skin)
 
     def update_footer(self, footer_content: str):
         if footer_content:
             self._footer.update((footer_content,), attr=self._opts.skin.default_title_attr)
 
     def _list_len(self, list_with_headers):
+        if isinstance(list_with_headers, FormattedRows):
+            return list_with_headers.total
         return len(list_with_headers) - 1 if list_with_headers else 0
 
+    def _flush(self):
+        with TIMINGS.stage('draw.output'):
+            curses.doupdate()
+
 
 class UtilizationLayout(BaseLayout):
     BY_PROCESS = 'by Process'
     BY_REMOTE_ADDRESS = 'by Remote Address'
     BY_LOCAL_ADDRESS = 'by Local Address'
+    BY_INTERFACE = 'by Interface'
+
+    @staticmethod
+    def panel_rows() -> int:
+        """
+        how many rows each list window holds on the current screen, they are all half its height
+        """
+        return max(0, ScreenSize().half_h - 4)
+
+    @staticmethod
+    def _iface_window_width(scr_size: ScreenSize) -> int:
+        """
+        the interface window takes the bottom right, as wide as its columns need and at most half the screen
+        """
+        need = TrafficByInterfaceFormatter.full_width() + 3
+        return max(scr_size.w - 2 * scr_size.half_w, min(need, scr_size.w // 2))
+
+    @staticmethod
+    def iface_width() -> int:
+        """
+        how wide a row of the interface window can be, inside its border and margins
+        """
+        return max(0, UtilizationLayout._iface_window_width(ScreenSize()) - 3)
 
     def __init__(self, stdscr, render_opts: RenderOpts, header_content: str = None):
         super().__init__(stdscr, render_opts)
@@ -155,16 +313,24 @@ class UtilizationLayout(BaseLayout):
             self._opts.skin,
             title=self.BY_REMOTE_ADDRESS
         )
+        iface_w = self._iface_window_width(scr_size)
         self._by_local_addr = Window(
             self._main.curses_win,
-            WindowSize(scr_size.half_h - 1, scr_size.w, scr_size.half_h, 0),
+            WindowSize(scr_size.half_h - 1, scr_size.w - iface_w, scr_size.half_h, 0),
             self._opts.skin,
             title=self.BY_LOCAL_ADDRESS
         )
+        self._by_iface = Window(
+            self._main.curses_win,
+            WindowSize(scr_size.half_h - 1, iface_w, scr_size.half_h, scr_size.w - iface_w),
+            self._opts.skin,
+            title=self.BY_INTERFACE
+        )
         self._footer = Window(
             self._stdscr, WindowSize(1, scr_size.w, scr_size.h - 1, 0), self._opts.skin, border=False
         )
-        self._stdscr.refresh()
+        self._windows = [self._by_proc_name, self._by_remote_addr, self._by_local_addr, self._by_iface]
+        self._stdscr.noutrefresh()
 
     def update(
             self,
@@ -172,14 +338,19 @@ class UtilizationLayout(BaseLayout):
             by_process_with_headers: [] = None,
             by_remote_addr_with_headers: [] = None,
             by_local_addr_with_headers: [] = None,
+            by_iface_with_headers: [] = None,
             footer_content: str = None,
+            overlay_with_headers: [] = None,
     ):
         self.update_header(header_content)
+        self.fit_overlay(overlay_with_headers)
         self.update_list_window(self.BY_PROCESS, by_process_with_headers, self._by_proc_name)
         self.update_list_window(self.BY_REMOTE_ADDRESS, by_remote_addr_with_headers, self._by_remote_addr)
         self.update_list_window(self.BY_LOCAL_ADDRESS, by_local_addr_with_headers, self._by_local_addr)
+        self.update_list_window(self.BY_INTERFACE, by_iface_with_headers, self._by_iface)
+        self.update_overlay(overlay_with_headers)
         self.update_footer(footer_content)
-        self._stdscr.refresh()
+        self._flush()
 
 
 class ListLayout(BaseLayout):
@@ -200,10 +371,27 @@ class ListLayout(BaseLayout):
         self._footer = Window(
             self._stdscr, WindowSize(1, scr_size.w, scr_size.h - 1, 0), self._opts.skin, border=False
         )
-        self._stdscr.refresh()
+        self._windows = [self._list_window]
+        self._stdscr.noutrefresh()
+
+    @property
+    def page(self) -> int:
+        """
+        how many connections are in view at once
+        """
+        return self._list_window.capacity
 
-    def update(self, header_content: str = None, list_lines_with_headers: [] = None, footer_content: str = None):
+    def update(
+            self,
+            header_content: str = None,
+            list_lines_with_headers: [] = None,
+            footer_content: str = None,
+            overlay_with_headers: [] = None,
+            top: int = 0
+    ):
         self.update_header(header_content)
-        self.update_list_window(self.TOTAL, list_lines_with_headers, self._list_window)
+        self.fit_overlay(overlay_with_headers)
+        self.update_list_window(self.TOTAL, list_lines_with_headers, self._list_window, top)
+        self.update_overlay(overlay_with_headers)
         self.update_footer(footer_content)
-        self._stdscr.refresh()
+        self._flush()
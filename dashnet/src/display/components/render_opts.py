@@ -2,12 +2,25 @@
 import curses
 import re
 import time
+from collections import namedtuple
 from typing import Pattern
 
+from common.profiling import PROFILER
+from common.timing import TIMINGS
 from common.utils import ToggleStates
+from operating_system.filtering import FieldQuery
 from .skin import DefaultSkin, RedSkin
 
 
+# what the shown frame depends on, compared to tell whether a frame is current.
+# back counts the snapshots stepped back through the history while paused, 0 for the latest.
+# rank is what the utilization lists are ranked on and panel_rows how many of their rows fit, None for all.
+# iface_width is how wide a row of the interface list can be, None for all its columns
+RenderState = namedtuple('RenderState', [
+    'show_list', 'resolve_dns', 'resolve_service', 'pattern', 'pause', 'back', 'rank', 'panel_rows', 'iface_width'
+])
+
+
 class ResolveDns(ToggleStates):
     _DNS = 0
     _IP = 1
@@ -68,6 +81,29 @@ class ToggleViews(ToggleStates):
         return self._key == key
 
 
+class Ranking(ToggleStates):
+    """
+    what the utilization lists are ranked on: the bytes moved, the connection count, the name or the address.
+    the lists without an address rank on their name instead
+    """
+    THROUGHPUT = 'throughput'
+    CONNECTIONS = 'connections'
+    NAME = 'name'
+    ADDRESS = 'address'
+    _RANKS = [THROUGHPUT, CONNECTIONS, NAME, ADDRESS]
+
+    def __init__(self, key: str):
+        super().__init__(len(self._RANKS))
+        self._key = key
+
+    @property
+    def rank(self) -> str:
+        return self._RANKS[self.active]
+
+    def is_key(self, key: str) -> bool:
+        return self._key == key
+
+
 class ToggleSkin(ToggleStates):
     def __init__(self, skins: [DefaultSkin]):
         super().__init__(len(skins))
@@ -81,6 +117,7 @@ class ToggleRegexFilter(ToggleStates):
     """
     If a string of the form '?[^?]+?' is specified toggle to 'apply' state
     If '??' is specified toggle to undo state
+    A string holding field:value predicates is parsed as a FieldQuery, anything else is a regex
     """
     _NOOP = 0
     _UNAPPLY = 1
@@ -93,7 +130,7 @@ class ToggleRegexFilter(ToggleStates):
         self._pattern = None
 
     @property
-    def pattern(self) -> Pattern:
+    def pattern(self) -> 'Pattern or FieldQuery':
         return self._pattern
 
     def apply(self) -> bool:
@@ -115,8 +152,9 @@ class ToggleRegexFilter(ToggleStates):
             self._regex = ''
             self.toggle_to(self._UNAPPLY)
         else:
+            query = FieldQuery.parse(regex)
+            self._pattern = query if query else re.compile(regex)
             self._regex = regex
-            self._pattern = re.compile(self._regex)
             self.toggle_to(self._APPLY)
 
     def reset(self) -> None:
@@ -128,6 +166,14 @@ class ToggleRegexFilter(ToggleStates):
 class RenderOpts:
 
     PAUSE = ' '
+    TIMINGS = 't'
+    PROFILE = 'p'
+    OLDER = 'key_left'
+    NEWER = 'key_right'
+    PAGE_UP = 'key_ppage'
+    PAGE_DOWN = 'key_npage'
+    HOME = 'key_home'
+    END = 'key_end'
 
     def __init__(self, stdscr, skins: [DefaultSkin]):
         self._stdscr = stdscr
@@ -137,21 +183,49 @@ class RenderOpts:
         self._resolve_service = ResolveService('s')
         self._pause = ToggleStates(2)
         self._process_filter = ToggleRegexFilter('/')
+        self._ranking = Ranking('r')
+        self._panel_rows = None
+        self._iface_width = None
+        self._timings = ToggleStates(2)
+        self._back = 0
+        self._max_back = 0
+        self._top = 0
+        self._max_top = 0
+        self._page = 0
+        self._wrote_to_screen = False
 
     def handle_user_key(self, key: str) -> bool:
         key = key.casefold()
         if self.views.is_key(key):
             self.views.toggle()
+            self._top = 0
         elif self.dns.is_key(key):
             self.dns.toggle()
         elif self.service.is_key(key):
             self.service.toggle()
+        elif self._ranking.is_key(key):
+            self._ranking.toggle()
         elif key == self.PAUSE:
             self._pause.toggle()
             self._skin.toggle()
+            self._back = 0
+        elif key in (self.OLDER, self.NEWER):
+            # the history is only browsed while paused, the arrows are ignored otherwise
+            if self.pause:
+                step = 1 if key == self.OLDER else -1
+                self._back = min(max(0, self._back + step), self._max_back)
+        elif key in (self.PAGE_UP, self.PAGE_DOWN, self.HOME, self.END):
+            self._scroll(key)
+        elif key == self.TIMINGS:
+            self._timings.toggle()
+            TIMINGS.enabled = self.timings
+        elif key == self.PROFILE:
+            # the capture runs alongside, its progress shows in the header
+            PROFILER.start()
         elif self._process_filter.is_key(key):
             self._process_filter.reset()
-            regex = self.get_user_string('filter regex (<ENTER> to clear):')
+            self._top = 0
+            regex = self.get_user_string('filter regex or field:value (<ENTER> to clear):')
             try:
                 self._process_filter.handle_regex(regex)
             except Exception as e:
@@ -161,11 +235,69 @@ class RenderOpts:
             return False
         return True
 
+    def state(self) -> RenderState:
+        if self._process_filter.unapply():
+            self._process_filter.reset()
+        return RenderState(
+            self._views.show_list,
+            self._resolve_dns.resolve,
+            self._resolve_service.resolve,
+            self._process_filter.pattern if self._process_filter.apply() else None,
+            self.pause,
+            self._back,
+            self._ranking.rank,
+            self._panel_rows,
+            self._iface_width
+        )
+
+    def limit_back(self, max_back: int) -> None:
+        """
+        how far back the history goes, the snapshots before the latest one that it still holds
+        """
+        self._max_back = max_back
+        self._back = min(self._back, max_back)
+
+    def fit_panels(self, rows: int, iface_width: int = None) -> None:
+        """
+        how many rows of each utilization list fit on the screen, only those are ranked and formatted,
+        and how wide the rows of the interface list can be, only the columns fitting are formatted
+        """
+        self._panel_rows = rows
+        self._iface_width = iface_width
+
+    def limit_scroll(self, rows: int, page: int) -> None:
+        """
+        how many rows the list holds and how many of them are in view, a page being the step of the paging keys
+        """
+        self._page = page
+        self._max_top = max(0, rows - page)
+        self._top = min(self._top, self._max_top)
+
+    def _scroll(self, key: str) -> None:
+        if key == self.HOME:
+            self._top = 0
+        elif key == self.END:
+            self._top = self._max_top
+        else:
+            step = self._page if key == self.PAGE_DOWN else -self._page
+            self._top = min(max(0, self._top + step), self._max_top)
+
+    def wrote_to_screen(self) -> bool:
+        """
+        tells, once, whether a prompt or an error was written over the layout since the last call
+        """
+        wrote_to_screen = self._wrote_to_screen
+        self._wrote_to_screen = False
+        return wrote_to_screen
+
     def get_user_string(self, msg: str) -> str:
+        self._wrote_to_screen = True
         _, max_x = self._stdscr.getmaxyx()
         pos = int(max_x / 3)
         self._stdscr.addstr(0, pos - len(msg) - 1, msg)
         self._stdscr.refresh()
+        # the prompt waits for the whole line
+        self._stdscr.timeout(-1)
         curses.echo()
         regex = self._stdscr.getstr(0, pos, 99)
         curses.noecho()
@@ -174,9 +306,13 @@ class RenderOpts:
     def _post_regex_error(self, e: Exception) -> None:
         _, max_x = self._stdscr.getmaxyx()
         pos = int(max_x / 2)
-        self._stdscr.addstr(0, pos, f'bad regex: {e.args[0]}', RedSkin().red)
+        self._stdscr.addstr(0, pos, f'bad filter: {e.args[0]}', RedSkin().red)
         self._stdscr.refresh()
 
+    @property
+    def ranking(self) -> Ranking:
+        return self._ranking
+
     @property
     def skin(self) -> DefaultSkin:
         return self._skin.active()
@@ -197,6 +333,17 @@ class RenderOpts:
     def pause(self) -> bool:
         return self._pause.is_active(1)
 
+    @property
+    def top(self) -> int:
+        """
+        the first row of the list in view, not part of the render state: scrolling draws the same frame
+        """
+        return self._top
+
+    @property
+    def timings(self) -> bool:
+        return self._timings.is_active(1)
+
     @property
     def process_filter(self):
         return self._process_filter
@@ -0,0 +1,202 @@
+
+from display.components.columns import FormattedRows
+from display.components.formatters import AllConnectionsFormatter
+from display.components.formatters import ConnectionOrder
+from display.components.formatters import LocalAddressColumns
+from display.components.formatters import RemoteAddressColumns
+from display.components.formatters import TrafficByInterfaceFormatter
+from display.components.formatters import TrafficByLocalAddressFormatter
+from display.components.formatters import TrafficByProcessFormatter
+from display.components.formatters import TrafficByProcessHeader
+from display.components.formatters import TrafficByRemoteAddressFormatter
+from display.components.render_opts import RenderState
+from common.timing import TIMINGS
+from operating_system.filtering import ConnectionIndex
+from operating_system.filtering import FieldQuery
+from operating_system.filtering import RegexFilter
+from operating_system.history import SnapshotHistory
+from operating_system.linux import LocalRemoteSockets
+from operating_system.linux import Throughput
+from operating_system.snapshot import SnapshotStore
+
+
+class Frame:
+    """
+    the formatted and sorted lists of one view for one snapshot and render state, never modified once published.
+    the connections are a FormattedRows, whose lines are formatted as the renderer draws them.
+    lists is None until a first snapshot was collected, taken_at tells when that snapshot was
+    """
+    CONNECTIONS = 'connections'
+    BY_PROCESS = 'by_process'
+    BY_REMOTE_ADDRESS = 'by_remote_address'
+    BY_LOCAL_ADDRESS = 'by_local_address'
+    BY_INTERFACE = 'by_interface'
+
+    def __init__(self, sequence: int, state: RenderState, lists: {str: [str]} = None, taken_at: float = None):
+        self._sequence = sequence
+        self._state = state
+        self._lists = lists
+        self._taken_at = taken_at
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence
+
+    @property
+    def state(self) -> RenderState:
+        return self._state
+
+    @property
+    def lists(self) -> {str: [str]}:
+        return self._lists
+
+    @property
+    def taken_at(self) -> float:
+        return self._taken_at
+
+
+class FrameBuilder:
+    """
+    the enrichment stage: diffs each snapshot into the traffic counters and column widths,
+    fills in resolved hostnames, applies the filter and formats the lists of the requested view.
+    with a history, the utilization lists show the trend of the connections of each process and remote address
+    """
+    def __init__(self, history: SnapshotHistory = None):
+        self._history = history
+        self._open_sockets = None
+        self._view = None
+        self._view_key = None
+        self._regex_filter = RegexFilter()
+        self._snapshots = SnapshotStore()
+        self._local_columns = LocalAddressColumns()
+        self._remote_columns = RemoteAddressColumns()
+        self._order = ConnectionOrder(self._local_columns, self._remote_columns)
+        self._index = ConnectionIndex()
+        self._names_generation = None
+        self._sequence = 0
+        self._rows = None
+        self._rows_key = None
+
+    def update(self, open_sockets: LocalRemoteSockets) -> None:
+        with TIMINGS.stage('enrich'):
+            delta = self._snapshots.update(open_sockets)
+            self._local_columns.apply(delta.locals)
+            self._remote_columns.apply(delta.remotes)
+            self._order.apply(delta.connections)
+            self._index.apply(delta.connections)
+        self._open_sockets = open_sockets
+        self._track_names()
+
+    def resolve_names(self) -> None:
+        """
+        takes in the hostnames answered since the snapshot was collected
+        """
+        if self._open_sockets:
+            self._open_sockets.resolve()
+            self._track_names()
+
+    def build(self, state: RenderState) -> Frame:
+        self._sequence += 1
+        if not self._open_sockets:
+            return Frame(self._sequence, state)
+        with TIMINGS.stage('filter'):
+            self._apply_filter(state.pattern)
+        if state.show_list:
+            with TIMINGS.stage('sort'):
+                lists = {Frame.CONNECTIONS: self._connections(state)}
+        else:
+            with TIMINGS.stage('format.utilization'):
+                # ranked by throughput as they are formatted
+                lists = self._utilization(state)
+        return Frame(self._sequence, state, lists, self._open_sockets.taken_at)
+
+    def _track_names(self):
+        """
+        hostnames change in place as answers arrive, their widths are then measured again
+        """
+        if self._open_sockets.names_generation != self._names_generation:
+            self._names_generation = self._open_sockets.names_generation
+            self._local_columns.invalidate('hostname')
+            self._remote_columns.invalidate('hostname')
+
+    def _apply_filter(self, pattern):
+        """
+        the view is the latest snapshot or the part of it matching the filter, the snapshot is never modified
+        """
+        view_key = (self._open_sockets, pattern, self._open_sockets.names_generation)
+        if view_key == self._view_key:
+            return
+        self._view_key = view_key
+        if isinstance(pattern, FieldQuery):
+            self._view = pattern.view(self._open_sockets, self._index)
+        elif pattern:
+            self._view = self._regex_filter.view(self._open_sockets, pattern)
+        else:
+            self._view = self._open_sockets
+
+    def _connections(self, state: RenderState) -> FormattedRows:
+        """
+        the sorted index of the view, kept for the frames of the same view with the same columns.
+        the order of the whole snapshot is maintained from its deltas, a filtered view sorts what it holds
+        """
+        rows_key = (self._view_key, state.resolve_dns, state.resolve_service)
+        if rows_key != self._rows_key:
+            self._rows_key = rows_key
+            self._rows = AllConnectionsFormatter(
+                self._view,
+                state.resolve_dns,
+                state.resolve_service,
+                by_process=self._unfiltered(state, self._snapshots.by_process),
+                local_columns=self._unfiltered(state, self._local_columns),
+                remote_columns=self._unfiltered(state, self._remote_columns),
+                order=self._unfiltered(state, self._order)
+            ).rows
+        return self._rows
+
+    def _utilization(self, state: RenderState) -> {str: FormattedRows}:
+        throughput = Throughput(self._view)
+        process_trends, remote_trends = (
+            self._history.trends(self._open_sockets.taken_at) if self._history else ({}, {})
+        )
+        process_traffic = TrafficByProcessFormatter(
+            self._view, TrafficByProcessHeader(), self._unfiltered(state, self._snapshots.by_process),
+            throughput.by_process, process_trends, state.rank, state.panel_rows
+        )
+        remote_traffic = TrafficByRemoteAddressFormatter(
+            self._view.remotes,
+            state.resolve_dns,
+            state.resolve_service,
+            self._unfiltered(state, self._snapshots.by_remote_address),
+            self._unfiltered(state, self._remote_columns),
+            throughput.by_remote,
+            remote_trends,
+            state.rank,
+            state.panel_rows
+        )
+        local_traffic = TrafficByLocalAddressFormatter(
+            self._view.locals,
+            state.resolve_dns,
+            state.resolve_service,
+            self._unfiltered(state, self._snapshots.by_local_address),
+            self._unfiltered(state, self._local_columns),
+            throughput.by_local,
+            state.rank,
+            state.panel_rows
+        )
+        return {
+            Frame.BY_PROCESS: process_traffic.formatted_list,
+            Frame.BY_REMOTE_ADDRESS: remote_traffic.formatted_list,
+            Frame.BY_LOCAL_ADDRESS: local_traffic.formatted_list,
+            # the interfaces carry every connection, they are shown whatever the filter
+            Frame.BY_INTERFACE: TrafficByInterfaceFormatter(
+                self._open_sockets.devices, width=state.iface_width
+            ).formatted_list,
+        }
+
+    @staticmethod
+    def _unfiltered(state: RenderState, traffic):
+        """
+        the counters and column widths maintained from the snapshot deltas cover all connections,
+        while a filter is applied they are recomputed from the filtered view
+        """
+        return None if state.pattern else traffic
@@ -0,0 +1,162 @@
+
+import logging
+import threading
+import time
+
+from common.profiling import PROFILER
+from common.scheduling import RefreshScheduler
+from common.timing import TIMINGS
+from display.components.render_opts import RenderState
+from display.frames import Frame
+from display.frames import FrameBuilder
+from network.resolver import NameResolver
+from operating_system.history import SnapshotHistory
+
+logger = logging.getLogger(__name__)
+
+
+class Pipeline:
+    """
+    collector -> enrichment -> renderer, the first two on their own threads:
+    the collector loads snapshots, the enrichment stage turns the latest one into a frame for the latest render state
+    and the renderer draws the latest published frame.
+    every hand-over keeps only the newest item so a slow stage never queues work behind it,
+    frames are built aside and published by swapping a reference so the renderer never waits on the other stages.
+    the collector also keeps each snapshot in the history, from which a render state stepped back is built,
+    and refreshes as often as the scheduler lets it. a failed refresh is logged and kept as the error shown,
+    the collector goes on with the next one
+    """
+    NAME_FILL_IN_TICKS = 4
+
+    def __init__(
+            self, load_snapshot, name_resolver: NameResolver, builder: FrameBuilder = None,
+            history: SnapshotHistory = None, scheduler: RefreshScheduler = None
+    ):
+        self._load_snapshot = load_snapshot
+        self._name_resolver = name_resolver
+        self._scheduler = scheduler if scheduler else RefreshScheduler()
+        self._history = history if history else SnapshotHistory()
+        self._builder = builder if builder else FrameBuilder(self._history)
+        self._changed = threading.Condition()
+        self._state = None
+        self._state_changed = False
+        self._snapshot = None
+        self._names_changed = False
+        self._latest = None
+        self._shown_back = 0
+        self._frame = None
+        self._error = None
+
+    @property
+    def frame(self) -> Frame:
+        return self._frame
+
+    @property
+    def error(self) -> str:
+        """
+        why the latest refresh failed, None once one succeeds
+        """
+        return self._error
+
+    @property
+    def scheduler(self) -> RefreshScheduler:
+        return self._scheduler
+
+    @property
+    def max_back(self) -> int:
+        """
+        how many snapshots before the latest one the history holds
+        """
+        return max(0, len(self._history) - 1)
+
+    def start(self, state: RenderState) -> None:
+        self.request(state)
+        threading.Thread(daemon=True, target=self._collect, name='collector').start()
+        threading.Thread(daemon=True, target=self._enrich, name='enrichment').start()
+
+    def request(self, state: RenderState) -> None:
+        """
+        asks for a frame of the given render state, superseding any earlier request
+        """
+        with self._changed:
+            if state != self._state:
+                self._state = state
+                self._state_changed = True
+                self._changed.notify_all()
+
+    def wait_for_frame(self, state: RenderState, timeout: float) -> Frame:
+        """
+        returns the frame of the given state once published, or the latest frame when the timeout expires first
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._frame is not None and self._frame.state == state, timeout)
+            return self._frame
+
+    def _collect(self):
+        while True:
+            PROFILER.checkpoint(cycle_done=True)
+            started = time.monotonic()
+            interval = self._scheduler.interval
+            if not self._state.pause:
+                try:
+                    interval = self._refresh()
+                    self._error = None
+                except Exception as e:
+                    logger.exception('refresh failed')
+                    TIMINGS.count('refresh errors')
+                    self._error = f'{type(e).__name__}: {e}'
+            self._fill_in_names(max(0.0, interval - (time.monotonic() - started)))
+
+    def _refresh(self) -> float:
+        """
+        loads a snapshot and hands it over, returns the interval to the next refresh
+        """
+        snapshot = self._load_snapshot()
+        with TIMINGS.stage('history'):
+            self._history.add(snapshot)
+        with self._changed:
+            self._snapshot = snapshot
+            self._changed.notify_all()
+        with TIMINGS.stage('schedule'):
+            return self._scheduler.refreshed(snapshot.connections)
+
+    def _fill_in_names(self, seconds: float):
+        """
+        waits for the next refresh, signalling reverse dns answers as they arrive
+        """
+        answers = self._name_resolver.answers
+        for _ in range(self.NAME_FILL_IN_TICKS):
+            time.sleep(seconds / self.NAME_FILL_IN_TICKS)
+            if self._name_resolver.answers != answers:
+                answers = self._name_resolver.answers
+                with self._changed:
+                    self._names_changed = True
+                    self._changed.notify_all()
+
+    def _enrich(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._snapshot or self._state_changed or self._names_changed)
+                snapshot, self._snapshot = self._snapshot, None
+                names_changed, self._names_changed = self._names_changed, False
+                state_changed, self._state_changed = self._state_changed, False
+                state = self._state
+            PROFILER.checkpoint()
+            if snapshot:
+                self._latest = snapshot
+            if state.back != self._shown_back:
+                self._shown_back = state.back
+                self._builder.update(
+                    self._history.restore(state.back, self._name_resolver) if state.back else self._latest
+                )
+            elif snapshot and not state.back:
+                self._builder.update(snapshot)
+            elif names_changed and state.resolve_dns:
+                self._builder.resolve_names()
+            elif not state_changed:
+                continue
+            frame = self._builder.build(state)
+            with self._changed:
+                self._frame = frame
+                self._changed.notify_all()
+            TIMINGS.write_log()
@@ -1,29 +1,38 @@
 
 import curses
 import locale
-import threading
+import time
 
-from display.components.formatters import AllConnectionsFormatter
-from display.components.formatters import TrafficByLocalAddressFormatter
-from display.components.formatters import TrafficByProcessFormatter
-from display.components.formatters import TrafficByProcessHeader
-from display.components.formatters import TrafficByRemoteAddressFormatter
+from common.profiling import PROFILER
+from common.timing import TIMINGS
+from display.components.formatters import TimingsFormatter
 from display.components.layout import ListLayout
 from display.components.layout import UtilizationLayout
 from display.components.render_opts import RenderOpts
-from operating_system.linux import LocalRemoteSockets
+from display.frames import Frame
+from display.pipeline import Pipeline
+from recording.replay import ReplaySource
 
 
 class Ui:
+    """
+    the renderer, the only stage touching curses: it handles keys and draws the latest frame of the pipeline.
+    a burst of keys is handled as a whole and followed by a single redraw
+    """
+    POLL_MS = 25
+    # how long a redraw waits for the frame of a new render state before drawing what it has
+    KEY_TO_SCREEN_BUDGET = 0.04
 
-    def __init__(self, _stdscr, lock: threading.RLock, render_opts: RenderOpts):
+    def __init__(self, _stdscr, render_opts: RenderOpts, pipeline: Pipeline, replay: ReplaySource = None):
         self._stdscr = _stdscr
-        self._lock = lock
         self._opts = render_opts
-        self._open_sockets = None
-        self._list_layout = None
-        self._utilization_layout = None
+        self._pipeline = pipeline
+        self._replay = replay
+        self._layout = None
+        self._drawn_frame = None
+        self._drawn_error = None
         self._setup_curses()
+        self._opts.fit_panels(UtilizationLayout.panel_rows(), UtilizationLayout.iface_width())
 
     def _setup_curses(self):
         self._stdscr.clear()
@@ -31,87 +40,152 @@ class Ui:
         locale.setlocale(locale.LC_ALL, '')
         # code = locale.getpreferredencoding()
 
-    def handle_user_input(self):
+    def run(self):
+        self.show_view(self._pipeline.frame)
         while True:
-            key = self._stdscr.getkey()
-            if self._lock.acquire():
-                if self._opts.handle_user_key(key.casefold()):
-                    self._apply_filter()
-                    self.show_view()
-                    self._lock.release()
-                    continue
-                else:
-                    self._lock.release()
-                    return
-
-    def handle_refresh_state(self, open_sockets):
-        self._update(open_sockets)
-        self._apply_filter()
-        self.show_view()
-
-    def _update(self, open_sockets: 'LocalRemoteSockets'):
-        self._open_sockets = open_sockets
-
-    def _apply_filter(self):
-        if self._open_sockets:
-            if self._opts.process_filter.apply():
-                self._open_sockets.filter_by_regex(self._opts.process_filter.pattern)
-            elif self._opts.process_filter.unapply():
-                self._open_sockets.load()
-                self._opts.process_filter.reset()
-
-    def show_view(self):
+            PROFILER.checkpoint()
+            key = self._next_key(self.POLL_MS)
+            if key is None:
+                if self._pipeline.frame is not self._drawn_frame or self._pipeline.error != self._drawn_error:
+                    self.show_view(self._pipeline.frame)
+                continue
+            if not self._handle_keys(key):
+                return
+            state = self._opts.state()
+            self._pipeline.request(state)
+            self.show_view(self._pipeline.wait_for_frame(state, self.KEY_TO_SCREEN_BUDGET))
+
+    def _handle_keys(self, key) -> bool:
+        """
+        handles the key and those already waiting behind it, returns False on a quitting key
+        """
+        self._opts.limit_back(self._pipeline.max_back)
+        self._limit_scroll()
+        while key is not None:
+            if key == 'KEY_RESIZE':
+                curses.update_lines_cols()
+                self._opts.fit_panels(UtilizationLayout.panel_rows(), UtilizationLayout.iface_width())
+                self._layout = None
+            elif self._opts.handle_user_key(key.casefold()):
+                if self._opts.wrote_to_screen():
+                    # prompts are written straight to the screen, behind the windows' back
+                    self._layout = None
+            else:
+                return False
+            key = self._next_key(0)
+        return True
+
+    def _next_key(self, timeout_ms: int):
+        self._stdscr.timeout(timeout_ms)
+        try:
+            return self._stdscr.getkey()
+        except curses.error:
+            return None
+
+    def show_view(self, frame: Frame):
+        self._drawn_frame = frame
+        self._drawn_error = self._pipeline.error
         if self._opts.views.show_list:
-            self.show_list_view()
+            self.show_list_view(frame)
         elif self._opts.views.show_utilization:
-            self.show_utilization_view()
+            self.show_utilization_view(frame)
 
-    def show_list_view(self):
-        self._list_layout = ListLayout(self._stdscr, self._opts)
-        self._list_layout.update(footer_content=self._footer_title())
-        if not self._open_sockets:
-            self._list_layout.show_loading()
+    def show_list_view(self, frame: Frame):
+        list_layout = self._layout_of(ListLayout)
+        list_layout.update(footer_content=self._footer_title())
+        if not self._is_drawable(frame, show_list=True):
+            list_layout.show_loading()
         else:
-            all_connections = AllConnectionsFormatter(
-                self._open_sockets, self._opts.dns.resolve, self._opts.service.resolve
-            )
-            self._list_layout.update(
-                header_content=self._header_title(),
-                list_lines_with_headers=all_connections.formatted_list,
-                footer_content=self._footer_title()
+            list_layout.update(
+                header_content=self._header_title(frame),
+                list_lines_with_headers=frame.lists[Frame.CONNECTIONS],
+                footer_content=self._footer_title(),
+                overlay_with_headers=self._timings_overlay(),
+                top=self._opts.top
             )
 
-    def show_utilization_view(self):
-        self._utilization_layout = UtilizationLayout(self._stdscr, self._opts)
-        self._utilization_layout.update(footer_content=self._footer_title())
-        if not self._open_sockets:
-            self._utilization_layout.show_loading()
+    def _limit_scroll(self):
+        """
+        the paging keys move through the connections of the frame drawn, by the rows in view
+        """
+        frame = self._drawn_frame
+        if isinstance(self._layout, ListLayout) and self._is_drawable(frame, show_list=True):
+            self._opts.limit_scroll(len(frame.lists[Frame.CONNECTIONS]) - 1, self._layout.page)
+
+    def show_utilization_view(self, frame: Frame):
+        utilization_layout = self._layout_of(UtilizationLayout)
+        utilization_layout.update(footer_content=self._footer_title())
+        if not self._is_drawable(frame, show_list=False):
+            utilization_layout.show_loading()
         else:
-            process_traffic = TrafficByProcessFormatter(self._open_sockets, TrafficByProcessHeader())
-            remote_traffic = TrafficByRemoteAddressFormatter(
-                self._open_sockets.remotes, self._opts.dns.resolve, self._opts.service.resolve
-            )
-            local_traffic = TrafficByLocalAddressFormatter(
-                self._open_sockets.locals, self._opts.dns.resolve, self._opts.service.resolve
-            )
-            self._utilization_layout.update(
-                header_content=self._header_title(),
-                by_process_with_headers=process_traffic.formatted_list,
-                by_remote_addr_with_headers=remote_traffic.formatted_list,
-                by_local_addr_with_headers=local_traffic.formatted_list,
-                footer_content=self._footer_title()
+            utilization_layout.update(
+                header_content=self._header_title(frame),
+                by_process_with_headers=frame.lists[Frame.BY_PROCESS],
+                by_remote_addr_with_headers=frame.lists[Frame.BY_REMOTE_ADDRESS],
+                by_local_addr_with_headers=frame.lists[Frame.BY_LOCAL_ADDRESS],
+                by_iface_with_headers=frame.lists[Frame.BY_INTERFACE],
+                footer_content=self._footer_title(),
+                overlay_with_headers=self._timings_overlay()
             )
 
-    def _header_title(self):
+    @staticmethod
+    def _is_drawable(frame: Frame, show_list: bool) -> bool:
+        """
+        a frame of an earlier render state is drawn until the current one arrives, as long as it is of the same view
+        """
+        return frame is not None and frame.lists is not None and frame.state.show_list == show_list
+
+    def _layout_of(self, layout_class):
+        """
+        the layout of the shown view is kept until the view changes or the terminal is resized
+        """
+        if not isinstance(self._layout, layout_class):
+            self._layout = layout_class(self._stdscr, self._opts)
+        return self._layout
+
+    def _timings_overlay(self) -> [str]:
+        """
+        the durations of the pipeline's stages up to the frame being drawn, while the timings are shown
+        """
+        return TimingsFormatter(TIMINGS).formatted_list if self._opts.timings else None
+
+    def _header_title(self, frame: Frame):
         p = '(Paused)' if self._opts.pause else ''
-        return f'TCP\\UDP Connections {p}'
+        if self._replay and frame.taken_at and not frame.state.back:
+            end = ', end' if self._replay.finished else ''
+            p = f'(Replay {time.strftime("%H:%M:%S", time.localtime(frame.taken_at))} x{self._replay.speed:g}{end}) {p}'
+        elif frame.state.back and frame.taken_at:
+            p = f'(Paused at {time.strftime("%H:%M:%S", time.localtime(frame.taken_at))}, {frame.state.back} back)'
+        # the frame of an earlier render state is shown until the requested one is built
+        u = '(Updating...)' if frame.state != self._opts.state() else ''
+        profiling = f'({PROFILER.status})' if PROFILER.status else ''
+        return f'TCP\\UDP Connections {p} {u} {profiling} {self._refresh_status()}'
+
+    def _refresh_status(self) -> str:
+        """
+        the refresh interval the scheduler settled on and the share of its cpu budget in use
+        """
+        scheduler = self._pipeline.scheduler
+        return (
+            f'(every {scheduler.interval:.1f}s, cpu {scheduler.usage:.0%} of {scheduler.budget:.0%}, '
+            f'{scheduler.rss / (1 << 20):.0f}M)'
+        )
 
     def _footer_title(self):
-        p = '<SPACE> Resume' if self._opts.pause else '<SPACE> Pause'
+        p = '<SPACE> Resume  <LEFT/RIGHT> History' if self._opts.pause else '<SPACE> Pause'
+        if self._opts.views.show_list:
+            order = '<PGUP/PGDN/HOME/END> Scroll  '
+        else:
+            order = f'[R]ank: {self._opts.ranking.rank}  '
+        error = f'Refresh failed, {self._drawn_error}  ' if self._drawn_error else ''
         return (
+            f'{error}'
             '[V]iews  '
             f'{p}  '
+            f'{order}'
             '[D]NS Resolution  '
             '[S]ervice Resolution  '
             '[/]Filter  '
+            '[T]imings  '
+            '[P]rofile  '
         )
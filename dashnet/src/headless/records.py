@@ -0,0 +1,80 @@
+
+from operating_system.linux import LocalRemoteSockets
+from operating_system.snapshot import MapDelta
+from operating_system.snapshot import SnapshotStore
+
+FIELDS = (
+    'ts', 'event', 'protocol', 'process', 'iface',
+    'local_ip', 'local_port', 'local_service',
+    'remote_ip', 'remote_port', 'remote_host', 'remote_service',
+)
+
+
+class ConnectionRecords:
+    """
+    flattens snapshots into records of FIELDS, either every open connection
+    or, when diff_only, the connections added, removed or changed since the previous snapshot.
+    a diff starts with the whole snapshot as 'open' records, as it does again after restart()
+    """
+    OPEN = 'open'
+    ADDED = 'added'
+    REMOVED = 'removed'
+    CHANGED = 'changed'
+
+    def __init__(self, diff_only: bool = False):
+        self._diff_only = diff_only
+        self._previous = None
+
+    def restart(self) -> None:
+        """
+        forgets the previous snapshot, the next diff is a whole snapshot again
+        """
+        self._previous = None
+
+    def of(self, open_sockets: LocalRemoteSockets, ts: float) -> [tuple]:
+        connections = {
+            SnapshotStore.connection_key(lsock, rsock): pi for (lsock, rsock), pi in open_sockets.connections.items()
+        }
+        ts = round(ts, 3)
+        if not self._diff_only or self._previous is None:
+            records = [self._record(ts, self.OPEN, key, pi) for key, pi in connections.items()]
+        else:
+            delta = MapDelta.between(self._previous, connections)
+            records = [self._record(ts, self.ADDED, key, pi) for key, pi in delta.added.items()]
+            records += [self._record(ts, self.REMOVED, key, pi) for key, pi in delta.removed.items()]
+            records += [self._record(ts, self.CHANGED, key, pi) for key, (_, pi) in delta.changed.items()]
+        if self._diff_only:
+            self._previous = connections
+        return records
+
+    @staticmethod
+    def _record(ts, event, key, pi) -> tuple:
+        lsock, rsock, protocol = key
+        return (
+            ts, event, protocol, pi.process, pi.iface,
+            lsock.ip if lsock else None,
+            _port_number(lsock),
+            lsock.service if lsock else None,
+            rsock.ip if rsock else None,
+            _port_number(rsock),
+            _hostname(rsock),
+            rsock.service if rsock else None,
+        )
+
+
+def _hostname(sock):
+    """
+    the resolved name, None until an answer arrives or when there is none: the resolver stands in the ip for it
+    """
+    if sock is None or sock.hostname == sock.ip:
+        return None
+    return sock.hostname
+
+
+def _port_number(sock):
+    if sock is None:
+        return None
+    try:
+        return int(sock.port)
+    except ValueError:
+        return None
@@ -0,0 +1,45 @@
+
+import time
+
+from common.timing import TIMINGS
+from headless.records import ConnectionRecords
+from headless.writers import BufferedWriter
+
+
+class HeadlessStream:
+    """
+    collects a snapshot every interval and writes its records, without a terminal:
+    nothing here or below imports curses
+    """
+    INTERVAL = 1
+
+    def __init__(self, load_snapshot, records: ConnectionRecords, output_format, writer: BufferedWriter,
+                 interval: float = INTERVAL):
+        self._load_snapshot = load_snapshot
+        self._records = records
+        self._format = output_format
+        self._writer = writer
+        self._interval = interval
+
+    def run(self, once: bool = False, with_header: bool = True) -> None:
+        """
+        with_header is False when appending to the output of an earlier run
+        """
+        if with_header:
+            self._writer.write(self._format.header())
+        dropped = 0
+        try:
+            while not self._writer.failed:
+                started = time.monotonic()
+                snapshot = self._load_snapshot()
+                if self._writer.dropped != dropped:
+                    # a diff the reader missed a part of is worthless, start over from a whole snapshot
+                    dropped = self._writer.dropped
+                    self._records.restart()
+                self._writer.write(self._format.lines(self._records.of(snapshot, time.time())))
+                TIMINGS.write_log()
+                if once:
+                    return
+                time.sleep(max(0.0, self._interval - (time.monotonic() - started)))
+        finally:
+            self._writer.close()
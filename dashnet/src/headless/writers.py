@@ -0,0 +1,105 @@
+
+import csv
+import io
+import json
+import threading
+from collections import deque
+
+from headless.records import FIELDS
+
+
+class JsonLinesFormat:
+    """
+    one json object per record and line
+    """
+    NAME = 'jsonl'
+
+    def __init__(self):
+        self._encode = json.JSONEncoder(separators=(',', ':')).encode
+
+    def header(self) -> str:
+        return ''
+
+    def lines(self, records: [tuple]) -> str:
+        encode = self._encode
+        return ''.join([encode(dict(zip(FIELDS, record))) + '\n' for record in records])
+
+
+class CsvFormat:
+    """
+    a header line of the field names, then one line per record, missing values are empty
+    """
+    NAME = 'csv'
+
+    def header(self) -> str:
+        return self.lines([FIELDS])
+
+    def lines(self, records: [tuple]) -> str:
+        text = io.StringIO()
+        csv.writer(text, lineterminator='\n').writerows(records)
+        return text.getvalue()
+
+
+FORMATS = {f.NAME: f for f in [JsonLinesFormat, CsvFormat]}
+
+
+class BufferedWriter:
+    """
+    writes batches of text on its own thread so that collection never waits on a slow reader:
+    write() only queues, and when MAX_PENDING batches are waiting the oldest is dropped and counted.
+    a failed write, such as the reader closing the pipe, stops the writer and sets failed
+    """
+    MAX_PENDING = 16
+
+    def __init__(self, stream, max_pending: int = MAX_PENDING):
+        self._stream = stream
+        self._pending = deque()
+        self._max_pending = max_pending
+        self._changed = threading.Condition()
+        self._closed = False
+        self._dropped = 0
+        self._failed = False
+        self._thread = threading.Thread(daemon=True, target=self._drain, name='writer')
+        self._thread.start()
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def failed(self) -> bool:
+        return self._failed
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        with self._changed:
+            if len(self._pending) >= self._max_pending:
+                self._pending.popleft()
+                self._dropped += 1
+            self._pending.append(text)
+            self._changed.notify()
+
+    def close(self) -> None:
+        """
+        waits for the pending batches to be written and flushed
+        """
+        with self._changed:
+            self._closed = True
+            self._changed.notify()
+        self._thread.join()
+
+    def _drain(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                batches = list(self._pending)
+                self._pending.clear()
+            try:
+                self._stream.write(''.join(batches))
+                self._stream.flush()
+            except (OSError, ValueError):
+                self._failed = True
+                return
@@ -1,36 +1,264 @@
 
-import curses
-import time
-import threading
+import argparse
+import logging
+import sys
 
-from display.ui import Ui
-from display.components.render_opts import RenderOpts
-from display.components.skin import CyanSkin, RedSkin
+from common.profiling import PROFILER
+from common.profiling import ProfileCapture
+from common.scheduling import RefreshScheduler
+from common.timing import TIMINGS
+from headless.records import ConnectionRecords
+from headless.stream import HeadlessStream
+from headless.writers import BufferedWriter
+from headless.writers import FORMATS
+from headless.writers import JsonLinesFormat
+from network.resolver import NameResolver
+from operating_system.linux import IfaceResolver
+from operating_system.linux import ConnectionLoader
+from operating_system.linux import DEFAULT_NAMING_RULES
 from operating_system.linux import LocalRemoteSockets
+from operating_system.linux import NamingRule
+from operating_system.linux import ProcessLoader
+from operating_system.netdev import DeviceStats
+from recording.recorder import SnapshotRecorder
+from recording.replay import Recording
+from recording.replay import ReplaySource
 
 
 class App:
-    def __init__(self):
-        self._lock = threading.RLock()
-        self._opts = None
+
+    def __init__(
+            self,
+            dns_cache_path: str = None,
+            naming_rules: [NamingRule] = None,
+            collector: str = ConnectionLoader.COLLECTORS[0],
+            proc_path: str = ProcessLoader.PROC_PATH,
+            record_path: str = None,
+            cpu_budget: float = RefreshScheduler.BUDGET
+    ):
+        self._iface_resolver = IfaceResolver(proc_path)
+        self._name_resolver = NameResolver(warm_start_path=dns_cache_path)
+        self._process_loader = ProcessLoader(naming_rules, proc_path)
+        # the tcp counters are read from the running kernel, never from another procfs tree
+        self._connection_loader = ConnectionLoader(
+            collector, proc_path, with_rates=proc_path == ProcessLoader.PROC_PATH
+        )
+        self._device_stats = DeviceStats(proc_path)
+        self._recorder = SnapshotRecorder(record_path) if record_path else None
+        self._replay = None
+        self._cpu_budget = cpu_budget
+
+    def replay(self, path: str, speed: float = ReplaySource.SPEED, start: str = None) -> None:
+        """
+        the dashboard shows the snapshots of a recording instead of those loaded, starting at the given time
+        """
+        recording = Recording(path)
+        self._replay = ReplaySource(
+            recording, self._name_resolver, speed, ReplaySource.parse_time(start, recording) if start else None
+        )
 
     def start(self, _stdscr):
-        self._opts = RenderOpts(_stdscr, [CyanSkin(), RedSkin()])
-        ui = Ui(_stdscr, self._lock, self._opts)
-        ui.show_view()
-        threading.Thread(daemon=True, target=self._refresh_state, kwargs={'ui': ui}).start()
-        ui.handle_user_input()
-    
-    def _refresh_state(self, ui):
-        while True:
-            if not self._opts.pause:
-                open_sockets = LocalRemoteSockets()
-                open_sockets.load()
-                if self._lock.acquire(timeout=1):
-                    ui.handle_refresh_state(open_sockets)
-                    self._lock.release()
-            time.sleep(1)
-
-
-app = App()
-curses.wrapper(app.start)
+        # the dashboard modules pull in curses, which the headless stream never loads
+        from display.components.render_opts import RenderOpts
+        from display.components.skin import CyanSkin, RedSkin
+        from display.pipeline import Pipeline
+        from display.ui import Ui
+
+        opts = RenderOpts(_stdscr, [CyanSkin(), RedSkin()])
+        if self._replay:
+            # a replay steps through the recording at its own pace, whatever the connections do
+            scheduler = RefreshScheduler(self._cpu_budget, ReplaySource.STEP, ReplaySource.STEP)
+            pipeline = Pipeline(self._replay.load, self._name_resolver, scheduler=scheduler)
+        else:
+            pipeline = Pipeline(self._load_snapshot, self._name_resolver, scheduler=RefreshScheduler(self._cpu_budget))
+        ui = Ui(_stdscr, opts, pipeline, self._replay)
+        pipeline.start(opts.state())
+        ui.run()
+
+    def stream(
+            self,
+            output_format: str,
+            output_path: str = None,
+            interval: float = HeadlessStream.INTERVAL,
+            diff_only: bool = False,
+            once: bool = False
+    ):
+        output = open(output_path, 'a', newline='') if output_path else sys.stdout
+        try:
+            HeadlessStream(
+                self._load_snapshot,
+                ConnectionRecords(diff_only),
+                FORMATS[output_format](),
+                BufferedWriter(output),
+                interval
+            ).run(once, with_header=not output_path or output.tell() == 0)
+        finally:
+            if output_path:
+                output.close()
+
+    def stop(self):
+        self._name_resolver.save()
+        if self._recorder:
+            self._recorder.close()
+
+    def _load_snapshot(self) -> LocalRemoteSockets:
+        """
+        the collector stage, of the dashboard's pipeline or of the headless stream
+        """
+        open_sockets = LocalRemoteSockets(
+            self._iface_resolver, self._name_resolver, self._process_loader, self._connection_loader,
+            self._device_stats
+        ).load()
+        if self._recorder:
+            with TIMINGS.stage('record'):
+                self._recorder.add(open_sockets)
+        return open_sockets
+
+
+def name_rule(spec: str) -> NamingRule:
+    try:
+        return NamingRule.parse(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='netstat-like dashboard of TCP/UDP connections')
+    parser.add_argument(
+        '--dns-cache', metavar='FILE', help='warm-start file keeping resolved hostnames across restarts'
+    )
+    parser.add_argument(
+        '--name-rule',
+        metavar='COMM_REGEX:ARGV_INDEX',
+        action='append',
+        type=name_rule,
+        help='name processes whose comm matches COMM_REGEX after that command line argument, '
+             'e.g. "java:-1" (repeatable, replaces the defaults)'
+    )
+    parser.add_argument(
+        '--collector',
+        choices=ConnectionLoader.COLLECTORS,
+        default=ConnectionLoader.COLLECTORS[0],
+        help='how connections are collected (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--proc-path',
+        metavar='DIR',
+        default=ProcessLoader.PROC_PATH,
+        help='procfs root to read processes, connections and routes from (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--timings-log',
+        metavar='FILE',
+        help='append the per-stage timings and counters to FILE as one json line per refresh'
+    )
+    parser.add_argument(
+        '--log',
+        metavar='FILE',
+        help='append the errors of the dashboard to FILE, they are otherwise only shown in its footer'
+    )
+    parser.add_argument(
+        '--profile-dir',
+        metavar='DIR',
+        default='.',
+        help='where the P key writes its profile captures (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--profile-cycles',
+        metavar='N',
+        type=int,
+        default=ProfileCapture.CYCLES,
+        help='refresh cycles profiled by a capture (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--cpu-budget',
+        metavar='PERCENT',
+        type=float,
+        default=RefreshScheduler.BUDGET * 100,
+        help='share of one core the dashboard may use, refreshing less often beyond it (default: %(default)s)'
+    )
+    parser.add_argument('--record', metavar='FILE', help='also write every snapshot to FILE, for a later --replay')
+    replay = parser.add_argument_group('replay', 'show the snapshots of a recording instead of the live ones')
+    replay.add_argument('--replay', metavar='FILE', help='the recording to show, as written by --record')
+    replay.add_argument(
+        '--speed',
+        metavar='FACTOR',
+        type=float,
+        default=ReplaySource.SPEED,
+        help='recorded seconds shown per second (default: %(default)s)'
+    )
+    replay.add_argument(
+        '--start',
+        metavar='TIME',
+        help='where the replay starts: a unix time, HH:MM[:SS] on the day of the recording or +SECONDS into it'
+    )
+    headless = parser.add_argument_group('headless', 'stream snapshots to a file or stdout instead of the dashboard')
+    headless.add_argument(
+        '--format', choices=sorted(FORMATS), help='write records in this format, implied by --output, --diff-only and --once'
+    )
+    headless.add_argument('--output', metavar='FILE', help='append to FILE instead of writing to stdout')
+    headless.add_argument(
+        '--interval',
+        metavar='SECONDS',
+        type=float,
+        default=HeadlessStream.INTERVAL,
+        help='time between snapshots (default: %(default)s)'
+    )
+    headless.add_argument(
+        '--diff-only', action='store_true', help='after a first whole snapshot, write only what changed'
+    )
+    headless.add_argument('--once', action='store_true', help='write a single snapshot and exit')
+    return parser
+
+
+def parse_args(parser: argparse.ArgumentParser):
+    args = parser.parse_args()
+    if not args.format and (args.output or args.diff_only or args.once):
+        args.format = JsonLinesFormat.NAME
+    if args.replay and args.format:
+        parser.error('--replay shows the dashboard, it does not stream')
+    if args.speed <= 0:
+        parser.error('--speed must be positive')
+    if args.cpu_budget <= 0:
+        parser.error('--cpu-budget must be positive')
+    if args.interval <= 0:
+        parser.error('--interval must be positive')
+    if args.profile_cycles < 1:
+        parser.error('--profile-cycles must be at least 1')
+    return args
+
+
+parser = make_parser()
+args = parse_args(parser)
+if args.timings_log:
+    TIMINGS.log_to(args.timings_log)
+PROFILER.directory = args.profile_dir
+PROFILER.cycles = args.profile_cycles
+app = App(
+    dns_cache_path=args.dns_cache,
+    naming_rules=args.name_rule or DEFAULT_NAMING_RULES,
+    collector=args.collector,
+    proc_path=args.proc_path,
+    record_path=args.record,
+    cpu_budget=args.cpu_budget / 100
+)
+try:
+    if args.replay:
+        try:
+            app.replay(args.replay, args.speed, args.start)
+        except (OSError, ValueError) as e:
+            parser.error(f'--replay: {e}')
+    if args.format:
+        app.stream(args.format, args.output, args.interval, args.diff_only, args.once)
+    else:
+        import curses
+        if args.log:
+            logging.basicConfig(filename=args.log, format='%(asctime)s %(threadName)s %(levelname)s %(message)s')
+        else:
+            # the dashboard owns the terminal, nothing is written to it behind its back
+            logging.getLogger().addHandler(logging.NullHandler())
+        curses.wrapper(app.start)
+except KeyboardInterrupt:
+    pass
+finally:
+    app.stop()
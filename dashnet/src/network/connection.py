@@ -1,12 +1,86 @@
-
 import socket
+import sys
+
+# set above the 128 address bits so that ipv6 addresses never collide with ipv4 ones
+IPV6_FLAG = 1 << 128
+MAX_CACHED_ADDRESSES = 1 << 18
+
+_packed_addresses = {}
+_formatted_addresses = {}
+_port_strings = {}
+
+
+def pack_ip(ip: str):
+    """
+    ip address as an int (ipv6 ones carrying IPV6_FLAG), anything that is not an address is returned as is
+    """
+    packed = _packed_addresses.get(ip)
+    if packed is None:
+        try:
+            packed = int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+        except (OSError, TypeError):
+            try:
+                packed = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big') | IPV6_FLAG
+            except (OSError, TypeError):
+                return ip
+        if len(_packed_addresses) >= MAX_CACHED_ADDRESSES:
+            _packed_addresses.clear()
+        _packed_addresses[ip] = packed
+    return packed
+
+
+def format_ip(packed) -> str:
+    """
+    inverse of pack_ip, formatted addresses are shared by all the sockets holding them
+    """
+    if packed.__class__ is str:
+        return packed
+    ip = _formatted_addresses.get(packed)
+    if ip is None:
+        if packed & IPV6_FLAG:
+            ip = socket.inet_ntop(socket.AF_INET6, (packed ^ IPV6_FLAG).to_bytes(16, 'big'))
+        else:
+            ip = socket.inet_ntop(socket.AF_INET, packed.to_bytes(4, 'big'))
+        if len(_formatted_addresses) >= MAX_CACHED_ADDRESSES:
+            _formatted_addresses.clear()
+        _formatted_addresses[packed] = ip
+    return ip
+
+
+def port_string(port) -> str:
+    """
+    ports are shown as strings, one per port number
+    """
+    port_str = _port_strings.get(port)
+    if port_str is None:
+        port_str = sys.intern(str(port))
+        _port_strings[port] = port_str
+    return port_str
 
 
 class ProcessIface:
+    """
+    instances obtained through ProcessIface.of are shared by all connections of a process on an interface,
+    they are immutable: another interface is another ProcessIface.of(process, iface)
+    """
+    __slots__ = ('_process', '_iface')
+    MAX_INTERNED = 1 << 14
+    _interned = {}
+
     def __init__(self, process_name, iface_name=None):
         self._process = process_name
         self._iface = iface_name
 
+    @classmethod
+    def of(cls, process_name, iface_name=None) -> 'ProcessIface':
+        key = (process_name, iface_name)
+        pi = cls._interned.get(key)
+        if pi is None:
+            if len(cls._interned) >= cls.MAX_INTERNED:
+                cls._interned.clear()
+            pi = cls._interned[key] = cls(process_name, iface_name)
+        return pi
+
     @property
     def process(self):
         return self._process
@@ -15,12 +89,22 @@ class ProcessIface:
     def iface(self):
         return self._iface
 
-    @iface.setter
-    def iface(self, iface_name):
-        self._iface = iface_name
+    def __eq__(self, other: 'ProcessIface'):
+        if not isinstance(other, ProcessIface):
+            return NotImplemented
+        return self is other or (self._process == other._process and self._iface == other._iface)
+
+    def __hash__(self):
+        return hash((self._process, self._iface))
 
 
 class Socket:
+    """
+    the address is kept packed (see pack_ip) and formatted when read,
+    the hash of (address, port, protocol) is computed once
+    """
+    __slots__ = ('_packed_ip', '_port', '_protocol', '_hostname', '_service', '_hash')
+
     def __init__(
             self,
             ip: str = '<UNKNOWN>',
@@ -29,19 +113,25 @@ class Socket:
             hostname=None,
             service=None
     ):
-        self._ip = ip
-        self._port = port
-        self._protocol = protocol
+        self._packed_ip = pack_ip(ip)
+        self._port = port_string(port)
+        self._protocol = sys.intern(protocol)
         self._hostname = hostname
         self._service = service
+        self._hash = hash((self._packed_ip, self._port, self._protocol))
 
     @property
     def ip(self) -> str:
-        return self._ip
+        return format_ip(self._packed_ip)
 
     @ip.setter
     def ip(self, ip: str):
-        self._ip = ip
+        self._packed_ip = pack_ip(ip)
+        self._rehash()
+
+    @property
+    def packed_ip(self):
+        return self._packed_ip
 
     @property
     def hostname(self) -> str:
@@ -57,7 +147,8 @@ class Socket:
 
     @port.setter
     def port(self, port: str):
-        self._port = port
+        self._port = port_string(port)
+        self._rehash()
 
     @property
     def service(self) -> str:
@@ -73,7 +164,11 @@ class Socket:
 
     @protocol.setter
     def protocol(self, protocol: str):
-        self._protocol = protocol
+        self._protocol = sys.intern(protocol)
+        self._rehash()
+
+    def _rehash(self):
+        self._hash = hash((self._packed_ip, self._port, self._protocol))
 
     def resolve_dns(self) -> None:
         if self._hostname is None:
@@ -90,16 +185,23 @@ class Socket:
                 self.service = self.port
 
     def __repr__(self):
-        return f'{self._ip} {self._port} {self._protocol}'
+        return f'{self.ip} {self._port} {self._protocol}'
 
     def __str__(self):
-        return f'{self._ip} {self._hostname} {self._port} {self._service} {self._protocol}'
+        return f'{self.ip} {self._hostname} {self._port} {self._service} {self._protocol}'
 
     def __lt__(self, other: 'Socket'):
         return self.ip < other.ip
 
     def __eq__(self, other: 'Socket'):
-        return self.ip == other.ip and self.port == other.port and self.protocol == other.protocol
+        if not isinstance(other, Socket):
+            return NotImplemented
+        return (
+            self._hash == other._hash
+            and self._packed_ip == other._packed_ip
+            and self._port == other._port
+            and self._protocol == other._protocol
+        )
 
     def __hash__(self):
-        return hash((self.ip, self.port, self.protocol))
+        return self._hash
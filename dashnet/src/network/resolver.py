@@ -0,0 +1,280 @@
+
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+from collections import deque
+
+from common.timing import TIMINGS
+
+
+class ExpiringLruCache:
+    """
+    size bounded least-recently-used cache whose entries expire after a ttl,
+    failed lookups are kept with their own (usually shorter) ttl
+    """
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        """
+        returns the cached value or raises KeyError when absent or expired
+        """
+        with self._lock:
+            try:
+                value, expires_at = self._entries[key]
+            except KeyError:
+                self._misses += 1
+                raise
+            if expires_at < time.time():
+                del self._entries[key]
+                self._misses += 1
+                raise KeyError(key)
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key, value, negative=False, expires_at: float = None) -> None:
+        if expires_at is None:
+            expires_at = time.time() + (self._negative_ttl if negative else self._ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def items(self) -> [tuple]:
+        now = time.time()
+        with self._lock:
+            return [(key, value, expires_at) for key, (value, expires_at) in self._entries.items() if expires_at >= now]
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'hits': self._hits,
+            'misses': self._misses,
+            'evictions': self._evictions,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ServiceTable:
+    """
+    port to service name table loaded once from the services database
+    """
+    SERVICES_PATH = '/etc/services'
+
+    def __init__(self, path: str = SERVICES_PATH):
+        self._path = path
+        self._by_port_protocol = {}
+        self._by_port = {}
+        self._load()
+
+    def get(self, port: str, protocol: str) -> str:
+        try:
+            number = int(port)
+        except (TypeError, ValueError):
+            return port
+        try:
+            return self._by_port_protocol[(number, protocol)]
+        except KeyError:
+            return self._by_port.get(number, port)
+
+    def _load(self) -> None:
+        try:
+            with open(self._path) as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            fields = line.partition('#')[0].split()
+            if len(fields) < 2:
+                continue
+            port, _, protocol = fields[1].partition('/')
+            try:
+                number = int(port)
+            except ValueError:
+                continue
+            # the first entry wins, as with getservbyport
+            self._by_port_protocol.setdefault((number, protocol), fields[0])
+            self._by_port.setdefault(number, fields[0])
+
+    def __len__(self):
+        return len(self._by_port_protocol)
+
+
+class ReverseDnsPool:
+    """
+    bounded pool of daemon threads running the blocking reverse lookups,
+    so that the name service switch (/etc/hosts, /etc/resolv.conf) is honoured
+    while the collection path never waits on a PTR query
+    """
+    WORKERS = 8
+    MAX_IN_FLIGHT = 256
+
+    def __init__(self, on_answer, workers: int = WORKERS, max_in_flight: int = MAX_IN_FLIGHT):
+        self._on_answer = on_answer
+        self._workers = workers
+        self._max_in_flight = max_in_flight
+        self._queue = queue.Queue()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def submit(self, ip: str) -> bool:
+        """
+        queues a lookup unless it is already queued or the in-flight cap is reached
+        """
+        with self._lock:
+            if ip in self._in_flight:
+                return True
+            if len(self._in_flight) >= self._max_in_flight:
+                return False
+            self._in_flight.add(ip)
+            self._start_workers()
+        self._queue.put(ip)
+        return True
+
+    def _start_workers(self) -> None:
+        while len(self._threads) < self._workers:
+            thread = threading.Thread(daemon=True, target=self._work, name=f'rdns-{len(self._threads)}')
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self) -> None:
+        while True:
+            ip = self._queue.get()
+            try:
+                with TIMINGS.stage('dns.lookup'):
+                    hostname = socket.gethostbyaddr(ip)[0]
+            except OSError:
+                hostname = None
+            self._on_answer(ip, hostname)
+            with self._lock:
+                self._in_flight.discard(ip)
+
+
+class NameResolver:
+    """
+    process wide ip to hostname and port to service resolution,
+    survives refreshes and optionally restarts through a warm-start file.
+    reverse lookups run in the background: until an answer arrives the ip is returned
+    """
+    TTL = 3600
+    NEGATIVE_TTL = 300
+    MAX_HOSTNAMES = 65536
+    # the latest answers, for the lists kept in hostname order to move only the connections they renamed
+    ANSWER_LOG = 1 << 12
+
+    def __init__(
+            self,
+            warm_start_path: str = None,
+            ttl: float = TTL,
+            negative_ttl: float = NEGATIVE_TTL,
+            max_size: int = MAX_HOSTNAMES,
+            services: ServiceTable = None,
+            max_in_flight: int = ReverseDnsPool.MAX_IN_FLIGHT
+    ):
+        self._hostnames = ExpiringLruCache(max_size, ttl, negative_ttl)
+        self._services = services if services else ServiceTable()
+        self._pool = ReverseDnsPool(self._on_answer, max_in_flight=max_in_flight)
+        self._answers = 0
+        self._answers_lock = threading.Lock()
+        self._answer_log = deque(maxlen=self.ANSWER_LOG)
+        self._warm_start_path = warm_start_path
+        self._load_warm_start()
+
+    @property
+    def answers(self) -> int:
+        """
+        number of lookups completed so far, grows whenever cached hostnames changed
+        """
+        return self._answers
+
+    def hostname(self, ip: str) -> str:
+        try:
+            return self._hostnames.get(ip)
+        except KeyError:
+            self._pool.submit(ip)
+            return ip
+
+    def _on_answer(self, ip: str, hostname: str) -> None:
+        if hostname:
+            self._hostnames.put(ip, hostname)
+        else:
+            self._hostnames.put(ip, ip, negative=True)
+        # answers arrive on every worker thread
+        with self._answers_lock:
+            self._answers += 1
+            self._answer_log.append((self._answers, ip))
+
+    def answered_since(self, since: int, until: int) -> {str}:
+        """
+        the ips of the answers counted after since and up to until, None when the oldest of them are forgotten
+        """
+        with self._answers_lock:
+            if since >= until:
+                return set()
+            if not self._answer_log or self._answer_log[0][0] > since + 1:
+                return None
+            return {ip for count, ip in self._answer_log if since < count <= until}
+
+    def service(self, port: str, protocol: str) -> str:
+        return self._services.get(port, protocol)
+
+    @property
+    def stats(self) -> dict:
+        return {**self._hostnames.stats, 'in_flight': self._pool.in_flight}
+
+    def save(self) -> None:
+        """
+        writes the live hostname entries to the warm-start file, if one is configured
+        """
+        if not self._warm_start_path:
+            return
+        entries = [[ip, hostname, expires_at] for ip, hostname, expires_at in self._hostnames.items()]
+        tmp_path = f'{self._warm_start_path}.tmp'
+        try:
+            directory = os.path.dirname(self._warm_start_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self._warm_start_path)
+        except OSError:
+            pass
+
+    def _load_warm_start(self) -> None:
+        if not self._warm_start_path:
+            return
+        try:
+            with open(self._warm_start_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for entry in entries:
+            try:
+                ip, hostname, expires_at = entry
+            except (TypeError, ValueError):
+                continue
+            if expires_at > now:
+                self._hostnames.put(ip, hostname, expires_at=expires_at)
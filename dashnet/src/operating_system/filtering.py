@@ -0,0 +1,430 @@
+
+import ipaddress
+import re
+from collections import OrderedDict
+from collections import defaultdict
+from fnmatch import fnmatchcase
+from typing import Pattern
+
+from network.connection import IPV6_FLAG
+from network.connection import ProcessIface
+from network.connection import Socket
+from network.connection import format_ip
+from network.connection import pack_ip
+
+
+class QueryError(ValueError):
+    pass
+
+
+class FilteredSockets:
+    """
+    read-only view of some connections of a snapshot, given by their (local, remote) keys,
+    along with their local and remote sockets. the snapshot itself is left untouched
+    """
+    def __init__(self, open_sockets: 'LocalRemoteSockets', connection_keys):
+        self._open_sockets = open_sockets
+        self._connections = {}
+        self._local_sockets = {}
+        self._remote_sockets = {}
+        all_connections = open_sockets.connections
+        all_locals = open_sockets.locals
+        all_remotes = open_sockets.remotes
+        for key in connection_keys:
+            lsock, rsock = key
+            self._connections[key] = all_connections[key]
+            if lsock:
+                self._local_sockets[lsock] = all_locals[lsock]
+            if rsock:
+                self._remote_sockets[rsock] = all_remotes[rsock]
+
+    @property
+    def locals(self):
+        return self._local_sockets
+
+    @property
+    def remotes(self):
+        return self._remote_sockets
+
+    @property
+    def connections(self):
+        return self._connections
+
+    @property
+    def rates(self):
+        # those of the snapshot, the connections left out of the view are skipped by their users
+        return self._open_sockets.rates
+
+    @property
+    def names_generation(self) -> int:
+        return self._open_sockets.names_generation
+
+
+class RegexFilter:
+    """
+    filters snapshots with a regex searched in a line describing each connection.
+    results are memoized per connection and per pattern, so a new snapshot only searches its new connections;
+    they are dropped when hostnames change since those are part of the line
+    """
+    MAX_PATTERNS = 8
+
+    def __init__(self):
+        self._memos = OrderedDict()
+        self._names_generation = None
+
+    def view(self, open_sockets: 'LocalRemoteSockets', pattern: Pattern) -> FilteredSockets:
+        if open_sockets.names_generation != self._names_generation:
+            self._names_generation = open_sockets.names_generation
+            self._memos.clear()
+        previous = self._memos.pop(pattern, {})
+        # only the connections of this snapshot are remembered
+        memo = {}
+
+        matching = []
+        for (lsock, rsock), pi in open_sockets.connections.items():
+            key = (lsock, rsock, pi)
+            result = previous.get(key)
+            if result is None:
+                result = self.match_line(pattern, lsock, rsock, pi)
+            memo[key] = result
+            if result:
+                matching.append((lsock, rsock))
+        view = FilteredSockets(open_sockets, matching)
+        self._memos[pattern] = memo
+        while len(self._memos) > self.MAX_PATTERNS:
+            self._memos.popitem(last=False)
+        return view
+
+    @staticmethod
+    def match_line(re_pattern: Pattern, lsock: Socket, rsock: Socket, pi: ProcessIface) -> bool:
+        line = (
+            f'{pi.process} '
+            f'{pi.iface if pi.iface else ""} '
+            f'{str(lsock)if lsock else ""} '
+            f'{str(rsock)if rsock else ""}'
+        )
+        return bool(re_pattern.search(line))
+
+
+class ConnectionIndex:
+    """
+    hash indexes of the connections by process, packed addresses, ports, protocol and interface, kept across
+    snapshots: built on the first field query, then following the snapshot deltas unless more than REBUILD_SHARE
+    of the connections change at once. rows are referred to by a number given as they are added, so that
+    selections keep the order the connections appeared in. processes and protocols are indexed casefolded
+    """
+    FIELDS = ('proc', 'lip', 'lport', 'rip', 'rport', 'proto', 'iface')
+    CASEFOLDED_FIELDS = ('proc', 'proto')
+    REBUILD_SHARE = 0.25
+
+    def __init__(self):
+        self._names_generation = None
+        self._rows = {}
+        self._row_of = {}
+        self._next_row = 0
+        self._by_field = {}
+
+    def apply(self, connections_delta: 'MapDelta') -> None:
+        """
+        follows a snapshot delta, keyed as SnapshotStore.connection_key, once the index is in use
+        """
+        if self._names_generation is None:
+            return
+        if len(connections_delta.added) + len(connections_delta.removed) + len(connections_delta.changed) > (
+                self.REBUILD_SHARE * len(self._rows)
+        ):
+            self._names_generation = None
+            return
+        for lsock, rsock, _ in connections_delta.removed:
+            self._remove(self._row_of.pop((lsock, rsock)))
+        for (lsock, rsock, _), (_, pi) in connections_delta.changed.items():
+            row = self._row_of[(lsock, rsock)]
+            self._remove(row)
+            self._add(row, lsock, rsock, pi)
+        for (lsock, rsock, _), pi in connections_delta.added.items():
+            self._insert(lsock, rsock, pi)
+
+    def sync(self, open_sockets: 'LocalRemoteSockets') -> None:
+        """
+        brings the index to the snapshot the deltas led to. the rows kept from earlier snapshots hold their
+        sockets, those of the ips answered since are taken again from the snapshot for their hostnames
+        """
+        if self._names_generation is None:
+            self._build(open_sockets)
+        elif open_sockets.names_generation != self._names_generation:
+            answered = open_sockets.answered_since(self._names_generation)
+            if answered is None:
+                self._build(open_sockets)
+            elif answered:
+                answered = {pack_ip(ip) for ip in answered}
+                for (lsock, rsock), pi in open_sockets.connections.items():
+                    if (lsock and lsock.packed_ip in answered) or (rsock and rsock.packed_ip in answered):
+                        self._rows[self._row_of[(lsock, rsock)]] = (lsock, rsock, pi)
+        self._names_generation = open_sockets.names_generation
+
+    def values(self, field: str) -> {str: {int}}:
+        """
+        value -> rows holding it
+        """
+        return self._by_field[field]
+
+    def all(self) -> {int}:
+        return set(self._rows)
+
+    def keys(self, rows: {int}) -> [tuple]:
+        return [self._rows[row][:2] for row in sorted(rows)]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _build(self, open_sockets: 'LocalRemoteSockets') -> None:
+        self._rows = {}
+        self._row_of = {}
+        self._by_field = {field: defaultdict(set) for field in self.FIELDS}
+        by_proc, by_lip, by_lport, by_rip, by_rport, by_proto, by_iface = (
+            self._by_field[field] for field in self.FIELDS
+        )
+        rows = self._rows
+        row_of = self._row_of
+        row = self._next_row
+        for key, pi in open_sockets.connections.items():
+            lsock, rsock = key
+            rows[row] = (lsock, rsock, pi)
+            row_of[key] = row
+            by_proc[pi.process.casefold()].add(row)
+            by_iface[pi.iface if pi.iface else ''].add(row)
+            if lsock:
+                by_lip[lsock.packed_ip].add(row)
+                by_lport[lsock.port].add(row)
+            if rsock:
+                by_rip[rsock.packed_ip].add(row)
+                by_rport[rsock.port].add(row)
+            sock = lsock if lsock else rsock
+            if sock:
+                by_proto[sock.protocol.casefold()].add(row)
+            row += 1
+        self._next_row = row
+
+    def _insert(self, lsock: Socket, rsock: Socket, pi: ProcessIface) -> None:
+        row = self._row_of[(lsock, rsock)] = self._next_row
+        self._next_row += 1
+        self._add(row, lsock, rsock, pi)
+
+    def _add(self, row: int, lsock: Socket, rsock: Socket, pi: ProcessIface) -> None:
+        self._rows[row] = (lsock, rsock, pi)
+        for field, value in self._values(lsock, rsock, pi):
+            self._by_field[field][value].add(row)
+
+    def _remove(self, row: int) -> None:
+        for field, value in self._values(*self._rows.pop(row)):
+            by_value = self._by_field[field]
+            rows = by_value[value]
+            rows.discard(row)
+            if not rows:
+                del by_value[value]
+
+    @staticmethod
+    def _values(lsock: Socket, rsock: Socket, pi: ProcessIface):
+        yield 'proc', pi.process.casefold()
+        yield 'iface', pi.iface if pi.iface else ''
+        if lsock:
+            yield 'lip', lsock.packed_ip
+            yield 'lport', lsock.port
+        if rsock:
+            yield 'rip', rsock.packed_ip
+            yield 'rport', rsock.port
+        sock = lsock if lsock else rsock
+        if sock:
+            yield 'proto', sock.protocol.casefold()
+
+
+class FieldPredicate:
+    """
+    field:value, ip fields also take a network in CIDR notation, the others shell style wildcards.
+    proc and proto ignore case
+    """
+    IP_FIELDS = ('lip', 'rip')
+    # ::ffff:0:0/96
+    IPV4_MAPPED = IPV6_FLAG | 0xffff << 32
+    IPV4_MAPPED_MASK = IPV6_FLAG | ((1 << 128) - 1) ^ 0xffffffff
+
+    def __init__(self, field: str, value: str):
+        if field not in ConnectionIndex.FIELDS:
+            raise QueryError(f'unknown field {field}')
+        if not value:
+            raise QueryError(f'no value for {field}')
+        self._field = field
+        self._value = value
+        self._network = None
+        self._wildcard = any(c in value for c in '*?[')
+        if field in ConnectionIndex.CASEFOLDED_FIELDS:
+            self._value = value.casefold()
+        if field in self.IP_FIELDS and not self._wildcard:
+            if '/' in value:
+                try:
+                    network = ipaddress.ip_network(value, strict=False)
+                except ValueError as e:
+                    raise QueryError(str(e))
+                flag = IPV6_FLAG if network.version == 6 else 0
+                # (mask, network) over packed addresses, the mask always covers the family flag
+                self._network = (int(network.netmask) | IPV6_FLAG, int(network.network_address) | flag)
+            else:
+                self._value = pack_ip(value)
+
+    def select(self, index: ConnectionIndex) -> {int}:
+        by_value = index.values(self._field)
+        if self._network:
+            return set().union(*(
+                positions for value, positions in by_value.items() if self._in_network(value)
+            ))
+        if self._wildcard:
+            format_value = format_ip if self._field in self.IP_FIELDS else str
+            return set().union(*(
+                positions for value, positions in by_value.items() if fnmatchcase(format_value(value), self._value)
+            ))
+        return by_value.get(self._value, set())
+
+    def _in_network(self, packed) -> bool:
+        if packed.__class__ is str:
+            return False
+        if packed & self.IPV4_MAPPED_MASK == self.IPV4_MAPPED:
+            packed &= 0xffffffff
+        mask, network = self._network
+        return packed & mask == network
+
+    def __repr__(self):
+        value = format_ip(self._value) if self._field in self.IP_FIELDS else self._value
+        return f'{self._field}:{value}'
+
+
+class Not:
+    def __init__(self, operand):
+        self._operand = operand
+
+    def select(self, index: ConnectionIndex) -> {int}:
+        return index.all() - self._operand.select(index)
+
+    def __repr__(self):
+        return f'not {self._operand}'
+
+
+class And:
+    def __init__(self, operands: list):
+        self._operands = operands
+
+    def select(self, index: ConnectionIndex) -> {int}:
+        selections = sorted((operand.select(index) for operand in self._operands), key=len)
+        return selections[0].intersection(*selections[1:])
+
+    def __repr__(self):
+        return '(' + ' and '.join(map(repr, self._operands)) + ')'
+
+
+class Or:
+    def __init__(self, operands: list):
+        self._operands = operands
+
+    def select(self, index: ConnectionIndex) -> {int}:
+        return set().union(*(operand.select(index) for operand in self._operands))
+
+    def __repr__(self):
+        return '(' + ' or '.join(map(repr, self._operands)) + ')'
+
+
+class FieldQuery:
+    """
+    field predicates combined with and, or, not and parentheses, adjacent predicates are and-ed:
+        proc:nginx rport:443
+        rip:10.0.0.0/8 and not (proto:udp or iface:lo)
+    queries are answered from the snapshot's indexes, touching only the rows they select
+    """
+    TOKEN = re.compile(r'\(|\)|[^\s()]+')
+    FIELD_TOKEN = re.compile(r'(?:' + '|'.join(ConnectionIndex.FIELDS) + r'):', re.IGNORECASE)
+
+    def __init__(self, text: str, root):
+        self._text = text
+        self._root = root
+
+    @classmethod
+    def parse(cls, text: str) -> 'FieldQuery':
+        """
+        returns None when the text holds no field predicate, it is then taken as a plain regex
+        """
+        tokens = cls.TOKEN.findall(text)
+        if not any(cls.FIELD_TOKEN.match(token) for token in tokens):
+            return None
+        parser = _QueryParser(tokens)
+        root = parser.parse()
+        return cls(text, root)
+
+    def view(self, open_sockets: 'LocalRemoteSockets', index: ConnectionIndex) -> FilteredSockets:
+        """
+        the connections of the snapshot selected through the index following its deltas
+        """
+        index.sync(open_sockets)
+        return FilteredSockets(open_sockets, index.keys(self._root.select(index)))
+
+    def __repr__(self):
+        return repr(self._root)
+
+
+class _QueryParser:
+    """
+    query := or_expr
+    or_expr := and_expr ('or' and_expr)*
+    and_expr := not_expr (['and'] not_expr)*
+    not_expr := 'not' not_expr | '(' or_expr ')' | field ':' value
+    """
+    def __init__(self, tokens: [str]):
+        self._tokens = tokens
+        self._position = 0
+
+    def parse(self):
+        root = self._or_expr()
+        if self._peek() is not None:
+            raise QueryError(f'unexpected {self._peek()}')
+        return root
+
+    def _peek(self) -> str:
+        return self._tokens[self._position] if self._position < len(self._tokens) else None
+
+    def _next(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise QueryError('incomplete query')
+        self._position += 1
+        return token
+
+    def _is_keyword(self, keyword: str) -> bool:
+        token = self._peek()
+        return token is not None and token.lower() == keyword
+
+    def _or_expr(self):
+        operands = [self._and_expr()]
+        while self._is_keyword('or'):
+            self._next()
+            operands.append(self._and_expr())
+        return operands[0] if len(operands) == 1 else Or(operands)
+
+    def _and_expr(self):
+        operands = [self._not_expr()]
+        while self._peek() is not None and self._peek() != ')' and not self._is_keyword('or'):
+            if self._is_keyword('and'):
+                self._next()
+            operands.append(self._not_expr())
+        return operands[0] if len(operands) == 1 else And(operands)
+
+    def _not_expr(self):
+        if self._is_keyword('not'):
+            self._next()
+            return Not(self._not_expr())
+        token = self._next()
+        if token == '(':
+            expr = self._or_expr()
+            if self._next() != ')':
+                raise QueryError('missing )')
+            return expr
+        field, colon, value = token.partition(':')
+        if not colon:
+            raise QueryError(f'expected field:value, got {token}')
+        return FieldPredicate(field.lower(), value)
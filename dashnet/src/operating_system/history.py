@@ -0,0 +1,268 @@
+import heapq
+import math
+import threading
+from array import array
+from collections import deque
+
+from network.resolver import NameResolver
+from operating_system.linux import LocalRemoteSockets
+from operating_system.linux import Rate
+from operating_system.netdev import DeviceCounters
+
+SPARK_BARS = ' ▁▂▃▄▅▆▇█'
+# the counters of an interface with no rate yet
+NO_COUNTERS = (math.nan,) * len(DeviceCounters._fields)
+
+
+class ValueTable:
+    """
+    dictionary encoding of the history: each socket and process/interface pair is kept once
+    and stored as its index, the strings they hold are shared already. code 0 stands for None
+    """
+    # a socket with its packed address, its dict entry and its code, as measured with tracemalloc
+    ENTRY_BYTES = 280
+
+    def __init__(self):
+        self._codes = {}
+        self._values = [None]
+
+    @property
+    def bytes(self) -> int:
+        return len(self._values) * self.ENTRY_BYTES
+
+    def code(self, value) -> int:
+        if value is None:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._values)
+            self._values.append(value)
+        return code
+
+    def value(self, code: int):
+        return self._values[code]
+
+    def __len__(self):
+        return len(self._values) - 1
+
+
+class _Snapshot:
+    """
+    one snapshot of the history: its connections as ROW_CODES codes each, the rows moving data with their
+    RATE_VALUES rates each and the interfaces as codes with DEVICE_VALUES counters each, nan for one with no rate yet
+    """
+    __slots__ = ('taken_at', 'rows', 'rate_rows', 'rate_values', 'device_codes', 'device_values')
+    # local socket, remote socket, process/interface
+    ROW_CODES = 3
+    RATE_VALUES = len(Rate._fields)
+    DEVICE_VALUES = len(DeviceCounters._fields)
+    # the object, its float, its arrays and its place in the deque, as measured with tracemalloc
+    OVERHEAD_BYTES = 560
+
+    def __init__(
+            self, taken_at: float, rows: array, rate_rows: array, rate_values: array, device_codes: array,
+            device_values: array
+    ):
+        self.taken_at = taken_at
+        self.rows = rows
+        self.rate_rows = rate_rows
+        self.rate_values = rate_values
+        self.device_codes = device_codes
+        self.device_values = device_values
+
+    @property
+    def bytes(self) -> int:
+        return self.OVERHEAD_BYTES + sum(
+            len(values) * values.itemsize
+            for values in (self.rows, self.rate_rows, self.rate_values, self.device_codes, self.device_values)
+        )
+
+
+class _Interval:
+    """
+    the most connections seen per process and per remote address during one interval of the history
+    """
+    __slots__ = ('start', 'by_process', 'by_remote')
+
+    def __init__(self, start: float):
+        self.start = start
+        self.by_process = {}
+        self.by_remote = {}
+
+    def add(self, by_process: {str: int}, by_remote: {int: int}, top: int) -> None:
+        """
+        only the busiest keys are kept, so a key leaving them is forgotten
+        """
+        for peaks, counts in ((self.by_process, by_process), (self.by_remote, by_remote)):
+            for key, count in self._top(counts, top).items():
+                if count > peaks.get(key, 0):
+                    peaks[key] = count
+        self.by_process = self._top(self.by_process, top)
+        self.by_remote = self._top(self.by_remote, top)
+
+    @staticmethod
+    def _top(peaks: {str: int}, top: int) -> {str: int}:
+        if len(peaks) <= top:
+            return peaks
+        return dict(heapq.nlargest(top, peaks.items(), key=lambda item: item[1]))
+
+
+class SnapshotHistory:
+    """
+    the snapshots of the last HISTORY_SECONDS, dictionary encoded into arrays and dropped oldest first beyond
+    MAX_BYTES, which counts all they hold, and the connection counts per process and per remote address over the last HISTORY_SECONDS,
+    as their peak per INTERVAL_SECONDS for the TOP_COUNTS busiest keys. remote addresses are packed (see pack_ip).
+    snapshots are added by the collector and read back by the enrichment stage
+    """
+    MAX_BYTES = 128 << 20
+    HISTORY_SECONDS = 600
+    INTERVAL_SECONDS = 5
+    TOP_COUNTS = 100
+    SPARK_WIDTH = 12
+
+    def __init__(self, max_bytes: int = MAX_BYTES, history_seconds: int = HISTORY_SECONDS):
+        self._max_bytes = max_bytes
+        self._max_values_bytes = max_bytes * 3 // 4
+        # a compaction keeps the values of the latest snapshots up to this many bytes, so the next one is far off
+        self._compacted_values_bytes = self._max_values_bytes // 2
+        self._history_seconds = history_seconds
+        self._lock = threading.Lock()
+        self._values = ValueTable()
+        self._snapshots = deque()
+        self._snapshot_bytes = 0
+        self._intervals = deque(maxlen=history_seconds // self.INTERVAL_SECONDS)
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    @property
+    def bytes(self) -> int:
+        return self._snapshot_bytes + self._values.bytes
+
+    def add(self, open_sockets: LocalRemoteSockets) -> None:
+        with self._lock:
+            snapshot, by_process, by_remote = self._encode(open_sockets)
+            self._snapshots.append(snapshot)
+            self._snapshot_bytes += snapshot.bytes
+            self._aggregate(snapshot.taken_at, by_process, by_remote)
+            self._trim()
+
+    def restore(self, back: int, name_resolver: NameResolver) -> LocalRemoteSockets:
+        """
+        the snapshot added back snapshots before the latest one, or the oldest one kept
+        """
+        with self._lock:
+            snapshot = self._snapshots[-1 - min(back, len(self._snapshots) - 1)]
+            value = self._values.value
+            rows = iter(snapshot.rows)
+            keys = [(value(lsock), value(rsock)) for lsock, rsock, _ in zip(rows, rows, rows)]
+            connections = dict(zip(keys, map(value, snapshot.rows[2::_Snapshot.ROW_CODES])))
+            width = _Snapshot.RATE_VALUES
+            values = snapshot.rate_values
+            rates = {
+                keys[row]: Rate(*values[i * width:(i + 1) * width]) for i, row in enumerate(snapshot.rate_rows)
+            }
+            width = _Snapshot.DEVICE_VALUES
+            values = snapshot.device_values
+            devices = {}
+            for i, code in enumerate(snapshot.device_codes):
+                counters = values[i * width:(i + 1) * width]
+                devices[value(code)] = None if math.isnan(counters[0]) else DeviceCounters(*counters)
+        return LocalRemoteSockets.restore(connections, rates, devices, snapshot.taken_at, name_resolver)
+
+    def trends(self, until: float) -> ({str: str}, {str: str}):
+        """
+        sparklines of the connections per process and per remote address over the last SPARK_WIDTH intervals
+        up to the given time, each scaled to its own peak
+        """
+        with self._lock:
+            intervals = [interval for interval in self._intervals if interval.start <= until][-self.SPARK_WIDTH:]
+        return (
+            self._sparklines([interval.by_process for interval in intervals]),
+            self._sparklines([interval.by_remote for interval in intervals])
+        )
+
+    def _encode(self, open_sockets: LocalRemoteSockets) -> (_Snapshot, {str: int}, {int: int}):
+        code = self._values.code
+        codes = []
+        by_process = {}
+        by_remote = {}
+        for (lsock, rsock), pi in open_sockets.connections.items():
+            codes += (code(lsock), code(rsock), code(pi))
+            by_process[pi.process] = by_process.get(pi.process, 0) + 1
+        rows = array('I', codes)
+        for rsock in open_sockets.remotes:
+            by_remote[rsock.packed_ip] = by_remote.get(rsock.packed_ip, 0) + 1
+        rate_rows = []
+        rate_values = []
+        if open_sockets.rates:
+            all_rates = open_sockets.rates
+            for row, key in enumerate(open_sockets.connections):
+                rate = all_rates.get(key)
+                if rate:
+                    rate_rows.append(row)
+                    rate_values += rate
+        device_codes = []
+        device_values = []
+        for iface, counters in (open_sockets.devices or {}).items():
+            device_codes.append(code(iface))
+            device_values += counters if counters is not None else NO_COUNTERS
+        snapshot = _Snapshot(
+            open_sockets.taken_at, rows, array('I', rate_rows), array('d', rate_values), array('I', device_codes),
+            array('d', device_values)
+        )
+        return snapshot, by_process, by_remote
+
+    def _aggregate(self, taken_at: float, by_process: {str: int}, by_remote: {int: int}) -> None:
+        interval = self._intervals[-1] if self._intervals else None
+        if interval is None or taken_at >= interval.start + self.INTERVAL_SECONDS:
+            interval = _Interval(taken_at - taken_at % self.INTERVAL_SECONDS)
+            self._intervals.append(interval)
+        interval.add(by_process, by_remote, self.TOP_COUNTS)
+
+    def _trim(self) -> None:
+        """
+        drops the snapshots older than the history and the oldest ones beyond the memory cap, the latest is always
+        kept. values no longer used by any snapshot are dropped when they take more than three quarters of it
+        """
+        since = self._snapshots[-1].taken_at - self._history_seconds
+        while len(self._snapshots) > 1 and self._snapshots[0].taken_at < since:
+            self._snapshot_bytes -= self._snapshots.popleft().bytes
+        if self._values.bytes > self._max_values_bytes:
+            self._compact()
+        while len(self._snapshots) > 1 and self.bytes > self._max_bytes:
+            self._snapshot_bytes -= self._snapshots.popleft().bytes
+
+    def _compact(self) -> None:
+        """
+        encodes the latest snapshots again in a new table, until their values take half of the values' share of the
+        cap: the older ones are dropped and the table has room for many refreshes before it is compacted again
+        """
+        values = ValueTable()
+        value = self._values.value
+        code = values.code
+        kept = []
+        for snapshot in reversed(self._snapshots):
+            if kept and values.bytes > self._compacted_values_bytes:
+                break
+            snapshot.rows = array('I', [code(value(old)) for old in snapshot.rows])
+            snapshot.device_codes = array('I', [code(value(old)) for old in snapshot.device_codes])
+            kept.append(snapshot)
+        self._snapshots = deque(reversed(kept))
+        self._snapshot_bytes = sum(snapshot.bytes for snapshot in kept)
+        self._values = values
+
+    @staticmethod
+    def _sparklines(peaks_by_interval: [{str: int}]) -> {str: str}:
+        keys = set()
+        for peaks in peaks_by_interval:
+            keys.update(peaks)
+        sparklines = {}
+        top = len(SPARK_BARS) - 1
+        for key in keys:
+            counts = [peaks.get(key, 0) for peaks in peaks_by_interval]
+            peak = max(counts)
+            sparklines[key] = ''.join(
+                SPARK_BARS[max(1, round(count * top / peak)) if count else 0] for count in counts
+            )
+        return sparklines
@@ -3,13 +3,21 @@ import errno
 import os
 import re
 import subprocess
+import sys
+import time
+from collections import deque
+from collections import namedtuple
 from typing import Dict
-from typing import Pattern
-
-from proc import core as proclib_core
-import psutil
 
+from common.timing import TIMINGS
 from network.connection import Socket, ProcessIface
+from network.resolver import NameResolver
+from operating_system.netdev import DeviceStats
+from operating_system.procnet import ProcNetCollector
+from operating_system.procnet import PsutilCollector
+from operating_system.routing import PolicyRules
+from operating_system.sockdiag import NetlinkCollector
+from operating_system.routing import RouteTable
 
 LOCALHOST_ADDRESSES = [
     '127.0.0.1',
@@ -17,13 +25,18 @@ LOCALHOST_ADDRESSES = [
     '::ffff:127.0.0.1'
 ]
 
+# bytes and segments per second
+Rate = namedtuple('Rate', ['sent', 'received', 'segs_out', 'segs_in'])
+NO_RATE = Rate(0, 0, 0, 0)
+
 
 class TrafficByProcess:
     """
-    holds a dict of number of connections by process
+    holds a dict of number of connections by process,
+    counted from a snapshot or maintained from the deltas between snapshots
     """
-    def __init__(self, open_sockets: 'LocalRemoteSockets'):
-        self._local_sockets = open_sockets.locals
+    def __init__(self, open_sockets: 'LocalRemoteSockets' = None):
+        self._local_sockets = open_sockets.locals if open_sockets else {}
         self._connections_count = {}
         self._count()
         self._as_list = []
@@ -35,18 +48,38 @@ class TrafficByProcess:
                 self._as_list.append([process_name, count])
         return self._as_list
 
+    def apply(self, locals_delta: 'MapDelta') -> None:
+        for pi in locals_delta.removed.values():
+            self._decrement(pi.process)
+        for old_pi, new_pi in locals_delta.changed.values():
+            self._decrement(old_pi.process)
+            self._increment(new_pi.process)
+        for pi in locals_delta.added.values():
+            self._increment(pi.process)
+        self._as_list = []
+
     def _count(self) -> None:
         for local_socket, pi in self._local_sockets.items():
-            try:
-                count = self._connections_count[pi.process]
-                self._connections_count[pi.process] = count + 1
-            except KeyError:
-                self._connections_count[pi.process] = 1
+            self._increment(pi.process)
+
+    def _increment(self, process_name) -> None:
+        try:
+            count = self._connections_count[process_name]
+            self._connections_count[process_name] = count + 1
+        except KeyError:
+            self._connections_count[process_name] = 1
+
+    def _decrement(self, process_name) -> None:
+        count = self._connections_count[process_name]
+        if count > 1:
+            self._connections_count[process_name] = count - 1
+        else:
+            del self._connections_count[process_name]
 
 
 class TrafficByAddress:
-    def __init__(self, sockets: 'Dict[Socket]'):
-        self._sockets = sockets
+    def __init__(self, sockets: 'Dict[Socket]' = None):
+        self._sockets = sockets if sockets is not None else {}
         self._connections_count = {}
         self._count()
 
@@ -62,10 +95,21 @@ class TrafficByAddress:
             except KeyError:
                 self._connections_count[sock] = (pi.process, 1)
 
+    def apply(self, sockets_delta: 'MapDelta', sockets: 'Dict[Socket]') -> None:
+        self._sockets = sockets
+        for sock in sockets_delta.removed:
+            del self._connections_count[sock]
+        for sock, (_, pi) in sockets_delta.changed.items():
+            self._connections_count[sock] = (pi.process, 1)
+        for sock, pi in sockets_delta.added.items():
+            self._connections_count[sock] = (pi.process, 1)
+
     @property
     def as_list(self) -> [['Socket', str]]:
+        # the sockets of the latest snapshot carry the current hostnames
         as_list = []
-        for sock, (process_name, count) in self._connections_count.items():
+        for sock in self._sockets:
+            process_name, count = self._connections_count[sock]
             as_list.append([sock, count])
         return as_list
 
@@ -94,15 +138,121 @@ class AllConnections:
         return as_list
 
 
+class TcpRates:
+    """
+    per second rates of the tcp sockets, from a ring of the last samples of their kernel counters.
+    a socket is known by its (local, remote) addresses and its sock_diag cookie: a socket first seen,
+    or reusing the addresses of an earlier one, is counted from zero
+    """
+    # the rates are averaged over SAMPLES - 1 refreshes, each sample holds the counters of every tcp socket
+    SAMPLES = 2
+
+    def __init__(self, samples: int = SAMPLES):
+        self._samples = deque(maxlen=samples)
+
+    def update(self, counters: {tuple: 'TcpCounters'}, now: float) -> {tuple: Rate}:
+        """
+        adds a sample of the counters, and returns the non-zero rates since the oldest sample still in the ring
+        """
+        self._samples.append((now, counters))
+        rates = {}
+        then, earlier = self._samples[0]
+        seconds = now - then
+        if seconds <= 0:
+            return rates
+        for key, latest in counters.items():
+            first = earlier.get(key)
+            if first is None or first.cookie != latest.cookie:
+                sent, received, segs_out, segs_in = latest[1:]
+            else:
+                sent = latest.bytes_acked - first.bytes_acked
+                received = latest.bytes_received - first.bytes_received
+                segs_out = latest.segs_out - first.segs_out
+                segs_in = latest.segs_in - first.segs_in
+            if sent > 0 or received > 0:
+                rates[key] = Rate(sent / seconds, received / seconds, segs_out / seconds, segs_in / seconds)
+        return rates
+
+
+class Throughput:
+    """
+    the rates of the connections of a snapshot, or of a view of it, summed per process, local and remote socket
+    """
+    def __init__(self, open_sockets: 'LocalRemoteSockets'):
+        self._by_process = {}
+        self._by_local = {}
+        self._by_remote = {}
+        connections = open_sockets.connections
+        for key, rate in open_sockets.rates.items():
+            pi = connections.get(key)
+            if pi is None:
+                continue
+            lsock, rsock = key
+            self._add(self._by_process, pi.process, rate)
+            if lsock:
+                self._add(self._by_local, lsock, rate)
+            if rsock:
+                self._add(self._by_remote, rsock, rate)
+
+    @property
+    def by_process(self) -> {str: Rate}:
+        return self._by_process
+
+    @property
+    def by_local(self) -> {'Socket': Rate}:
+        return self._by_local
+
+    @property
+    def by_remote(self) -> {'Socket': Rate}:
+        return self._by_remote
+
+    @staticmethod
+    def _add(rates: dict, key, rate: Rate) -> None:
+        total = rates.get(key)
+        rates[key] = rate if total is None else Rate(*(a + b for a, b in zip(total, rate)))
+
+
 class LocalRemoteSockets:
-    def __init__(self):
-        self._process_loader = ProcessLoader()
-        self._connection_loader = ConnectionLoader()
+    def __init__(
+            self,
+            iface_resolver: 'IfaceResolver' = None,
+            name_resolver: NameResolver = None,
+            process_loader: 'ProcessLoader' = None,
+            connection_loader: 'ConnectionLoader' = None,
+            device_stats: DeviceStats = None
+    ):
+        self._process_loader = process_loader if process_loader else ProcessLoader()
+        self._connection_loader = connection_loader if connection_loader else ConnectionLoader()
+        self._device_stats = device_stats if device_stats else DeviceStats()
+        self._iface_resolver = iface_resolver if iface_resolver else IfaceResolver()
+        self._name_resolver = name_resolver if name_resolver else NameResolver()
         self._local_sockets = {}
         self._remote_sockets = {}
         self._connections = {}
-        self._ip_to_dns = {}
-        self._port_to_service = {}
+        self._rates = {}
+        self._devices = {}
+        self._taken_at = None
+        self._names_generation = 0
+
+    @classmethod
+    def restore(
+            cls, connections: dict, rates: {tuple: Rate}, devices: dict, taken_at: float, name_resolver: NameResolver
+    ) -> 'LocalRemoteSockets':
+        """
+        a snapshot of connections loaded earlier, named after the current answers of the name resolver
+        """
+        open_sockets = cls(name_resolver=name_resolver)
+        open_sockets._connections = connections
+        open_sockets._rates = rates
+        open_sockets._devices = devices
+        open_sockets._taken_at = taken_at
+        for (local_socket, remote_socket), pi in connections.items():
+            if remote_socket:
+                open_sockets._remote_sockets[remote_socket] = pi
+            if local_socket:
+                open_sockets._local_sockets[local_socket] = pi
+        open_sockets.resolve()
+        return open_sockets
 
     @property
     def locals(self):
@@ -116,31 +266,86 @@ class LocalRemoteSockets:
     def connections(self):
         return self._connections
 
+    @property
+    def rates(self) -> {tuple: Rate}:
+        """
+        the tcp connections moving data, by their (local, remote) keys
+        """
+        return self._rates
+
+    @property
+    def taken_at(self) -> float:
+        """
+        when the connections were loaded, as a unix time
+        """
+        return self._taken_at
+
+    @property
+    def devices(self) -> {str: 'DeviceCounters'}:
+        """
+        the per second rates of every interface, None for those that just appeared
+        """
+        return self._devices
+
+    @property
+    def names_generation(self) -> int:
+        """
+        the resolver's answer count when the hostnames were assigned, changes whenever they may differ
+        """
+        return self._names_generation
+
+    def answered_since(self, names_generation: int) -> {str}:
+        """
+        the ips whose hostname may have changed from the given names generation to that of the snapshot,
+        None when they are not all known
+        """
+        return self._name_resolver.answered_since(names_generation, self._names_generation)
+
     def load(self) -> 'LocalRemoteSockets':
-        self._process_loader.load()
-        self._connection_loader.load()
-        self._add_connections(self._connection_loader.tcps, ConnectionLoader.TCP)
-        self._add_connections(self._connection_loader.udps, ConnectionLoader.UDP)
+        self._taken_at = time.time()
+        self._names_generation = self._name_resolver.answers
+        with TIMINGS.stage('load.processes'):
+            self._process_loader.load()
+        with TIMINGS.stage('load.connections'):
+            self._connection_loader.load()
+        with TIMINGS.stage('load.routes'):
+            self._iface_resolver.refresh()
+        with TIMINGS.stage('load.devices'):
+            self._devices = self._device_stats.load().rates
+        with TIMINGS.stage('load.sockets'):
+            self._add_connections(self._connection_loader.tcps, ConnectionLoader.TCP)
+            self._add_connections(self._connection_loader.udps, ConnectionLoader.UDP)
+        if TIMINGS.enabled:
+            dns = self._name_resolver.stats
+            TIMINGS.gauge('sockets', len(self._connections))
+            TIMINGS.gauge('dns cache hits', dns['hits'])
+            TIMINGS.gauge('dns cache misses', dns['misses'])
+            TIMINGS.gauge('dns in flight', dns['in_flight'])
         return self
 
     def _add_connections(self, connections, protocol) -> None:
-        iface_resolver = IfaceResolver()
+        rates = self._connection_loader.rates if protocol == ConnectionLoader.TCP else {}
         for conn in connections:
             local_socket = None
             remote_socket = None
+            iface_name = None
             process_name = self._process_loader.get_name_for_pid(conn.pid)
-            pi = ProcessIface(process_name)
-            if conn.laddr:
-                local_socket = Socket(conn.laddr.ip, str(conn.laddr.port), protocol)
-                self._resolve(local_socket)
-                self._local_sockets[local_socket] = pi
             if conn.raddr:
-                remote_socket = Socket(conn.raddr.ip, str(conn.raddr.port), protocol)
+                remote_socket = Socket(conn.raddr.ip, conn.raddr.port, protocol)
                 self._resolve(remote_socket)
-                iface_name = iface_resolver.get_iface(remote_socket.ip)
-                pi.iface = iface_name
+                iface_name = self._iface_resolver.get_iface(conn.raddr.ip)
+            pi = ProcessIface.of(process_name, iface_name)
+            if remote_socket:
                 self._remote_sockets[remote_socket] = pi
+            if conn.laddr:
+                local_socket = Socket(conn.laddr.ip, conn.laddr.port, protocol)
+                self._resolve(local_socket)
+                self._local_sockets[local_socket] = pi
             self._connections[(local_socket, remote_socket)] = pi
+            if rates:
+                rate = rates.get((conn.laddr, conn.raddr))
+                if rate:
+                    self._rates[(local_socket, remote_socket)] = rate
 
     def filter_lsockets(self, socket_filter) -> None:
         for sock in list(filter(socket_filter, self._local_sockets)):
@@ -150,70 +355,82 @@ class LocalRemoteSockets:
         for sock in list(filter(socket_filter, self._remote_sockets)):
             del self._remote_sockets[sock]
 
-    def filter_by_regex(self, re_pattern: Pattern[str]):
-        for (lsock, rsock), pi in list(self._connections.items()):
-            if self._match_line(re_pattern, lsock, rsock, pi):
-                continue
-            try:
-                del self._local_sockets[lsock]
-            except KeyError:
-                pass
-            try:
-                del self._remote_sockets[rsock]
-            except KeyError:
-                pass
-            del self._connections[(lsock, rsock)]
-
-    @staticmethod
-    def _match_line(re_pattern: Pattern, lsock: Socket, rsock: Socket, pi: ProcessIface) -> bool:
-        line = (
-            f'{pi.process} '
-            f'{pi.iface if pi.iface else ""} '
-            f'{str(lsock)if lsock else ""} '
-            f'{str(rsock)if rsock else ""}'
-        )
-        return bool(re_pattern.search(line))
-
     @staticmethod
     def _localhost_filter(_socket) -> bool:
         return _socket.ip in LOCALHOST_ADDRESSES
 
     def resolve(self):
-        for local in self._local_sockets:
-            self._resolve(local)
-        for remote in self._remote_sockets:
-            self._resolve(remote)
+        """
+        names the sockets of every connection, equal sockets of several connections are distinct objects
+        """
+        self._names_generation = self._name_resolver.answers
+        for local_socket, remote_socket in self._connections:
+            if local_socket:
+                self._resolve(local_socket)
+            if remote_socket:
+                self._resolve(remote_socket)
 
     def _resolve(self, _socket) -> None:
-        try:
-            _socket.hostname = self._ip_to_dns[_socket.ip]
-        except KeyError:
-            _socket.resolve_dns()
-            self._ip_to_dns[_socket.ip] = _socket.hostname
-        try:
-            _socket.service = self._port_to_service[_socket.port]
-        except KeyError:
-            _socket.resolve_service()
-            self._port_to_service[_socket.port] = _socket.service
+        _socket.hostname = self._name_resolver.hostname(_socket.ip)
+        _socket.service = self._name_resolver.service(_socket.port, _socket.protocol)
 
 
 class ConnectionLoader:
+    """
+    loads the tcp and udp connections through one of the collectors,
+    the netlink collector falls back to the procfs one when sock_diag is unavailable.
+    with_rates also samples the kernel counters of the tcp sockets over sock_diag, whichever the collector,
+    there are no rates when it is unavailable
+    """
     TCP = 'tcp'
     UDP = 'udp'
     CLOSING_CONNECTION_STATES = ['FIN_WAIT1', 'FIN_WAIT2', 'TIME_WAIT']
-
-    def __init__(self):
-        self._connection_filter = lambda sconn: sconn.status.upper() not in self.CLOSING_CONNECTION_STATES
+    COLLECTORS = [ProcNetCollector.NAME, NetlinkCollector.NAME, PsutilCollector.NAME]
+
+    def __init__(self, collector: str = ProcNetCollector.NAME, proc_path: str = '/proc', with_rates: bool = False):
+        self._proc_path = proc_path
+        self._inodes = InodeLoader(proc_path)
+        self._with_rates = with_rates
+        self._collector = self._create_collector(collector)
+        self._counters_collector = None
+        self._tcp_rates = TcpRates()
         self._tcps = {}
         self._udps = {}
+        self._rates = {}
 
     def load(self):
-        self._tcps = {}
-        self._udps = {}
-        self._tcps = self._load(self.TCP)
-        self._udps = self._load(self.UDP)
+        try:
+            collected = self._collector.collect()
+        except OSError:
+            if not isinstance(self._collector, NetlinkCollector):
+                raise
+            self._collector.close()
+            self._collector = self._create_collector(ProcNetCollector.NAME)
+            collected = self._collector.collect()
+        self._tcps = collected[self.TCP]
+        self._udps = collected[self.UDP]
+        if self._with_rates:
+            self._rates = self._tcp_rates.update(self._counters(), time.monotonic())
         return self
 
+    def _counters(self) -> {tuple: 'TcpCounters'}:
+        if isinstance(self._collector, NetlinkCollector):
+            return self._collector.counters
+        try:
+            if self._counters_collector is None:
+                self._counters_collector = NetlinkCollector(self.CLOSING_CONNECTION_STATES, self._inodes)
+            return self._counters_collector.collect_counters()
+        except OSError:
+            return {}
+
+    @property
+    def inodes(self) -> 'InodeLoader':
+        return self._inodes
+
+    @property
+    def collector(self) -> str:
+        return self._collector.NAME
+
     @property
     def tcps(self):
         return self._tcps
@@ -222,72 +439,281 @@ class ConnectionLoader:
     def udps(self):
         return self._udps
 
-    def _load(self, protocol):
-        net_conns = psutil.net_connections(protocol)
-        return net_conns if not self._connection_filter else list(filter(self._connection_filter, net_conns))
+    @property
+    def rates(self) -> {tuple: Rate}:
+        """
+        the non-zero rates of the tcp connections, by their (local, remote) addresses
+        """
+        return self._rates
+
+    def _create_collector(self, name: str):
+        if name == PsutilCollector.NAME:
+            return PsutilCollector(self.CLOSING_CONNECTION_STATES)
+        if name == NetlinkCollector.NAME:
+            try:
+                return NetlinkCollector(self.CLOSING_CONNECTION_STATES, self._inodes, self._with_rates)
+            except OSError:
+                pass
+        return ProcNetCollector(self.CLOSING_CONNECTION_STATES, self._inodes, self._proc_path)
+
 
+class NamingRule:
+    """
+    names processes whose comm fully matches comm_pattern after one of their arguments,
+    argv_index may be negative to count from the end of the command line
+    """
+    def __init__(self, comm_pattern: str, argv_index: int, max_len: int = 20):
+        self._comm_pattern = comm_pattern
+        self._argv_index = argv_index
+        self._max_len = max_len
 
-class ProcessLoader:
+    @property
+    def comm_pattern(self) -> str:
+        return self._comm_pattern
+
+    def name(self, comm: str, argv: [str]) -> str:
+        try:
+            return f'{comm}:{argv[self._argv_index][:self._max_len]}'
+        except IndexError:
+            return comm
+
+    @classmethod
+    def parse(cls, spec: str) -> 'NamingRule':
+        """
+        parses 'COMM_REGEX:ARGV_INDEX', e.g. 'java:-1', raises ValueError on a malformed one
+        """
+        comm_pattern, _, argv_index = spec.rpartition(':')
+        try:
+            re.compile(comm_pattern)
+        except re.error as e:
+            raise ValueError(f'bad COMM_REGEX in {spec!r}: {e}') from e
+        try:
+            return cls(comm_pattern, int(argv_index))
+        except ValueError as e:
+            raise ValueError(f'bad ARGV_INDEX in {spec!r}, expected an integer') from e
+
+
+DEFAULT_NAMING_RULES = [
+    NamingRule('java', -1),
+    NamingRule('python3\\.9', 1),
+]
+
+
+class ProcessNamer:
+    """
+    compiles the naming rules into a single alternation, one named group per rule.
+    rules with groups of their own would clash with each other or with those around them once joined,
+    with any of them each rule is matched on its own in turn
+    """
+    def __init__(self, rules: [NamingRule]):
+        patterns = [re.compile(rule.comm_pattern) for rule in rules]
+        self._rules = {f'rule{i}': rule for i, rule in enumerate(rules)}
+        self._matcher = None
+        self._matchers = None
+        if any(pattern.groups for pattern in patterns):
+            self._matchers = list(zip(patterns, rules))
+        elif rules:
+            self._matcher = re.compile(
+                '|'.join(f'(?P<{group}>{rule.comm_pattern})' for group, rule in self._rules.items())
+            )
+
+    def name(self, comm: str, argv: [str]) -> str:
+        if self._matcher:
+            match = self._matcher.fullmatch(comm)
+            if match:
+                return self._rules[match.lastgroup].name(comm, argv)
+        elif self._matchers:
+            for pattern, rule in self._matchers:
+                if pattern.fullmatch(comm):
+                    return rule.name(comm, argv)
+        return comm
 
+
+class ProcessLoader:
+    """
+    persistent pid to process name table, each refresh only inspects pids not seen before.
+    a pid is identified together with its start time so that pid reuse is detected
+    """
     UNKNOWN = '<UNKNOWN>'
+    PROC_PATH = '/proc'
 
-    def __init__(self):
-        self._processes = []
-        self._pid_to_procname = {}
+    def __init__(self, naming_rules: [NamingRule] = None, proc_path: str = PROC_PATH):
+        self._proc_path = proc_path
+        self._namer = ProcessNamer(DEFAULT_NAMING_RULES if naming_rules is None else naming_rules)
+        self._pid_to_process = {}
+        self._verified = set()
 
     def load(self):
-        self._processes = []
-        self._pid_to_procname = {}
-        self._find()
-        self._map_pid_to_proc_name()
+        pids = self._list_pids()
+        for pid in self._pid_to_process.keys() - pids:
+            del self._pid_to_process[pid]
+        self._verified = set()
+        for pid in pids - self._pid_to_process.keys():
+            self._inspect(pid)
         return self
 
     @property
     def pids(self) -> list:
-        return [p.pid for p in self._processes]
+        return list(self._pid_to_process)
 
     def get_name_for_pid(self, pid) -> str:
+        if not pid:
+            return self.UNKNOWN
+        if pid not in self._verified:
+            self._verify(pid)
         try:
-            return self._pid_to_procname[pid] if pid else self.UNKNOWN
+            return self._pid_to_process[pid][1]
         except KeyError:
             return '_NOT_FOUND_'
 
-    def _find(self):
-        self._processes = list(proclib_core.find_processes())
+    def _list_pids(self) -> set:
+        try:
+            return {int(entry) for entry in os.listdir(self._proc_path) if entry.isdigit()}
+        except OSError:
+            return set()
 
-    def _map_pid_to_proc_name(self):
-        for p in self._processes:
-            if p.comm == 'java':
-                self._pid_to_procname[p.pid] = f'{p.comm}:{p.command_line[-1][:20]}'
-            elif p.comm == 'python3.9':
-                self._pid_to_procname[p.pid] = f'{p.comm}:{p.command_line[1][:20]}'
-            else:
-                self._pid_to_procname[p.pid] = p.comm
+    def _verify(self, pid) -> None:
+        """
+        pids kept from earlier refreshes are checked only when asked for,
+        a different start time means the pid was reused by a new process
+        """
+        known = self._pid_to_process.get(pid)
+        stat = self._read_stat(pid)
+        if stat is None:
+            self._pid_to_process.pop(pid, None)
+        elif known is None or known[0] != stat[1]:
+            self._inspect(pid, stat)
+        self._verified.add(pid)
+
+    def _inspect(self, pid, stat=None) -> None:
+        stat = stat if stat else self._read_stat(pid)
+        if stat is None:
+            return
+        comm, start_time = stat
+        # interned, all pids of a program share one name
+        name = sys.intern(self._namer.name(comm, self._read_cmdline(pid)))
+        self._pid_to_process[pid] = (start_time, name)
+        self._verified.add(pid)
+
+    def _read_stat(self, pid) -> (str, int):
+        try:
+            with open(f'{self._proc_path}/{pid}/stat', 'rb') as f:
+                stat = f.read().decode('utf-8', 'replace')
+        except OSError:
+            return None
+        # comm is enclosed in parentheses and may itself contain spaces and parentheses
+        head, _, tail = stat.rpartition(')')
+        fields = tail.split()
+        if len(fields) < 20:
+            return None
+        # starttime is field 22 of stat, fields[0] is field 3
+        return head.partition('(')[2], int(fields[19])
+
+    def _read_cmdline(self, pid) -> [str]:
+        try:
+            with open(f'{self._proc_path}/{pid}/cmdline', 'rb') as f:
+                cmdline = f.read()
+        except OSError:
+            return []
+        return cmdline.rstrip(b'\0').decode('utf-8', 'replace').split('\0') if cmdline else []
 
 
 class InodeLoader:
-    @staticmethod
-    def get_inodes_by_pid(self, process_pids):
+    """
+    maintained socket inode -> (pid, fd) index.
+    a load only rereads /proc/<pid>/fd of new pids and of pids whose number of fds changed,
+    inodes the collectors could not attribute trigger a full rescan, at most every MISS_RESCAN_INTERVAL
+    """
+    PROC_PATH = '/proc'
+    MISS_RESCAN_INTERVAL = 5
+    NOT_FOUND = (None, -1)
+
+    def __init__(self, proc_path: str = PROC_PATH):
+        self._proc_path = proc_path
+        self._index = {}
+        self._fd_counts = {}
+        self._inodes_by_pid = {}
+        self._misses = 0
+        self._last_full_scan = 0
+
+    def load(self) -> 'InodeLoader':
+        full_scan = self._misses and time.monotonic() - self._last_full_scan >= self.MISS_RESCAN_INTERVAL
+        if full_scan:
+            self._last_full_scan = time.monotonic()
+        self._misses = 0
+        pids = self._list_pids()
+        for pid in self._fd_counts.keys() - pids:
+            self._forget(pid)
+        for pid in pids:
+            fd_count = self._count_fds(pid)
+            if fd_count is None:
+                self._forget(pid)
+            elif full_scan or fd_count != self._fd_counts.get(pid):
+                self._scan(pid, fd_count)
+        return self
+
+    def get(self, inode: int) -> (int, int):
+        try:
+            return self._index[inode]
+        except KeyError:
+            if inode:
+                self._misses += 1
+            return self.NOT_FOUND
+
+    def get_inodes_by_pid(self, process_pids) -> {int: int}:
         inodes_by_pid = {}
         for pid in process_pids:
-            inodes = self._get_all_inodes(pid)
-            for item in inodes.items():
-                inode = item[0]
+            for inode in self._inodes_by_pid.get(pid, ()):
                 inodes_by_pid[inode] = pid
         return inodes_by_pid
 
-    @staticmethod
-    def _get_all_inodes(pid):
+    def __len__(self):
+        return len(self._index)
+
+    def _list_pids(self) -> set:
+        return {int(entry) for entry in os.listdir(self._proc_path) if entry.isdigit()}
+
+    def _count_fds(self, pid):
+        folder = f'{self._proc_path}/{pid}/fd'
+        try:
+            # since linux 6.2 the size of the fd directory is the number of open fds
+            fd_count = os.stat(folder).st_size
+            return fd_count if fd_count else len(os.listdir(folder))
+        except OSError as err:
+            if err.errno in (errno.ENOENT, errno.ESRCH, errno.EACCES, errno.EPERM):
+                # the process is gone or not ours to inspect
+                return None
+            raise
+
+    def _scan(self, pid, fd_count) -> None:
+        self._forget(pid)
+        inodes = self._get_all_inodes(pid)
+        for inode, fd in inodes.items():
+            self._index.setdefault(inode, (pid, fd))
+        self._inodes_by_pid[pid] = inodes
+        self._fd_counts[pid] = fd_count
+
+    def _forget(self, pid) -> None:
+        for inode in self._inodes_by_pid.pop(pid, ()):
+            if self._index.get(inode, self.NOT_FOUND)[0] == pid:
+                del self._index[inode]
+        self._fd_counts.pop(pid, None)
+
+    def _get_all_inodes(self, pid) -> {int: int}:
         inodes = dict()
-        folder = f'/proc/{pid}/fd'
-        for fd in os.listdir(folder):
+        folder = f'{self._proc_path}/{pid}/fd'
+        try:
+            fds = os.listdir(folder)
+        except OSError as err:
+            if err.errno in (errno.ENOENT, errno.ESRCH, errno.EACCES, errno.EPERM):
+                return inodes
+            raise
+        for fd in fds:
             try:
                 inode = os.readlink(f'{folder}/{fd}')
                 if inode.startswith('socket:['):
                     # the process is using a socket
-                    inode = inode[8:][:-1]
-                    pid_list = inodes.setdefault(inode, [])
-                    pid_list.append((pid, int(fd)))
+                    inodes.setdefault(int(inode[8:-1]), int(fd))
             except OSError as err:
                 if err.errno in (errno.ENOENT, errno.ESRCH):
                     # ENOENT: file which is gone in the meantime;
@@ -295,32 +721,53 @@ class InodeLoader:
                 elif err.errno == errno.EINVAL:
                     # not a link
                     continue
+                elif err.errno in (errno.EACCES, errno.EPERM):
+                    # not ours to inspect
+                    continue
                 else:
                     raise
         return inodes
 
 
 class IfaceResolver:
-    def __init__(self):
-        self._device_regex = re.compile(' dev (\\w+) ')
+    """
+    resolves the egress interface of a remote ip from an in-memory copy of the routing tables,
+    only when non default policy rules are installed it falls back to asking 'ip route get',
+    memoized until the routes or the rules change
+    """
+    def __init__(self, proc_path: str = RouteTable.PROC_PATH):
+        self._device_regex = re.compile(' dev (\\S+) ')
+        self._route_table = RouteTable(proc_path)
+        self._policy_rules = PolicyRules()
+        self._routed_by_policy = {}
+
+    def refresh(self) -> None:
+        routes_changed = self._route_table.refresh()
+        if self._policy_rules.refresh() or routes_changed:
+            self._routed_by_policy = {}
 
     def get_iface(self, ip):
-        out = self._run(f'/usr/sbin/ip route get {ip} | head -n1')
+        if self._policy_rules.default_only:
+            return self._route_table.get_iface(ip)
+        try:
+            return self._routed_by_policy[ip]
+        except KeyError:
+            iface_name = self._route_get(ip)
+            self._routed_by_policy[ip] = iface_name
+            return iface_name
+
+    def _route_get(self, ip):
+        try:
+            out = self._run(f'/usr/sbin/ip route get {ip} | head -n1')
+        except subprocess.CalledProcessError:
+            return None
         iface_name = self._device_regex.search(out)
         if iface_name:
             return iface_name[1]
 
-    def get_stats(self, ip):
-        dev = self.get_iface(ip)
-        return self._run(f'/usr/sbin/ip -s address show dev {dev}')
-
     @staticmethod
     def _run(cmd: str):
+        TIMINGS.count('subprocesses')
         out = subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT)
         return out.decode('utf-8')
 
-
-class DeviceStats:
-    def __init__(self):
-        self._script = "ip -s address"
-        self._inactive_device = 'NO CARRIER'
@@ -0,0 +1,99 @@
+import os
+import time
+from collections import namedtuple
+
+# the receive and transmit fields of /proc/net/dev kept per interface, as totals or per second
+DeviceCounters = namedtuple('DeviceCounters', [
+    'rx_bytes', 'rx_packets', 'rx_errors', 'rx_dropped', 'tx_bytes', 'tx_packets', 'tx_errors', 'tx_dropped'
+])
+# their columns after the 'iface:' of each line
+COUNTER_FIELDS = (0, 1, 2, 3, 8, 9, 10, 11)
+COUNTER_32_BITS = 1 << 32
+# a 32 bits counter going back from above this wrapped around, by less than this
+COUNTER_WRAP_MARGIN = 1 << 31
+
+
+class DeviceStats:
+    """
+    per interface rates from the counters of /proc/net/dev, read in one go per refresh through a kept open fd.
+    an interface is rated from its second sample on and forgotten once it is gone.
+    counters going back either wrapped around 32 bits, as kept by some drivers, when they were close to it and
+    advanced by a plausible amount, or were reset with the device, recreated under the same name
+    """
+    PROC_PATH = '/proc'
+    DEV_PATH = 'net/dev'
+    READ_SIZE = 1 << 16
+
+    def __init__(self, proc_path: str = PROC_PATH):
+        self._path = f'{proc_path}/{self.DEV_PATH}'
+        self._fd = None
+        self._counters = {}
+        self._time = None
+        self._rates = {}
+
+    @property
+    def counters(self) -> {str: DeviceCounters}:
+        return self._counters
+
+    @property
+    def rates(self) -> {str: DeviceCounters}:
+        """
+        the per second rates of the interfaces, None for those that appeared since the previous load
+        """
+        return self._rates
+
+    def load(self) -> 'DeviceStats':
+        now = time.monotonic()
+        counters = self._parse(self._read())
+        rates = {}
+        seconds = now - self._time if self._time is not None else 0
+        for iface, latest in counters.items():
+            earlier = self._counters.get(iface)
+            if earlier is None or seconds <= 0:
+                rates[iface] = None
+            else:
+                rates[iface] = DeviceCounters(*(self._delta(a, b) / seconds for a, b in zip(earlier, latest)))
+        self._counters = counters
+        self._time = now
+        self._rates = rates
+        return self
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @staticmethod
+    def _delta(earlier: int, latest: int) -> int:
+        if latest >= earlier:
+            return latest - earlier
+        if COUNTER_WRAP_MARGIN <= earlier < COUNTER_32_BITS and latest + COUNTER_32_BITS - earlier < COUNTER_WRAP_MARGIN:
+            return latest + COUNTER_32_BITS - earlier
+        return latest
+
+    @staticmethod
+    def _parse(raw: bytes) -> {str: DeviceCounters}:
+        counters = {}
+        # two header lines, then 'iface: rx fields tx fields'
+        for line in raw.splitlines()[2:]:
+            iface, _, fields = line.partition(b':')
+            fields = fields.split()
+            if len(fields) < 16:
+                continue
+            counters[iface.strip().decode()] = DeviceCounters(*(int(fields[i]) for i in COUNTER_FIELDS))
+        return counters
+
+    def _read(self) -> bytes:
+        if self._fd is None:
+            try:
+                self._fd = os.open(self._path, os.O_RDONLY)
+            except OSError:
+                return b''
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(self._fd, self.READ_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
@@ -0,0 +1,159 @@
+
+import os
+import socket
+import struct
+from collections import namedtuple
+
+import psutil
+
+# same shape as the records returned by psutil.net_connections
+Address = namedtuple('Address', ['ip', 'port'])
+Connection = namedtuple('Connection', ['fd', 'family', 'type', 'laddr', 'raddr', 'status', 'pid'])
+
+TCP_STATES = {
+    b'01': 'ESTABLISHED',
+    b'02': 'SYN_SENT',
+    b'03': 'SYN_RECV',
+    b'04': 'FIN_WAIT1',
+    b'05': 'FIN_WAIT2',
+    b'06': 'TIME_WAIT',
+    b'07': 'CLOSE',
+    b'08': 'CLOSE_WAIT',
+    b'09': 'LAST_ACK',
+    b'0A': 'LISTEN',
+    b'0B': 'CLOSING',
+}
+UDP_STATE = 'NONE'
+
+PROTOCOLS = ('tcp', 'udp')
+
+
+class PsutilCollector:
+    """
+    collects connections with psutil.net_connections, filtering out the excluded states afterwards
+    """
+    NAME = 'psutil'
+
+    def __init__(self, excluded_states: [str]):
+        self._excluded_states = set(excluded_states)
+
+    def collect(self) -> {str: list}:
+        return {
+            protocol: [
+                conn for conn in psutil.net_connections(protocol)
+                if conn.status.upper() not in self._excluded_states
+            ]
+            for protocol in PROTOCOLS
+        }
+
+
+class ProcNetCollector:
+    """
+    collects connections by reading /proc/net/{tcp,tcp6,udp,udp6} in bulk through file descriptors
+    kept open across loads. rows in an excluded state are dropped before their addresses are decoded
+    and sockets are attributed to pids through the socket inode index
+    """
+    NAME = 'procfs'
+    FILES = {
+        'tcp': (('tcp', socket.AF_INET), ('tcp6', socket.AF_INET6)),
+        'udp': (('udp', socket.AF_INET), ('udp6', socket.AF_INET6)),
+    }
+    READ_SIZE = 1 << 20
+
+    def __init__(self, excluded_states: [str], inode_index, proc_path: str = '/proc'):
+        self._proc_path = proc_path
+        self._excluded_codes = {code for code, state in TCP_STATES.items() if state in excluded_states}
+        self._inode_index = inode_index
+        self._fds = {}
+        self._addresses = {}
+        self._ips = {}
+
+    def collect(self) -> {str: [Connection]}:
+        self._inode_index.load()
+        # decoded addresses are only shared within a load so the memos cannot grow without bound
+        self._addresses = {}
+        self._ips = {}
+        collected = {}
+        for protocol in PROTOCOLS:
+            conns = []
+            for file_name, family in self.FILES[protocol]:
+                raw = self._read(file_name)
+                if raw:
+                    conns.extend(self._parse(raw, family, protocol == 'tcp'))
+            collected[protocol] = conns
+        return collected
+
+    def close(self) -> None:
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds = {}
+
+    def _parse(self, raw: bytes, family: int, is_tcp: bool) -> [Connection]:
+        excluded = self._excluded_codes if is_tcp else ()
+        sock_type = socket.SOCK_STREAM if is_tcp else socket.SOCK_DGRAM
+        decode = self._decode_address
+        owner = self._inode_index.get
+        conns = []
+        for line in raw.splitlines()[1:]:
+            fields = line.split(None, 10)
+            if len(fields) < 10:
+                continue
+            state = fields[3]
+            if state in excluded:
+                continue
+            pid, fd = owner(int(fields[9]))
+            conns.append(Connection(
+                fd,
+                family,
+                sock_type,
+                decode(fields[1], family),
+                decode(fields[2], family),
+                TCP_STATES.get(state, state.decode()) if is_tcp else UDP_STATE,
+                pid
+            ))
+        return conns
+
+    def _decode_address(self, hex_address: bytes, family: int):
+        address = self._addresses.get(hex_address)
+        if address is not None:
+            return address
+        # the port is always the last 4 hex digits
+        port = int(hex_address[-4:], 16)
+        if not port:
+            # a listening or unconnected socket has no end-point on this side
+            address = ()
+        else:
+            hex_ip = hex_address[:-5]
+            ip = self._ips.get(hex_ip)
+            if ip is None:
+                ip = self._decode_ip(hex_ip, family)
+                self._ips[hex_ip] = ip
+            address = Address(ip, port)
+        self._addresses[hex_address] = address
+        return address
+
+    @staticmethod
+    def _decode_ip(hex_ip: bytes, family: int) -> str:
+        # addresses are printed as 32 bit words in host byte order
+        if family == socket.AF_INET:
+            return socket.inet_ntoa(struct.pack('=I', int(hex_ip, 16)))
+        words = struct.unpack('=4I', bytes.fromhex(hex_ip.decode()))
+        return socket.inet_ntop(family, struct.pack('!4I', *words))
+
+    def _read(self, file_name: str) -> bytes:
+        fd = self._fds.get(file_name)
+        if fd is None:
+            try:
+                fd = os.open(f'{self._proc_path}/net/{file_name}', os.O_RDONLY)
+            except OSError:
+                return b''
+            self._fds[file_name] = fd
+        os.lseek(fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(fd, self.READ_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
+
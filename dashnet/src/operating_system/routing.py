@@ -0,0 +1,230 @@
+
+import ipaddress
+import struct
+import subprocess
+import time
+
+from common.timing import TIMINGS
+
+IPV4_BITS = 32
+IPV6_BITS = 128
+
+# route flags from include/uapi/linux/route.h and ipv6_route.h
+RTF_UP = 0x0001
+RTF_REJECT = 0x0200
+RTF_LOCAL = 0x80000000
+
+LOOPBACK_IFACE = 'lo'
+
+DEFAULT_RULE_TABLES = ('local', 'main', 'default')
+
+
+class PrefixTable:
+    """
+    longest-prefix-match table holding one hash per prefix length,
+    lookups probe the populated prefix lengths from longest to shortest
+    """
+    def __init__(self, address_bits: int):
+        self._bits = address_bits
+        self._by_len = {}
+        self._lens = []
+
+    def add(self, network: int, prefix_len: int, metric: int, iface) -> None:
+        if prefix_len not in self._by_len:
+            self._by_len[prefix_len] = {}
+            self._lens = sorted(self._by_len, reverse=True)
+        routes = self._by_len[prefix_len]
+        key = network >> (self._bits - prefix_len)
+        current = routes.get(key)
+        if current is None or metric < current[0]:
+            routes[key] = (metric, iface)
+
+    def lookup(self, address: int):
+        for prefix_len in self._lens:
+            route = self._by_len[prefix_len].get(address >> (self._bits - prefix_len))
+            if route is not None:
+                return route[1]
+        return None
+
+    def __len__(self):
+        return sum(len(routes) for routes in self._by_len.values())
+
+
+class RouteTable:
+    """
+    in-memory copy of the kernel routing tables read from /proc/net,
+    reloaded only when the content of the route files changes
+    """
+    PROC_PATH = '/proc'
+    ROUTE_PATH = 'net/route'
+    IPV6_ROUTE_PATH = 'net/ipv6_route'
+    FIB_TRIE_PATH = 'net/fib_trie'
+    # reference and use counters change with traffic, not with the routes
+    IPV4_VOLATILE_FIELDS = (4, 5)
+    IPV6_VOLATILE_FIELDS = (6, 7)
+
+    def __init__(self, proc_path: str = PROC_PATH):
+        self._proc_path = proc_path
+        self._ipv4 = PrefixTable(IPV4_BITS)
+        self._ipv6 = PrefixTable(IPV6_BITS)
+        self._fingerprint = None
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def refresh(self) -> bool:
+        """
+        reload the tables if the kernel routes changed since the last call
+        """
+        v4_rows = self._rows(self._read(f'{self._proc_path}/{self.ROUTE_PATH}'))[1:]
+        v6_rows = self._rows(self._read(f'{self._proc_path}/{self.IPV6_ROUTE_PATH}'))
+        fingerprint = (
+            self._stable_fields(v4_rows, self.IPV4_VOLATILE_FIELDS),
+            self._stable_fields(v6_rows, self.IPV6_VOLATILE_FIELDS),
+        )
+        if fingerprint == self._fingerprint:
+            return False
+        self._fingerprint = fingerprint
+        self._ipv4 = PrefixTable(IPV4_BITS)
+        self._ipv6 = PrefixTable(IPV6_BITS)
+        self._load_ipv4(v4_rows)
+        self._load_ipv4_local(self._read(f'{self._proc_path}/{self.FIB_TRIE_PATH}'))
+        self._load_ipv6(v6_rows)
+        self._generation += 1
+        return True
+
+    def get_iface(self, ip: str):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 4:
+            return self._ipv4.lookup(int(address))
+        return self._ipv6.lookup(int(address))
+
+    def _load_ipv4(self, rows: [[str]]) -> None:
+        for fields in rows:
+            if len(fields) < 8:
+                continue
+            flags = int(fields[3], 16)
+            if not flags & RTF_UP:
+                continue
+            iface = None if flags & RTF_REJECT else fields[0]
+            network = self._ipv4_from_hex(fields[1])
+            prefix_len = bin(self._ipv4_from_hex(fields[7])).count('1')
+            self._ipv4.add(network, prefix_len, int(fields[6]), iface)
+
+    def _load_ipv4_local(self, raw: str) -> None:
+        """
+        addresses of the local table route to the loopback device,
+        /proc/net/route only shows the main table so take them from the fib trie
+        """
+        in_local_table = False
+        leaf = None
+        for line in raw.splitlines():
+            if not line.startswith(' '):
+                in_local_table = line.startswith('Local:')
+                continue
+            if not in_local_table:
+                continue
+            stripped = line.strip()
+            if stripped.startswith('|-- '):
+                leaf = stripped[4:]
+            elif leaf and stripped.endswith(' host LOCAL'):
+                prefix_len = int(stripped.split()[0][1:])
+                self._ipv4.add(int(ipaddress.IPv4Address(leaf)), prefix_len, -1, LOOPBACK_IFACE)
+
+    def _load_ipv6(self, rows: [[str]]) -> None:
+        for fields in rows:
+            if len(fields) < 10:
+                continue
+            flags = int(fields[8], 16)
+            if not flags & RTF_UP:
+                continue
+            if flags & RTF_REJECT:
+                iface = None
+            elif flags & RTF_LOCAL:
+                iface = LOOPBACK_IFACE
+            else:
+                iface = fields[9]
+            self._ipv6.add(int(fields[0], 16), int(fields[1], 16), int(fields[5], 16), iface)
+
+    @staticmethod
+    def _rows(raw: str) -> [[str]]:
+        return [line.split() for line in raw.splitlines()]
+
+    @staticmethod
+    def _stable_fields(rows: [[str]], volatile_fields: (int,)) -> tuple:
+        return tuple(
+            tuple(field for i, field in enumerate(fields) if i not in volatile_fields) for fields in rows
+        )
+
+    @staticmethod
+    def _ipv4_from_hex(hex_address: str) -> int:
+        # /proc/net/route prints addresses in host byte order
+        return struct.unpack('!I', struct.pack('=I', int(hex_address, 16)))[0]
+
+    @staticmethod
+    def _read(path: str) -> str:
+        try:
+            with open(path) as f:
+                return f.read()
+        except OSError:
+            return ''
+
+
+class PolicyRules:
+    """
+    tells whether routing decisions depend on anything but the destination,
+    i.e. whether rules other than the kernel defaults are installed.
+    procfs does not show the rules, they are listed again every RELOAD_SECONDS to notice 'ip rule' changes
+    """
+    RELOAD_SECONDS = 10
+
+    def __init__(self):
+        self._default_only = True
+        self._rules = None
+        self._loaded_at = None
+
+    @property
+    def default_only(self) -> bool:
+        return self._default_only
+
+    def refresh(self) -> bool:
+        """
+        list the rules again once RELOAD_SECONDS have passed, tells whether they changed since the last call
+        """
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.RELOAD_SECONDS:
+            return False
+        self._loaded_at = now
+        rules = [self._run(['/usr/sbin/ip', '-o', family, 'rule', 'show']) for family in ('-4', '-6')]
+        if rules == self._rules:
+            return False
+        self._rules = rules
+        self._default_only = all(
+            self._is_default(line) for family_rules in rules for line in family_rules.splitlines() if line.strip()
+        )
+        return True
+
+    @staticmethod
+    def _is_default(rule_line: str) -> bool:
+        _, _, selector = rule_line.partition(':')
+        fields = selector.split()
+        return (
+            len(fields) == 4
+            and fields[:3] == ['from', 'all', 'lookup']
+            and fields[3] in DEFAULT_RULE_TABLES
+        )
+
+    @staticmethod
+    def _run(cmd: [str]) -> str:
+        TIMINGS.count('subprocesses')
+        try:
+            out = subprocess.check_output(cmd, stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError):
+            return ''
+        return out.decode('utf-8')
+
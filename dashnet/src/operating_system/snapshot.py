@@ -0,0 +1,122 @@
+
+from operating_system.linux import LocalRemoteSockets
+from operating_system.linux import TrafficByAddress
+from operating_system.linux import TrafficByProcess
+
+
+class MapDelta:
+    """
+    difference between two versions of a dict:
+    added and removed hold key -> value, changed holds key -> (old value, new value)
+    """
+    def __init__(self, added: dict, removed: dict, changed: dict):
+        self._added = added
+        self._removed = removed
+        self._changed = changed
+
+    @classmethod
+    def between(cls, old: dict, new: dict) -> 'MapDelta':
+        added = {}
+        changed = {}
+        # items views compare as sets, leaving only new keys and keys whose value differs
+        for key, value in new.items() - old.items():
+            if key in old:
+                changed[key] = (old[key], value)
+            else:
+                added[key] = value
+        removed = {key: old[key] for key in old.keys() - new.keys()}
+        return cls(added, removed, changed)
+
+    @property
+    def added(self) -> dict:
+        return self._added
+
+    @property
+    def removed(self) -> dict:
+        return self._removed
+
+    @property
+    def changed(self) -> dict:
+        return self._changed
+
+    def __bool__(self):
+        return bool(self._added or self._removed or self._changed)
+
+    def __repr__(self):
+        return f'+{len(self._added)} -{len(self._removed)} ~{len(self._changed)}'
+
+
+class SnapshotDelta:
+    """
+    what changed between two collections, connections are keyed by (local, remote, protocol)
+    """
+    def __init__(self, connections: MapDelta, locals_: MapDelta, remotes: MapDelta):
+        self._connections = connections
+        self._locals = locals_
+        self._remotes = remotes
+
+    @property
+    def connections(self) -> MapDelta:
+        return self._connections
+
+    @property
+    def locals(self) -> MapDelta:
+        return self._locals
+
+    @property
+    def remotes(self) -> MapDelta:
+        return self._remotes
+
+    def __repr__(self):
+        return f'connections {self._connections} locals {self._locals} remotes {self._remotes}'
+
+
+class SnapshotStore:
+    """
+    keeps the previous collection, diffs every new one against it
+    and maintains the traffic counters from the resulting deltas
+    """
+    def __init__(self):
+        self._connections = {}
+        self._locals = {}
+        self._remotes = {}
+        self._by_process = TrafficByProcess()
+        self._by_local_address = TrafficByAddress()
+        self._by_remote_address = TrafficByAddress()
+
+    def update(self, open_sockets: LocalRemoteSockets) -> SnapshotDelta:
+        connections = {
+            self.connection_key(lsock, rsock): pi for (lsock, rsock), pi in open_sockets.connections.items()
+        }
+        # snapshots are not modified once loaded, filters only build views over them
+        locals_ = open_sockets.locals
+        remotes = open_sockets.remotes
+        delta = SnapshotDelta(
+            MapDelta.between(self._connections, connections),
+            MapDelta.between(self._locals, locals_),
+            MapDelta.between(self._remotes, remotes),
+        )
+        self._connections = connections
+        self._locals = locals_
+        self._remotes = remotes
+        self._by_process.apply(delta.locals)
+        self._by_local_address.apply(delta.locals, locals_)
+        self._by_remote_address.apply(delta.remotes, remotes)
+        return delta
+
+    @staticmethod
+    def connection_key(lsock, rsock) -> tuple:
+        sock = lsock if lsock else rsock
+        return lsock, rsock, sock.protocol if sock else None
+
+    @property
+    def by_process(self) -> TrafficByProcess:
+        return self._by_process
+
+    @property
+    def by_local_address(self) -> TrafficByAddress:
+        return self._by_local_address
+
+    @property
+    def by_remote_address(self) -> TrafficByAddress:
+        return self._by_remote_address
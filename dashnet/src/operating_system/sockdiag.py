@@ -0,0 +1,189 @@
+
+import os
+import socket
+import struct
+from collections import namedtuple
+
+from operating_system.procnet import Address
+from operating_system.procnet import Connection
+from operating_system.procnet import PROTOCOLS
+from operating_system.procnet import UDP_STATE
+
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+# struct nlmsghdr
+NLMSG_HEADER = struct.Struct('=IHHII')
+# struct inet_diag_req_v2, the socket id is left zeroed for a dump
+INET_DIAG_REQ = struct.Struct('=BBBxI48x')
+# struct inet_diag_msg: family, state, timer, retrans, sport, dport, src, dst, if, cookie,
+# expires, rqueue, wqueue, uid, inode
+INET_DIAG_MSG = struct.Struct('=BBBB2H16s16sIQIIIII')
+NLMSG_ERROR_CODE = struct.Struct('=i')
+# struct rtattr, the attributes following an inet_diag_msg
+RTATTR = struct.Struct('=HH')
+INET_DIAG_INFO = 2
+# bytes_acked, bytes_received, segs_out and segs_in of struct tcp_info, include/uapi/linux/tcp.h
+TCP_INFO_COUNTERS = struct.Struct('=QQII')
+TCP_INFO_COUNTERS_OFFSET = 120
+
+TcpCounters = namedtuple('TcpCounters', ['cookie', 'bytes_acked', 'bytes_received', 'segs_out', 'segs_in'])
+
+# kernel tcp states, include/net/tcp_states.h
+TCP_STATES = {
+    1: 'ESTABLISHED',
+    2: 'SYN_SENT',
+    3: 'SYN_RECV',
+    4: 'FIN_WAIT1',
+    5: 'FIN_WAIT2',
+    6: 'TIME_WAIT',
+    7: 'CLOSE',
+    8: 'CLOSE_WAIT',
+    9: 'LAST_ACK',
+    10: 'LISTEN',
+    11: 'CLOSING',
+    # request sockets, shown as SYN_RECV in /proc/net/tcp
+    12: 'SYN_RECV',
+}
+ALL_STATES = 0xffffffff
+
+IPPROTO = {'tcp': socket.IPPROTO_TCP, 'udp': socket.IPPROTO_UDP}
+
+
+class NetlinkCollector:
+    """
+    collects connections by dumping inet sockets over NETLINK_SOCK_DIAG.
+    the excluded tcp states are left out of the request's state mask so the kernel never sends them,
+    the binary replies are decoded in place from a reused receive buffer.
+    with_counters also asks for the tcp_info of the tcp sockets, whose byte and segment counters
+    are kept by (local, remote) address in counters
+    """
+    NAME = 'netlink'
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, excluded_states: [str], inode_index, with_counters: bool = False):
+        self._tcp_states_mask = 0
+        for state, name in TCP_STATES.items():
+            if name not in excluded_states:
+                self._tcp_states_mask |= 1 << state
+        self._inode_index = inode_index
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_SOCK_DIAG)
+        self._buffer = bytearray(self.BUFFER_SIZE)
+        self._seq = 0
+        self._ips = {}
+        self._with_counters = with_counters
+        self._counters = {}
+
+    @property
+    def counters(self) -> {(Address, Address): TcpCounters}:
+        """
+        the counters of the tcp sockets of the last collect() or collect_counters()
+        """
+        return self._counters
+
+    def collect(self) -> {str: [Connection]}:
+        self._inode_index.load()
+        self._ips = {}
+        self._counters = {}
+        collected = {}
+        for protocol in PROTOCOLS:
+            states = self._tcp_states_mask if protocol == 'tcp' else ALL_STATES
+            conns = []
+            for family in (socket.AF_INET, socket.AF_INET6):
+                conns.extend(self._dump(family, protocol, states))
+            collected[protocol] = conns
+        return collected
+
+    def collect_counters(self) -> {(Address, Address): TcpCounters}:
+        """
+        only dumps the counters of the tcp sockets, when the connections come from another collector
+        """
+        self._ips = {}
+        self._counters = {}
+        for family in (socket.AF_INET, socket.AF_INET6):
+            self._dump(family, 'tcp', self._tcp_states_mask, connections=False)
+        return self._counters
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def _dump(self, family: int, protocol: str, states: int, connections: bool = True) -> [Connection]:
+        self._seq += 1
+        is_tcp = protocol == 'tcp'
+        with_counters = is_tcp and (self._with_counters or not connections)
+        extensions = 1 << (INET_DIAG_INFO - 1) if with_counters else 0
+        request = INET_DIAG_REQ.pack(family, IPPROTO[protocol], extensions, states)
+        header = NLMSG_HEADER.pack(
+            NLMSG_HEADER.size + len(request), SOCK_DIAG_BY_FAMILY, NLM_F_REQUEST | NLM_F_DUMP, self._seq, 0
+        )
+        self._sock.send(header + request)
+        sock_type = socket.SOCK_STREAM if is_tcp else socket.SOCK_DGRAM
+        conns = []
+        view = memoryview(self._buffer)
+        while True:
+            size = self._sock.recv_into(self._buffer)
+            offset = 0
+            while offset + NLMSG_HEADER.size <= size:
+                msg_len, msg_type, _, seq, _ = NLMSG_HEADER.unpack_from(view, offset)
+                if msg_len < NLMSG_HEADER.size:
+                    return conns
+                payload = offset + NLMSG_HEADER.size
+                # replies to an earlier, abandoned dump are skipped
+                if seq == self._seq:
+                    if msg_type == NLMSG_DONE:
+                        return conns
+                    if msg_type == NLMSG_ERROR:
+                        error = -NLMSG_ERROR_CODE.unpack_from(view, payload)[0]
+                        raise OSError(error, os.strerror(error))
+                    if msg_type == SOCK_DIAG_BY_FAMILY:
+                        if with_counters:
+                            self._decode_counters(view, payload, offset + msg_len)
+                        if connections:
+                            conns.append(self._decode(view, payload, is_tcp, sock_type))
+                # messages are aligned to 4 bytes
+                offset += (msg_len + 3) & ~3
+
+    def _decode(self, view: memoryview, offset: int, is_tcp: bool, sock_type: int) -> Connection:
+        family, state, _, _, sport, dport, src, dst, _, _, _, _, _, _, inode = INET_DIAG_MSG.unpack_from(view, offset)
+        pid, fd = self._inode_index.get(inode)
+        return Connection(
+            fd,
+            family,
+            sock_type,
+            Address(self._ip(family, src), socket.ntohs(sport)) if sport else (),
+            Address(self._ip(family, dst), socket.ntohs(dport)) if dport else (),
+            TCP_STATES.get(state, str(state)) if is_tcp else UDP_STATE,
+            pid
+        )
+
+    def _decode_counters(self, view: memoryview, offset: int, end: int) -> None:
+        family, _, _, _, sport, dport, src, dst, _, cookie, _, _, _, _, _ = INET_DIAG_MSG.unpack_from(view, offset)
+        attribute = offset + INET_DIAG_MSG.size
+        while attribute + RTATTR.size <= end:
+            length, kind = RTATTR.unpack_from(view, attribute)
+            if length < RTATTR.size:
+                return
+            # older kernels send a shorter tcp_info, without the counters
+            if kind == INET_DIAG_INFO and length >= RTATTR.size + TCP_INFO_COUNTERS_OFFSET + TCP_INFO_COUNTERS.size:
+                key = (
+                    Address(self._ip(family, src), socket.ntohs(sport)) if sport else (),
+                    Address(self._ip(family, dst), socket.ntohs(dport)) if dport else ()
+                )
+                self._counters[key] = TcpCounters(
+                    cookie, *TCP_INFO_COUNTERS.unpack_from(view, attribute + RTATTR.size + TCP_INFO_COUNTERS_OFFSET)
+                )
+                return
+            # attributes are aligned to 4 bytes
+            attribute += (length + 3) & ~3
+
+    def _ip(self, family: int, raw: bytes) -> str:
+        ip = self._ips.get((family, raw))
+        if ip is None:
+            ip = socket.inet_ntop(family, raw[:4] if family == socket.AF_INET else raw)
+            self._ips[(family, raw)] = ip
+        return ip
@@ -0,0 +1,33 @@
+import struct
+
+# a recording is a FILE_HEADER followed by records, each a RECORD_HEADER and its sections:
+#   strings   the strings first used by the record, as a u16 length and utf-8 bytes each, coded in order
+#             after those of the earlier records since the keyframe. code 0 stands for None
+#   added     the connections added since the previous record, ROW_CODES codes each, all of them in a keyframe
+#   removed   the connections gone since the previous record, none in a keyframe
+#   rates     the tcp connections moving data, as RATE_KEY_CODES codes and len(Rate) floats each
+#   devices   the interfaces, as a code and len(DeviceCounters) doubles each, nan for an interface with no rate yet
+# a keyframe holds the whole snapshot and the whole string table, so it is decoded on its own
+MAGIC = b'DASHREC\x00'
+VERSION = 1
+FILE_HEADER = struct.Struct('=8sH')
+# length of the whole record, kind, taken_at, offset of its keyframe and the count of each section
+RECORD_HEADER = struct.Struct('=IBdqIIIII')
+STRING_LENGTH = struct.Struct('=H')
+KEYFRAME = 1
+DELTA = 2
+# local ip, port and protocol, remote ip, port and protocol, process, interface
+ROW_CODES = 8
+RATE_KEY_CODES = 6
+RATE_VALUES = 4
+DEVICE_VALUES = 8
+CODES = 'I'
+RATE_FLOATS = 'f'
+DEVICE_FLOATS = 'd'
+
+# the time index lives next to the recording: an INDEX_HEADER with the unix second its first slot starts at,
+# followed by one offset per second, that of the latest record taken before the end of that second
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'DASHIDX\x00'
+INDEX_HEADER = struct.Struct('=8sd')
+INDEX_OFFSETS = 'q'
@@ -0,0 +1,166 @@
+import math
+from array import array
+from itertools import chain
+
+from network.connection import Socket
+from operating_system.linux import LocalRemoteSockets
+from recording.fileformat import (
+    CODES, DELTA, DEVICE_FLOATS, DEVICE_VALUES, FILE_HEADER, INDEX_HEADER, INDEX_MAGIC, INDEX_OFFSETS, INDEX_SUFFIX,
+    KEYFRAME, MAGIC, RATE_FLOATS, RATE_KEY_CODES, RECORD_HEADER, ROW_CODES, STRING_LENGTH, VERSION
+)
+
+NO_SOCKET = (0, 0, 0)
+
+
+class SnapshotRecorder:
+    """
+    appends snapshots to a recording (see fileformat): a keyframe every KEYFRAME_SECONDS and the changes
+    since the previous snapshot in between, so that a seek decodes at most that many seconds of records.
+    the previous snapshot is kept by the hashes of its connection keys, two connections sharing one
+    (odds of 2^-64 a pair) would be recorded as one. the string codes outlive the keyframes, each of which holds
+    the whole table, until the table outgrows the strings in use.
+    each record is flushed as it is written, a recording cut short keeps all of its whole records
+    """
+    KEYFRAME_SECONDS = 60
+    # strings kept beyond those of a row per connection before the table is started over
+    SPARE_STRINGS = 1 << 16
+
+    def __init__(self, path: str, keyframe_seconds: float = KEYFRAME_SECONDS):
+        self._keyframe_seconds = keyframe_seconds
+        self._file = open(path, 'wb')
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._index = open(path + INDEX_SUFFIX, 'wb')
+        self._index_start = None
+        self._index_slots = 0
+        self._strings = {}
+        self._string_bytes = bytearray()
+        self._new_strings = 0
+        self._new_string_bytes = 0
+        self._rows = {}
+        self._codes = {}
+        self._keyframe_at = None
+        self._keyframe_offset = 0
+        self._offset = None
+
+    def add(self, open_sockets: LocalRemoteSockets) -> None:
+        taken_at = open_sockets.taken_at
+        offset = self._file.tell()
+        keyframe = self._keyframe_at is None or taken_at >= self._keyframe_at + self._keyframe_seconds
+        if keyframe:
+            if len(self._strings) > len(self._rows) * ROW_CODES + self.SPARE_STRINGS:
+                self._strings = {}
+                self._string_bytes = bytearray()
+                self._rows = {}
+                self._codes = {}
+            self._keyframe_at = taken_at
+            self._keyframe_offset = offset
+        added, removed = self._delta(open_sockets.connections)
+        rate_keys, rate_values = self._rates(open_sockets.rates)
+        device_codes, device_values = self._devices(open_sockets.devices)
+        if keyframe:
+            # the whole table and every row, so that the keyframe decodes on its own
+            strings = (len(self._strings), self._string_bytes)
+            added = array(CODES, chain.from_iterable(self._codes.values()))
+            removed = array(CODES)
+        else:
+            strings = (self._new_strings, self._string_bytes[len(self._string_bytes) - self._new_string_bytes:])
+        sections = (
+            strings[1], added.tobytes(), removed.tobytes(), rate_keys.tobytes(), rate_values.tobytes(),
+            device_codes.tobytes(), device_values.tobytes()
+        )
+        self._file.write(RECORD_HEADER.pack(
+            RECORD_HEADER.size + sum(len(section) for section in sections),
+            KEYFRAME if keyframe else DELTA,
+            taken_at,
+            self._keyframe_offset,
+            strings[0],
+            len(added) // ROW_CODES,
+            len(removed) // ROW_CODES,
+            len(rate_keys) // RATE_KEY_CODES,
+            len(device_codes)
+        ))
+        for section in sections:
+            self._file.write(section)
+        self._file.flush()
+        self._new_strings = 0
+        self._new_string_bytes = 0
+        self._add_to_index(taken_at, offset)
+
+    def close(self) -> None:
+        if self._offset is not None:
+            # the last second is complete once nothing more is recorded
+            self._index.write(array(INDEX_OFFSETS, [self._offset]).tobytes())
+            self._offset = None
+        self._index.close()
+        self._file.close()
+
+    def _code(self, string) -> int:
+        if string is None:
+            return 0
+        code = self._strings.get(string)
+        if code is None:
+            code = self._strings[string] = len(self._strings) + 1
+            raw = string.encode()
+            raw = STRING_LENGTH.pack(len(raw)) + raw
+            self._string_bytes += raw
+            self._new_strings += 1
+            self._new_string_bytes += len(raw)
+        return code
+
+    def _socket_codes(self, socket: Socket) -> (int, int, int):
+        if socket is None:
+            return NO_SOCKET
+        return self._code(socket.ip), self._code(socket.port), self._code(socket.protocol)
+
+    def _delta(self, connections: dict) -> (array, array):
+        """
+        the rows of the connections added and removed since the previous snapshot,
+        a connection whose process or interface changed is both
+        """
+        hashes = list(map(hash, connections))
+        previous = self._rows
+        rows = dict(zip(hashes, connections.values()))
+        codes = self._codes
+        removed = array(CODES)
+        for key_hash in [key_hash for key_hash, pi in previous.items() if rows.get(key_hash) is not pi]:
+            removed.extend(codes.pop(key_hash))
+        added = array(CODES)
+        get = previous.get
+        for key_hash, (lsock, rsock), pi in zip(hashes, connections, connections.values()):
+            if get(key_hash) is not pi:
+                row = codes[key_hash] = (
+                    *self._socket_codes(lsock), *self._socket_codes(rsock), self._code(pi.process), self._code(pi.iface)
+                )
+                added.extend(row)
+        self._rows = rows
+        return added, removed
+
+    def _rates(self, rates: dict) -> (array, array):
+        keys = array(CODES)
+        values = array(RATE_FLOATS)
+        for (lsock, rsock), rate in (rates or {}).items():
+            keys.extend((*self._socket_codes(lsock), *self._socket_codes(rsock)))
+            values.extend(rate)
+        return keys, values
+
+    def _devices(self, devices: dict) -> (array, array):
+        codes = array(CODES)
+        values = array(DEVICE_FLOATS)
+        for iface, rate in (devices or {}).items():
+            codes.append(self._code(iface))
+            values.extend(rate if rate is not None else (math.nan,) * DEVICE_VALUES)
+        return codes, values
+
+    def _add_to_index(self, taken_at: float, offset: int) -> None:
+        """
+        the seconds before that of this record are complete, each gets the latest record taken before its end
+        """
+        if self._index_start is None:
+            self._index_start = math.floor(taken_at)
+            self._index.write(INDEX_HEADER.pack(INDEX_MAGIC, self._index_start))
+        slot = max(int(taken_at - self._index_start), self._index_slots)
+        if slot > self._index_slots:
+            self._index.write(array(INDEX_OFFSETS, [self._offset]).tobytes() * (slot - self._index_slots))
+            self._index.flush()
+            self._index_slots = slot
+        self._offset = offset
@@ -0,0 +1,252 @@
+import math
+import mmap
+import os
+import time
+from array import array
+
+from network.connection import ProcessIface
+from network.connection import Socket
+from network.resolver import NameResolver
+from operating_system.linux import LocalRemoteSockets
+from operating_system.linux import Rate
+from operating_system.netdev import DeviceCounters
+from recording.fileformat import (
+    CODES, DEVICE_FLOATS, DEVICE_VALUES, FILE_HEADER, INDEX_HEADER, INDEX_MAGIC, INDEX_OFFSETS, INDEX_SUFFIX,
+    MAGIC, RATE_FLOATS, RATE_KEY_CODES, RATE_VALUES, RECORD_HEADER, ROW_CODES, STRING_LENGTH, VERSION
+)
+
+
+class Recording:
+    """
+    a recording read through a memory map. the time index maps a second to its record in constant time,
+    that record is then decoded from its keyframe on: a seek costs at most a keyframe interval of records,
+    however long the recording. reading forward from the last record decoded only applies the records in between.
+    an index missing or cut short, as left by a recorder that did not close, is completed by walking the records
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size < FILE_HEADER.size:
+                raise ValueError(f'{path} is not a version {VERSION} recording')
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f'{path} is not a version {VERSION} recording')
+        self._first, self._last = self._bounds()
+        if self._first is None:
+            self._map.close()
+            raise ValueError(f'{path} holds no snapshot')
+        self._index_start, self._index = self._load_index(path + INDEX_SUFFIX)
+        self._decoded = None
+        self._keyframe = None
+        self._strings = None
+        self._sockets = None
+        self._rows = None
+
+    @property
+    def start(self) -> float:
+        return self._header(self._first)[2]
+
+    @property
+    def end(self) -> float:
+        return self._header(self._last)[2]
+
+    def offset_at(self, at: float) -> int:
+        """
+        the record shown at the given unix time, to the second: the latest one taken before the end of that second
+        """
+        slot = int(at - self._index_start)
+        if slot < 0:
+            return self._first
+        if slot >= len(self._index):
+            return self._last
+        return self._index[slot]
+
+    def snapshot_at(self, at: float, name_resolver: NameResolver) -> LocalRemoteSockets:
+        offset = self.offset_at(at)
+        _, _, taken_at, keyframe, *_ = self._header(offset)
+        if self._decoded is None or self._keyframe != keyframe or self._decoded > offset:
+            self._decoded = keyframe
+            self._keyframe = keyframe
+            self._strings = [None]
+            self._sockets = {}
+            self._rows = {}
+            self._apply(keyframe)
+        while self._decoded < offset:
+            self._decoded += self._header(self._decoded)[0]
+            self._apply(self._decoded)
+        rates, devices = self._rates_and_devices(offset)
+        return LocalRemoteSockets.restore(dict(self._rows.values()), rates, devices, taken_at, name_resolver)
+
+    def close(self) -> None:
+        self._index = None
+        self._map.close()
+
+    def _header(self, offset: int) -> tuple:
+        return RECORD_HEADER.unpack_from(self._map, offset)
+
+    def _bounds(self) -> (int, int):
+        """
+        offsets of the first and the last whole record
+        """
+        first = last = None
+        offset = FILE_HEADER.size
+        while offset + RECORD_HEADER.size <= len(self._map):
+            length = self._header(offset)[0]
+            if offset + length > len(self._map):
+                break
+            if first is None:
+                first = offset
+            last = offset
+            offset += length
+        return first, last
+
+    def _load_index(self, path: str) -> (float, array):
+        try:
+            with open(path, 'rb') as file:
+                raw = file.read()
+        except OSError:
+            raw = b''
+        itemsize = array(INDEX_OFFSETS).itemsize
+        if len(raw) >= INDEX_HEADER.size and raw[:len(INDEX_MAGIC)] == INDEX_MAGIC:
+            _, start = INDEX_HEADER.unpack_from(raw)
+            offsets = array(INDEX_OFFSETS)
+            offsets.frombytes(raw[INDEX_HEADER.size:][:(len(raw) - INDEX_HEADER.size) // itemsize * itemsize])
+        else:
+            start = math.floor(self.start)
+            offsets = array(INDEX_OFFSETS)
+        self._complete_index(start, offsets)
+        return start, offsets
+
+    def _complete_index(self, start: float, offsets: array) -> None:
+        """
+        walks the records after those indexed, the index only covers the seconds that are over
+        """
+        previous = offsets[-1] if offsets else None
+        offset = self._first if previous is None else previous + self._header(previous)[0]
+        while offset <= self._last:
+            slot = int(self._header(offset)[2] - start)
+            if previous is not None and slot > len(offsets):
+                offsets.extend([previous] * (slot - len(offsets)))
+            previous = offset
+            offset += self._header(offset)[0]
+
+    def _apply(self, offset: int) -> None:
+        _, _, _, _, strings, added, removed, _, _ = self._header(offset)
+        position = offset + RECORD_HEADER.size
+        for _ in range(strings):
+            length, = STRING_LENGTH.unpack_from(self._map, position)
+            position += STRING_LENGTH.size
+            self._strings.append(self._map[position:position + length].decode())
+            position += length
+        rows = self._rows
+        added_codes, position = self._array(CODES, position, added * ROW_CODES)
+        removed_codes, position = self._array(CODES, position, removed * ROW_CODES)
+        # a connection whose process was coded again is removed and added with the same codes
+        for row in range(0, len(removed_codes), ROW_CODES):
+            rows.pop(tuple(removed_codes[row:row + ROW_CODES]), None)
+        for row in range(0, len(added_codes), ROW_CODES):
+            codes = tuple(added_codes[row:row + ROW_CODES])
+            rows[codes] = ((self._socket(codes[0:3]), self._socket(codes[3:6])), self._process_iface(codes[6:8]))
+
+    def _rates_and_devices(self, offset: int) -> ({tuple: Rate}, {str: DeviceCounters}):
+        _, _, _, _, strings, added, removed, rates, devices = self._header(offset)
+        position = offset + RECORD_HEADER.size
+        for _ in range(strings):
+            position += STRING_LENGTH.size + STRING_LENGTH.unpack_from(self._map, position)[0]
+        position += (added + removed) * ROW_CODES * array(CODES).itemsize
+        rate_keys, position = self._array(CODES, position, rates * RATE_KEY_CODES)
+        rate_values, position = self._array(RATE_FLOATS, position, rates * RATE_VALUES)
+        by_key = {}
+        for i in range(rates):
+            codes = rate_keys[i * RATE_KEY_CODES:(i + 1) * RATE_KEY_CODES]
+            by_key[(self._socket(codes[0:3]), self._socket(codes[3:6]))] = Rate(
+                *rate_values[i * RATE_VALUES:(i + 1) * RATE_VALUES]
+            )
+        device_codes, position = self._array(CODES, position, devices)
+        device_values, _ = self._array(DEVICE_FLOATS, position, devices * DEVICE_VALUES)
+        by_iface = {}
+        for i, code in enumerate(device_codes):
+            values = device_values[i * DEVICE_VALUES:(i + 1) * DEVICE_VALUES]
+            by_iface[self._strings[code]] = None if math.isnan(values[0]) else DeviceCounters(*values)
+        return by_key, by_iface
+
+    def _array(self, typecode: str, position: int, count: int) -> (array, int):
+        values = array(typecode)
+        end = position + count * values.itemsize
+        values.frombytes(self._map[position:end])
+        return values, end
+
+    def _socket(self, codes) -> Socket:
+        ip, port, protocol = codes
+        if not ip and not port:
+            return None
+        key = (ip, port, protocol)
+        socket = self._sockets.get(key)
+        if socket is None:
+            strings = self._strings
+            socket = self._sockets[key] = Socket(strings[ip], strings[port], strings[protocol])
+        return socket
+
+    def _process_iface(self, codes) -> ProcessIface:
+        process, iface = codes
+        return ProcessIface.of(self._strings[process], self._strings[iface])
+
+
+class ReplaySource:
+    """
+    stands in for the collector, each load returns the recorded snapshot shown speed times step seconds
+    after that of the previous load. the first load is that shown at the start time, or the first recorded.
+    past the end of the recording, its last snapshot is returned again
+    """
+    SPEED = 1.0
+    # the refresh interval of the pipeline replaying them
+    STEP = 1.0
+
+    def __init__(self, recording: Recording, name_resolver: NameResolver, speed: float = SPEED,
+                 start: float = None, step: float = STEP):
+        self._recording = recording
+        self._name_resolver = name_resolver
+        self._speed = speed
+        self._step = step
+        self._at = None
+        self._start = recording.start if start is None else min(max(start, recording.start), recording.end)
+
+    @property
+    def speed(self) -> float:
+        return self._speed
+
+    @property
+    def at(self) -> float:
+        """
+        the replayed time, None until the first load
+        """
+        return self._at
+
+    @property
+    def finished(self) -> bool:
+        return self._at is not None and self._at >= self._recording.end
+
+    def load(self) -> LocalRemoteSockets:
+        self._at = self._start if self._at is None else min(self._at + self._speed * self._step, self._recording.end)
+        return self._recording.snapshot_at(self._at, self._name_resolver)
+
+    @staticmethod
+    def parse_time(text: str, recording: Recording) -> float:
+        """
+        a unix time, a local HH:MM[:SS] on the day the recording starts, or +SECONDS after its start,
+        raises ValueError on anything else
+        """
+        try:
+            if text.startswith('+'):
+                return recording.start + float(text[1:])
+            if ':' in text:
+                fields = [int(field) for field in text.split(':')]
+                if not 2 <= len(fields) <= 3:
+                    raise ValueError(text)
+                day = time.localtime(recording.start)
+                return time.mktime((day.tm_year, day.tm_mon, day.tm_mday, *fields, *[0] * (3 - len(fields)), 0, 0, -1))
+            return float(text)
+        except (ValueError, OverflowError) as e:
+            raise ValueError(f'bad time {text}, expected a unix time, HH:MM[:SS] or +SECONDS') from e